@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import copy
 import io
 import os
 import shutil
@@ -16,6 +15,7 @@ import flowlib.nifi.rest
 import flowlib.nifi.docs
 from flowlib.exceptions import FlowLibException
 from flowlib.model.flow import Flow
+from flowlib.model.frozen import freeze
 from flowlib.model.deployment import FlowDeployment
 from flowlib.logger import log
 from flowlib.convert2flowlib.structure import NIFIFILECONTENTS, STRUCTURE
@@ -59,7 +59,8 @@ def new_flow_from_deployment(deployment_json, validate=True):
     :raises: FlowLibException
     """
     deployment = FlowDeployment.from_dict(json.load(deployment_json))
-    flow = Flow(copy.deepcopy(deployment.flow), **deployment.flow)
+    raw = freeze(deployment.flow)
+    flow = Flow(raw, **raw)
     flow.flowlib_version = flowlib.__version__
     flow.initialize(with_components=deployment.components)
     if validate:
@@ -67,16 +68,18 @@ def new_flow_from_deployment(deployment_json, validate=True):
     return (flow, deployment)
 
 
-def new_flow_from_yaml(flow_yaml, component_dir=None, validate=True):
+def new_flow_from_yaml(flow_yaml, component_dir=None, validate=True, component_cache_dir=None):
     """
     Construct a new flow from a yaml file
     :param flow_yaml: The flow defined as a yaml file
     :type flow_yaml: io.TextIOWrapper
     :param component_dir: The directory of re-useable flow components
     :type component_dir: str
+    :param component_cache_dir: A directory for caching the parsed components of component_dir
+    :type component_cache_dir: str
     :raises: FlowLibException
     """
-    raw = yaml.safe_load(flow_yaml)
+    raw = yaml.load(flow_yaml, Loader=flowlib.parser.YamlLoader)
 
     # If --component-dir is specified, use that.
     # Otherwise use the components/ directory relative to flow.yaml
@@ -85,9 +88,10 @@ def new_flow_from_yaml(flow_yaml, component_dir=None, validate=True):
     else:
         component_dir = os.path.abspath(os.path.join(os.path.dirname(flow_yaml.name), 'components'))
 
-    flow = Flow(copy.deepcopy(raw), **raw)
+    raw = freeze(raw)
+    flow = Flow(raw, **raw)
     flow.flowlib_version = flowlib.__version__
-    flow.initialize(component_dir=component_dir)
+    flow.initialize(component_dir=component_dir, component_cache_dir=component_cache_dir)
     if validate:
         flow.validate()
     return flow
@@ -100,7 +104,7 @@ def validate_flow(config):
     log.info("Validating NiFi Flow YAML {}".format(config.flow_yaml))
     try:
         with open(config.flow_yaml, 'r') as f:
-            new_flow_from_yaml(f, config.component_dir)
+            new_flow_from_yaml(f, config.component_dir, component_cache_dir=config.component_cache_dir)
     except FlowLibException as e:
         log.error(e)
         raise
@@ -112,17 +116,9 @@ def deploy_flow(config):
     """
     log.info("Deploying NiFi flow to {}".format(config.nifi_endpoint))
     try:
-        deployment = None
-        if config.flow_yaml:
-            with open(config.flow_yaml, 'r') as f:
-                flow = new_flow_from_yaml(f, config.component_dir)
-        elif config.deployment_json:
-            with open(config.deployment_json, 'r') as f:
-                flow, deployment = new_flow_from_deployment(f)
-        else:
-            raise FlowLibException("One of config.flow_yaml or config.deployment_json must be specified")
-
-        flowlib.nifi.rest.deploy_flow(flow, config, deployment=deployment, force=config.force)
+        flow, deployment = _load_flow(config)
+        flowlib.nifi.rest.deploy_flow(flow, config, deployment=deployment, force=config.force, incremental=config.incremental,
+            resume=config.resume)
         log.info("Flow deployment completed successfully")
     except FlowLibException as e:
         log.error("Flow deployment failed")
@@ -130,6 +126,37 @@ def deploy_flow(config):
         raise
 
 
+def plan_flow(config):
+    """
+    Plan the deployment of a flow without changing anything on the NiFi canvas
+    :type config: FlowLibConfig
+    :returns: (list(flowlib.plan.Operation), float) The operations the deployment would make in order, and its
+      estimated duration in seconds
+    """
+    log.info("Planning NiFi flow deployment to {}".format(config.nifi_endpoint))
+    try:
+        flow, deployment = _load_flow(config)
+        return flowlib.nifi.rest.plan_deploy(flow, config, deployment=deployment, force=config.force, incremental=config.incremental)
+    except FlowLibException as e:
+        log.error("Flow deployment planning failed")
+        log.error(e)
+        raise
+
+
+def _load_flow(config):
+    """
+    :type config: FlowLibConfig
+    :returns: (Flow, FlowDeployment) The flow to deploy, and the deployment it was loaded from if it was loaded from deployment json
+    """
+    if config.flow_yaml:
+        with open(config.flow_yaml, 'r') as f:
+            return new_flow_from_yaml(f, config.component_dir, component_cache_dir=config.component_cache_dir), None
+    elif config.deployment_json:
+        with open(config.deployment_json, 'r') as f:
+            return new_flow_from_deployment(f)
+    raise FlowLibException("One of config.flow_yaml or config.deployment_json must be specified")
+
+
 def registry_import_flow(config):
     try:
         if config.registry_import:
@@ -292,7 +319,7 @@ def export_flow(config, fp=None):
     """
     log.info("Exporting NiFi flow deployment {} from {}".format(config.export, config.nifi_endpoint))
     try:
-        deployment = flowlib.nifi.rest.get_previous_deployment(config.nifi_endpoint, config.export)
+        deployment = flowlib.nifi.rest.get_previous_deployment(config.nifi_endpoint, config.export, config)
         if fp:
             deployment.save(fp)
         else:
@@ -304,6 +331,20 @@ def export_flow(config, fp=None):
         raise
 
 
+def rollback_flow(config):
+    """
+    :type config: FlowLibConfig
+    """
+    log.info("Rolling back NiFi flow {} on {}".format(config.rollback, config.nifi_endpoint))
+    try:
+        flowlib.nifi.rest.rollback_flow(config, config.rollback)
+        log.info("Flow rollback completed successfully")
+    except FlowLibException as e:
+        log.error("Flow rollback failed")
+        log.error(e)
+        raise
+
+
 def configure_flow_controller(config):
     """
     :type config: FlowLibConfig
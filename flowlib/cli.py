@@ -83,16 +83,76 @@ class FlowLibCLI:
                                  help='The ACL to set for newly created zookeeper nodes if migrating state'
                                  )
 
+        self.parser.add_argument('--state-source',
+                                 choices=['nifi', 'zookeeper'],
+                                 help='Where to read the state of stateful processors from when exporting or re-deploying a flow'
+                                 )
+
+        self.parser.add_argument('--layout-cache-dir',
+                                 type=str,
+                                 help='A directory for caching the layout of process groups between deployments'
+                                 )
+
+        self.parser.add_argument('--journal-dir',
+                                 type=str,
+                                 help='A directory for journaling the entities created by a deployment so that a failed deployment can be resumed'
+                                 )
+
         self.parser.add_argument('--component-dir',
                                  type=str,
                                  help='A directory containing re-useable flowlib components'
                                  )
 
+        self.parser.add_argument('--component-cache-dir',
+                                 type=str,
+                                 help='A directory for caching parsed components between runs'
+                                 )
+
         self.parser.add_argument('--force',
                                  action='store_true',
                                  help='Force flowlib to overwrite an existing flow (or flow controller when used with --configure-flow-controller)'
                                  )
 
+        self.parser.add_argument('--incremental',
+                                 action='store_true',
+                                 help='Update an existing flow in place by only deploying the elements and connections that have changed'
+                                 )
+
+        self.parser.add_argument('--plan',
+                                 action='store_true',
+                                 help='Print the NiFi api calls that deploying the flow would make and an estimate of how long it would take, without changing the NiFi canvas'
+                                 )
+
+        self.parser.add_argument('--resume',
+                                 action='store_true',
+                                 help='Resume a failed deployment of the flow from its journal, only creating what the failed deployment did not'
+                                 )
+
+        self.parser.add_argument('--keep-previous',
+                                 type=int,
+                                 help='Keep this many replaced flows, stopped and renamed to "(previous-k) <flow>", instead of removing them so that a deployment can be rolled back'
+                                 )
+
+        self.parser.add_argument('--deploy-concurrency',
+                                 type=int,
+                                 help='The max number of NiFi api calls to make concurrently when creating sibling elements during a deployment'
+                                 )
+
+        self.parser.add_argument('--snapshot-deploy',
+                                 action='store_true',
+                                 help='Create the whole flow with a single upload of a compiled flow snapshot instead of creating each element with the NiFi api'
+                                 )
+
+        self.parser.add_argument('--profile',
+                                 action='store_true',
+                                 help='Print the calls and time spent per NiFi, NiFi Registry and ZooKeeper endpoint and per deployment phase when finished'
+                                 )
+
+        self.parser.add_argument('--profile-out',
+                                 type=str,
+                                 help='Write a trace of every NiFi, NiFi Registry and ZooKeeper call to a JSON file in the Trace Event Format'
+                                 )
+
         self.parser.add_argument('--validate',
                                  action=ValidateValidate,
                                  help='Attempt to initialize the Flow from a flow.yaml by loading all of its components'
@@ -132,6 +192,10 @@ class FlowLibCLI:
                                    type=str,
                                    help='Export the specified NiFi flow deployment and its components as JSON. Prints to stdout'
                                    )
+        self.mx_group.add_argument('--rollback',
+                                   type=str,
+                                   help='Swap the specified deployed NiFi flow with the flow it replaced, which was kept with --keep-previous'
+                                   )
         self.mx_group.add_argument('--registry-import',
                                    type=str,
                                    nargs=3,
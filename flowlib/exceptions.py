@@ -7,3 +7,8 @@ class FlowNotFoundException(FlowLibException):
 
 class FlowValidationException(FlowLibException):
     pass
+
+class NiFiApiException(FlowLibException):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
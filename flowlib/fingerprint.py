@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Content hashes of a flow, computed bottom-up like a merkle tree. The fingerprint of a process group covers the
+  fingerprints of its elements, so an unchanged fingerprint means that nothing in the subtree changed
+"""
+import functools
+import hashlib
+import json
+import os
+
+import jinja2
+import jinja2.nodes
+
+import flowlib.parser
+from flowlib.model.flow import Flow, ProcessGroup, Processor, RemoteProcessGroup
+
+# Included in every fingerprint, bump it when what is hashed changes so that stored fingerprints are not compared
+FINGERPRINT_VERSION = 2
+# The number of templates whose env() lookups are cached. flowlib.parser can't be read while this module is imported,
+#  flowlib.plan imports this module while flowlib.parser is being imported
+ENV_NAMES_CACHE_SIZE = 4096
+
+
+def fingerprint_flow(flow):
+    """
+    Fingerprint an initialized flow and every element in it.
+      Processor properties are templated when the flow is deployed, so instead of the rendered properties
+      a processor's fingerprint covers everything they are rendered from: the properties as they are defined,
+      the vars of the process group, the flow's global vars and the current value of every environment variable
+      they look up with env(). The ids injected by controller() are only known once the flow is deployed, so they
+      are not included. The version and flowlib_version of the flow are not included
+    :param flow: An initialized Flow
+    :type flow: Flow
+    :returns: dict(str:str) The fingerprints keyed by element path, the fingerprint of the flow itself is keyed by the flow's name
+    """
+    fingerprints = dict()
+    context = _hash(
+        flow.global_vars,
+        [[c.name, _config(c.config)] for c in flow._controllers]
+    )
+    children = _fingerprint_elements(flow, flow._elements, flow.name, context, fingerprints)
+    fingerprints[flow.name] = _hash(flow.name, flow.comments, flow.layout, context, children)
+    return fingerprints
+
+
+def fingerprint_configs(flow):
+    """
+    Fingerprint the rendered config of every processor in a flow, so that a deployed flow can be compared with the
+      config it was actually deployed with. The processor properties of the flow must have been templated
+    :param flow: An initialized Flow
+    :type flow: Flow
+    :returns: dict(str:str) The fingerprints keyed by element path
+    """
+    configs = dict()
+    groups = [(flow.name, flow._elements)]
+    while groups:
+        parent_path, elements = groups.pop()
+        for el in elements.values():
+            path = "{}{}{}".format(parent_path, Flow.PG_NAME_DELIMETER, el.name)
+            if isinstance(el, ProcessGroup):
+                groups.append((path, el._elements))
+            elif isinstance(el, Processor):
+                configs[path] = fingerprint_config(el.config)
+    return configs
+
+
+def fingerprint_config(config):
+    """
+    :param config: The config of a processor, controller service or remote process group
+    :returns: str The fingerprint of the config as it is
+    """
+    return _hash(_config(config))
+
+
+def _fingerprint_elements(flow, elements, parent_path, context, fingerprints):
+    """
+    :param context: The fingerprint of what the properties of the elements are rendered with
+    :type context: str
+    :param fingerprints: Every fingerprint is added to this
+    :type fingerprints: dict(str:str)
+    :returns: list The name and fingerprint of each element, in order
+    """
+    children = list()
+    for el in elements.values():
+        path = "{}{}{}".format(parent_path, Flow.PG_NAME_DELIMETER, el.name)
+        connections = [c.as_dict() for c in el.connections]
+        if isinstance(el, ProcessGroup):
+            component = flow.find_component_by_path(el.component_path)
+            group_context = _hash(
+                context,
+                component.defaults if component else None,
+                el.vars,
+                _env_lookups((component.defaults or dict()).values() if component else [], (el.vars or dict()).values()),
+                # the controllers are replaced with the controller services when the component is initialized
+                {k: getattr(v, 'name', v) for k, v in el.controllers.items()}
+            )
+            grandchildren = _fingerprint_elements(flow, el._elements, path, group_context, fingerprints)
+            fingerprints[path] = _hash(el.type, el.name, el.component_path, connections, group_context, grandchildren)
+        elif isinstance(el, Processor):
+            fingerprints[path] = _hash(el.type, el.name, connections, _config(el.config), context,
+                _env_lookups(el.config.properties.values()))
+        elif isinstance(el, RemoteProcessGroup):
+            fingerprints[path] = _hash(el.type, el.name, connections, _config(el.config))
+        else:
+            fingerprints[path] = _hash(el.type, el.name, connections)
+        children.append([el.name, fingerprints[path]])
+    return children
+
+
+def _config(config):
+    """
+    :param config: The config of a processor, controller service or remote process group
+    :returns: dict The attributes of the config which are set. Cheaper than config.to_dict(), which copies every nested value
+    """
+    values = {k: getattr(config, k) for k in config.swagger_types}
+    values['package_id'] = getattr(config, 'package_id', None)
+    return {k: v for k, v in values.items() if v is not None}
+
+
+def _env_lookups(*templates):
+    """
+    :param templates: Lists of the templates which are rendered when the flow is deployed
+    :returns: dict(str:str) The current value of each environment variable the templates look up with env(),
+      every environment variable is included if a template looks up a variable which is not named with a literal
+    """
+    lookups = dict()
+    for values in templates:
+        for v in values:
+            if not isinstance(v, str) or 'env' not in v:
+                continue
+            names = _env_names(v)
+            if names is None:
+                return dict(os.environ)
+            lookups.update({name: os.getenv(name) for name in names})
+    return lookups
+
+
+@functools.lru_cache(maxsize=ENV_NAMES_CACHE_SIZE)
+def _env_names(source):
+    """
+    :returns: tuple(str) The names of the environment variables the template looks up with env(),
+      or None if a name is not a literal and can only be known by rendering the template
+    """
+    try:
+        template = flowlib.parser.env.parse(source)
+    except jinja2.TemplateSyntaxError:
+        # the error is raised when the template is rendered
+        return None
+    names = list()
+    for call in template.find_all(jinja2.nodes.Call):
+        if not isinstance(call.node, jinja2.nodes.Name) or call.node.name != 'env':
+            continue
+        if not call.args or not isinstance(call.args[0], jinja2.nodes.Const):
+            return None
+        names.append(call.args[0].value)
+    return tuple(names)
+
+
+def _hash(*values):
+    content = json.dumps([FINGERPRINT_VERSION] + list(values), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
@@ -1,12 +1,159 @@
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
 import networkx as nx
 import random
 
+import flowlib.plan
+from flowlib.logger import log
 from flowlib.exceptions import FlowLibException
+from flowlib.model.flow import ProcessGroup
 from nipyapi.nifi import PositionDTO
 
 TOP_LEVEL_PG_LOCATION = (300, 100)
 DEFAULT_POSITION = PositionDTO(x=float(100), y=float(100))
 
+LAYOUT_TYPES = ["layered", "spring", "planar", "spectral"]
+DEFAULT_LAYOUT = "layered"
+
+# The distance between the rows of a layered layout and between the elements within a row,
+# large enough for a processor and the label of the connection between two rows
+LAYER_SPACING = 250
+ELEMENT_SPACING = 450
+# The number of barycenter sweeps used to reduce the connections crossing between rows
+CROSSING_SWEEPS = 4
+# Included in the layout fingerprint, bump it when a layout engine changes so that cached layouts are not reused
+LAYOUT_VERSION = 1
+
+
+class LayoutCache:
+    """
+    Reuses the layout of process groups whose elements and connections have not changed, so that re-deployed
+      groups keep their positions on the canvas and identical groups (e.g. several instances of a component)
+      are only laid out once
+    """
+    def __init__(self, previous=None, cache_dir=None):
+        """
+        :param previous: The layouts of a previous deployment, keyed by fingerprint
+        :type previous: dict(str:dict)
+        :param cache_dir: A directory for sharing layouts between deployments, layouts are only reused from
+          the previous deployment if None
+        :type cache_dir: str
+        :attr layouts: The layouts used since the cache was created keyed by fingerprint, to be saved with the deployment
+        :type layouts: dict(str:dict(str:tuple))
+        """
+        self.previous = previous or dict()
+        self.cache_dir = cache_dir
+        self.layouts = dict()
+
+    def get_layout(self, elements, layout_type=DEFAULT_LAYOUT):
+        """
+        Get the layout of a set of elements from the cache, or generate it
+        :param elements: The elements to deploy
+        :type elements: dict(str:model.FlowElement)
+        :param layout_type: The type of layout, one of LAYOUT_TYPES
+        :type layout_type: str
+        :returns: dict(str:tuple) The (x,y) position of each element keyed by name
+        """
+        return self.get_layouts([elements], layout_type)[0]
+
+    def get_layouts(self, groups, layout_type=DEFAULT_LAYOUT, processes=1):
+        """
+        Get the layouts of several sets of elements from the cache, generating the missing layouts together
+        :param groups: The elements of each process group
+        :type groups: list(dict(str:model.FlowElement))
+        :param layout_type: The type of layout, one of LAYOUT_TYPES
+        :type layout_type: str
+        :param processes: The max number of processes to generate the missing layouts with
+        :type processes: int
+        :returns: list(dict(str:tuple)) The layout of each group
+        """
+        keys = list()
+        missing = dict()
+        for elements in groups:
+            graph = _graph(elements)
+            key = _fingerprint(graph, layout_type)
+            keys.append(key)
+            if key in self.layouts or key in missing:
+                continue
+            layout = self.previous.get(key) or self._read(key)
+            if layout is None:
+                missing[key] = graph
+            else:
+                # positions are lists once they have been saved as json
+                self.layouts[key] = {name: tuple(pos) for name, pos in layout.items()}
+
+        layouts = _generate_layouts(list(missing.values()), layout_type, processes)
+        for key, layout in zip(missing, layouts):
+            self._write(key, layout)
+            self.layouts[key] = layout
+        return [self.layouts[key] for key in keys]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, "{}.json".format(key))
+
+    def _read(self, key):
+        if not self.cache_dir or not os.path.isfile(self._path(key)):
+            return None
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Failed to read cached layout {}, it will be regenerated: {}".format(self._path(key), e))
+            return None
+
+    def _write(self, key, layout):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary file first so that concurrent deployments never read a partial layout
+            tmp = "{}.{}.tmp".format(self._path(key), os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(layout, f)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            log.warning("Failed to cache layout {}: {}".format(self._path(key), e))
+
+
+def fingerprint(elements, layout_type=DEFAULT_LAYOUT):
+    """
+    A hash of everything a layout depends on: the layout type and the names and connections of the elements, in order
+    :param elements: The elements to deploy
+    :type elements: dict(str:model.FlowElement)
+    :param layout_type: The type of layout, one of LAYOUT_TYPES
+    :type layout_type: str
+    :returns: str
+    """
+    return _fingerprint(_graph(elements), layout_type)
+
+
+def _fingerprint(graph, layout_type):
+    key = json.dumps([LAYOUT_VERSION, layout_type, graph], separators=(',', ':'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _graph(elements):
+    """
+    :returns: list The name and the names of the destinations of each element, in order. Layouts are generated
+      from this rather than from the elements so that it can be sent to another process cheaply
+    """
+    return [[el.name, [c.name for c in el.connections or list()]] for el in elements.values()]
+
+
+def _generate_layouts(graphs, layout_type, processes=1):
+    """
+    Generate the layouts of several graphs, with a pool of processes if there is more than one graph
+      so that large layouts don't hold up each other or the deployment thread
+    """
+    processes = min(int(processes or 1), len(graphs))
+    if processes <= 1:
+        return [_graph_layout(graph, layout_type) for graph in graphs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_graph_layout, graphs, itertools.repeat(layout_type)))
+
 def generate_top_level_pg_positions(elements):
     n = 400
     x, y = 1, 1
@@ -23,27 +170,67 @@ def generate_top_level_pg_positions(elements):
     return positions
 
 
-def generate_layout(elements, layout_type="spring"):
+def generate_flow_layout(flow, cache=None, processes=1):
+    """
+    Generate the x,y positions of every element of a flow up front, using the flow's layout type for each process group
+    :param flow: An initialized Flow instance
+    :type flow: flowlib.model.flow.Flow
+    :param cache: A cache of previously generated layouts
+    :type cache: LayoutCache
+    :param processes: The max number of processes to generate the layouts of the process groups with
+    :type processes: int
+    :returns: dict(str:tuple) The positions keyed by element path
+    """
+    groups = list()
+    pending = [flow]
+    while pending:
+        group = pending.pop()
+        if group._elements:
+            groups.append(group)
+            pending.extend(el for el in group._elements.values() if isinstance(el, ProcessGroup))
+
+    cache = cache or LayoutCache()
+    layouts = cache.get_layouts([group._elements for group in groups], flow.layout or DEFAULT_LAYOUT, processes)
+    positions = dict()
+    for group, layout in zip(groups, layouts):
+        for el in group._elements.values():
+            positions[flowlib.plan.element_path(el)] = layout[el.name]
+    return positions
+
+
+def generate_layout(elements, layout_type=DEFAULT_LAYOUT):
     """
     Generate a set of x,y positions given a set of elements and connections
     :param elements: The elements to deploy
-    :type elements: list(model.FlowElement)
-    :param layout_type: The type of layout (e.g., spring, planar)
+    :type elements: dict(str:model.FlowElement)
+    :param layout_type: The type of layout, one of LAYOUT_TYPES
+    :type layout_type: str
+    """
+    return _graph_layout(_graph(elements), layout_type)
+
+
+def _graph_layout(graph, layout_type):
+    """
+    :param graph: The name and the names of the destinations of each element, see _graph()
+    :type graph: list
+    :param layout_type: The type of layout, one of LAYOUT_TYPES
     :type layout_type: str
     """
+    if layout_type == "layered":
+        return _layered_layout(graph)
+
     G = nx.Graph()  # Initialize an empty graph
 
     initial_positions = {}  # Maintain a set of starting positions. Used to optimize graph layout.
-    for el in elements.values():
-        G.add_node(el.name)  # Add a node to the graph
+    for name, _ in graph:
+        G.add_node(name)  # Add a node to the graph
         if len(G) == 1:  # is this the first node? If so, fix it to the top of the canvas
-            initial_positions[el.name] = TOP_LEVEL_PG_LOCATION
+            initial_positions[name] = TOP_LEVEL_PG_LOCATION
 
     # Add all connections as edges
-    for el in elements.values():
-        if el.connections:
-            for c in el.connections:
-                G.add_edge(el.name, c.name)
+    for name, dests in graph:
+        for dest in dests:
+            G.add_edge(name, dest)
 
     scale = 125 * len(G.nodes)  # Make the canvas size scale with the total number of elements
 
@@ -54,10 +241,180 @@ def generate_layout(elements, layout_type="spring"):
     elif layout_type == "spectral":
         positions = nx.spectral_layout(G, scale=scale, center=TOP_LEVEL_PG_LOCATION)
     else:
-        raise FlowLibException("Unsupported Graph Layout Type: {}".format(type))
+        raise FlowLibException("Unsupported Graph Layout Type: {}".format(layout_type))
 
     # Convert [x,y] to (x,y) since nipyapi expects a tuple
     for name, pos in positions.items():
         positions[name] = tuple(pos)
 
     return positions
+
+
+def _layered_layout(graph):
+    """
+    A Sugiyama style layout which follows the direction of the connections, so that data flows from the top
+      of the canvas to the bottom. Elements are ranked into rows, the order of each row is chosen to reduce crossing
+      connections and elements are placed below the elements which connect to them. The layout only depends on the
+      order of the elements and their connections, so the same group is always laid out the same way
+    :param graph: The name and the names of the destinations of each element, see _graph()
+    :type graph: list
+    :returns: dict(str:tuple) The (x,y) position of each element keyed by name
+    """
+    names = [name for name, _ in graph]
+    if not names:
+        return dict()
+    successors = {name: list() for name in names}
+    for name, dests in graph:
+        for dest in dests:
+            # connections to elements outside of the group and self connections do not affect the layout
+            if dest in successors and dest != name and dest not in successors[name]:
+                successors[name].append(dest)
+
+    edges = _acyclic_edges(names, successors)
+    ranks = _rank(names, edges)
+    layers, upper, lower = _layers(names, edges, ranks)
+    _order_layers(layers, upper, lower)
+    return _coordinates(layers, upper)
+
+
+def _acyclic_edges(names, successors):
+    """
+    Reverse the connections which close a cycle (e.g. a retry loop), found with a depth first search
+    :returns: list(tuple) The (source, dest) edges of a directed acyclic graph
+    """
+    visiting, visited = set(), set()
+    edges = list()
+    for root in names:
+        if root in visited:
+            continue
+        visiting.add(root)
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            name, dests = stack[-1]
+            for dest in dests:
+                if dest in visiting:
+                    edges.append((dest, name))
+                    continue
+                edges.append((name, dest))
+                if dest not in visited:
+                    visiting.add(dest)
+                    stack.append((dest, iter(successors[dest])))
+                    break
+            else:
+                visiting.remove(name)
+                visited.add(name)
+                stack.pop()
+    # a reversed edge may duplicate a connection in the other direction
+    return list(dict.fromkeys(edges))
+
+
+def _rank(names, edges):
+    """
+    Assign every element to the row below its lowest source (longest path layering), then move elements with more
+      outgoing than incoming connections down towards their destinations to shorten the connections spanning several rows
+    :returns: dict(str:int) The row of each element
+    """
+    successors = {name: list() for name in names}
+    in_degree = dict.fromkeys(names, 0)
+    for source, dest in edges:
+        successors[source].append(dest)
+        in_degree[dest] += 1
+    predecessors = dict(in_degree)
+
+    ranks = dict.fromkeys(names, 0)
+    queue = [name for name in names if in_degree[name] == 0]
+    for name in queue:
+        for dest in successors[name]:
+            ranks[dest] = max(ranks[dest], ranks[name] + 1)
+            in_degree[dest] -= 1
+            if in_degree[dest] == 0:
+                queue.append(dest)
+
+    # the queue is in topological order, so the destinations of an element have their final row when it is moved
+    for name in reversed(queue):
+        if len(successors[name]) > predecessors[name]:
+            ranks[name] = min(ranks[dest] for dest in successors[name]) - 1
+    return ranks
+
+
+def _layers(names, edges, ranks):
+    """
+    Group the elements into rows. Connections spanning several rows are split with a placeholder in each row
+      they cross, so that crossings are only counted between adjacent rows and long connections get their own lane
+    :returns: tuple The rows, and the nodes connected to each node from the row above and the row below
+    """
+    layers = [list() for _ in range(max(ranks.values()) + 1)]
+    for name in names:
+        layers[ranks[name]].append(name)
+    upper = {name: list() for name in names}
+    lower = {name: list() for name in names}
+
+    for source, dest in edges:
+        node = source
+        for rank in range(ranks[source] + 1, ranks[dest]):
+            # placeholders are tuples so that they can never clash with an element name
+            placeholder = (source, dest, rank)
+            layers[rank].append(placeholder)
+            upper[placeholder], lower[placeholder] = [node], list()
+            lower[node].append(placeholder)
+            node = placeholder
+        upper[dest].append(node)
+        lower[node].append(dest)
+    return layers, upper, lower
+
+
+def _order_layers(layers, upper, lower):
+    """
+    Reduce crossing connections by sorting each row by the average position of its neighbours in the previous row,
+      sweeping down and then up the rows
+    """
+    order = {node: i for layer in layers for i, node in enumerate(layer)}
+    for sweep in range(CROSSING_SWEEPS):
+        if sweep % 2 == 0:
+            rows, neighbours = range(1, len(layers)), upper
+        else:
+            rows, neighbours = range(len(layers) - 2, -1, -1), lower
+
+        for row in rows:
+            def barycenter(node):
+                nodes = neighbours[node]
+                center = sum(order[n] for n in nodes) / len(nodes) if nodes else order[node]
+                return (center, order[node])
+
+            layers[row].sort(key=barycenter)
+            for i, node in enumerate(layers[row]):
+                order[node] = i
+
+
+def _coordinates(layers, upper):
+    """
+    Place each row below the previous one, and each element under the average x of the elements connected to it
+      while keeping ELEMENT_SPACING between the elements of a row
+    :returns: dict(str:tuple) The (x,y) position of each element keyed by name
+    """
+    origin_x, origin_y = TOP_LEVEL_PG_LOCATION
+    x = dict()
+    for row, layer in enumerate(layers):
+        width = (len(layer) - 1) * ELEMENT_SPACING
+        wanted = list()
+        for i, node in enumerate(layer):
+            nodes = upper[node]
+            if nodes:
+                wanted.append(sum(x[n] for n in nodes) / len(nodes))
+            else:
+                wanted.append(origin_x - width / 2 + i * ELEMENT_SPACING)
+
+        placed = list(wanted)
+        for i in range(1, len(placed)):
+            placed[i] = max(placed[i], placed[i - 1] + ELEMENT_SPACING)
+        # shift the row back so that it is centered on where its elements wanted to be
+        shift = (sum(wanted) - sum(placed)) / len(placed)
+        for node, node_x in zip(layer, placed):
+            x[node] = node_x + shift
+
+    positions = dict()
+    for row, layer in enumerate(layers):
+        for node in layer:
+            if not isinstance(node, tuple):
+                positions[node] = (float(x[node]), float(origin_y + row * LAYER_SPACING))
+    return positions
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import os
+import sys
 
 from tabulate import tabulate
 
 import flowlib.api
+import flowlib.nifi.transport
+import flowlib.plan
+import flowlib.profile
 from flowlib.cli import FlowLibCLI, FlowLibConfig
 from flowlib.new.registry import list_flows, transfer_flows
 from flowlib.new.nifi import change_version, toggle_controller_services, list_templates, transfer_templates, \
@@ -19,6 +23,23 @@ def main():
             config = FlowLibConfig.new_from_file(f)
 
     cli = FlowLibCLI(file_config=config)
+    flowlib.nifi.transport.configure(cli.config)
+    if not (cli.config.profile or cli.config.profile_out):
+        _run(cli)
+        return
+
+    profiler = flowlib.profile.enable()
+    try:
+        _run(cli)
+    finally:
+        flowlib.profile.disable()
+        if cli.config.profile:
+            print(profiler.summary(), file=sys.stderr)
+        if cli.config.profile_out:
+            profiler.write_trace(cli.config.profile_out)
+
+
+def _run(cli):
     if cli.args.list_flows:
         list_flows(cli.config, cli.config.list_flows)
     elif cli.args.transfer_flows:
@@ -41,14 +62,18 @@ def main():
         flowlib.api.gen_flowlib_docs(cli.config, cli.args.generate_docs)
     elif cli.args.validate:
         flowlib.api.validate_flow(cli.config)
-    elif cli.args.flow_yaml:
-        flowlib.api.deploy_flow(cli.config)
-    elif cli.args.deployment_json:
-        flowlib.api.deploy_flow(cli.config)
+    elif cli.args.flow_yaml or cli.args.deployment_json:
+        if cli.config.plan:
+            operations, seconds = flowlib.api.plan_flow(cli.config)
+            print(flowlib.plan.format_operations(operations, seconds))
+        else:
+            flowlib.api.deploy_flow(cli.config)
     elif cli.args.export:
         s = flowlib.api.export_flow(cli.config)
         s.seek(0)
         print(s.read())
+    elif cli.args.rollback:
+        flowlib.api.rollback_flow(cli.config)
     elif cli.args.configure_flow_controller:
         flowlib.api.configure_flow_controller(cli.config)
     elif cli.args.list:
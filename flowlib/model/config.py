@@ -12,7 +12,17 @@ class FlowLibConfig:
         'zookeeper_acl': 'open',
         'docs_directory': 'docs',
         'max_timer_driven_threads': 5,
-        'max_event_driven_threads': 10
+        'max_event_driven_threads': 10,
+        'deploy_concurrency': 1,
+        'snapshot_deploy': False,
+        'keep_previous': 0,
+        'layout_processes': 1,
+        'state_source': 'nifi',
+        'http_pool_size': 10,
+        'http_retries': 3,
+        'http_backoff_factor': 0.5,
+        'http_connect_timeout': 10,
+        'http_read_timeout': 120
     }
 
     def __init__(self, **kwargs):
@@ -22,9 +32,15 @@ class FlowLibConfig:
         :type scaffold: str
         :type generate_docs: str
         :type force: bool
+        :type incremental: bool
+        :type plan: bool
+        :type resume: bool
+        :type rollback: str
         :type export: str
         :type validate: bool
         :type configure_flow_controller: bool
+        :type profile: bool
+        :type profile_out: str
         :type component_dir: str
         :type nifi_endpoint: str
         :type registry_endpoint: str
@@ -33,6 +49,19 @@ class FlowLibConfig:
         :type zookeeper_acl: str
         :type max_timer_driven_threads: int
         :type max_event_driven_threads: int
+        :type http_pool_size: int
+        :type http_retries: int
+        :type http_backoff_factor: float
+        :type http_connect_timeout: float
+        :type http_read_timeout: float
+        :type deploy_concurrency: int
+        :type snapshot_deploy: bool
+        :type keep_previous: int
+        :type state_source: str
+        :type layout_cache_dir: str
+        :type journal_dir: str
+        :type component_cache_dir: str
+        :type layout_processes: int
         :type reporting_task_controllers: list(dict)
         :type reporting_tasks: list(dict)
         """
@@ -42,9 +71,15 @@ class FlowLibConfig:
         self.scaffold = None
         self.generate_docs = None
         self.force = None
+        self.incremental = None
+        self.plan = None
+        self.resume = None
+        self.rollback = None
         self.export = None
         self.configure_flow_controller = None
         self.validate = None
+        self.profile = None
+        self.profile_out = None
 
         # file configs with flag overrides
         self.component_dir = kwargs.get('component_dir', FlowLibConfig.DEFAULTS['component_dir'])
@@ -56,11 +91,24 @@ class FlowLibConfig:
         self.container = kwargs.get('container', None)
         self.dest_registry_endpoint = kwargs.get('dest_registry_endpoint', None)
         self.dest_nifi_endpoint = kwargs.get('dest_nifi_endpoint', None)
+        self.deploy_concurrency = kwargs.get('deploy_concurrency', FlowLibConfig.DEFAULTS['deploy_concurrency'])
+        self.snapshot_deploy = kwargs.get('snapshot_deploy', FlowLibConfig.DEFAULTS['snapshot_deploy'])
+        self.keep_previous = kwargs.get('keep_previous', FlowLibConfig.DEFAULTS['keep_previous'])
+        self.state_source = kwargs.get('state_source', FlowLibConfig.DEFAULTS['state_source'])
+        self.layout_cache_dir = kwargs.get('layout_cache_dir')
+        self.journal_dir = kwargs.get('journal_dir')
+        self.component_cache_dir = kwargs.get('component_cache_dir')
 
         # file only configs
         self.docs_directory = kwargs.get('docs_directory', FlowLibConfig.DEFAULTS['docs_directory'])
         self.max_timer_driven_threads = kwargs.get('max_timer_driven_threads', FlowLibConfig.DEFAULTS['max_timer_driven_threads'])
         self.max_event_driven_threads = kwargs.get('max_event_driven_threads', FlowLibConfig.DEFAULTS['max_event_driven_threads'])
+        self.http_pool_size = kwargs.get('http_pool_size', FlowLibConfig.DEFAULTS['http_pool_size'])
+        self.http_retries = kwargs.get('http_retries', FlowLibConfig.DEFAULTS['http_retries'])
+        self.http_backoff_factor = kwargs.get('http_backoff_factor', FlowLibConfig.DEFAULTS['http_backoff_factor'])
+        self.http_connect_timeout = kwargs.get('http_connect_timeout', FlowLibConfig.DEFAULTS['http_connect_timeout'])
+        self.http_read_timeout = kwargs.get('http_read_timeout', FlowLibConfig.DEFAULTS['http_read_timeout'])
+        self.layout_processes = kwargs.get('layout_processes', FlowLibConfig.DEFAULTS['layout_processes'])
         self.reporting_task_controllers = kwargs.get('reporting_task_controllers', list())
         self.reporting_tasks = kwargs.get('reporting_tasks', list())
 
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import base64
+import gzip
 import yaml
 import json
 
@@ -6,8 +8,13 @@ from flowlib.exceptions import FlowLibException
 from flowlib.model.flow import Flow
 from flowlib.model.component import FlowComponent
 
+# A deployment saved in the comments of a flow's process group is '<magic>:<version>:<base64 gzipped json>'.
+#  Deployments saved by older versions of flowlib are plain json
+DEPLOYMENT_MAGIC = 'flowlib'
+DEPLOYMENT_ENCODING_VERSION = 1
+
 class FlowDeployment:
-    def __init__(self, flow, root_group_id=None, stateful_processors=None):
+    def __init__(self, flow, root_group_id=None, stateful_processors=None, layouts=None, fingerprints=None, config_fingerprints=None):
         """
         :param flow: The raw dictionary value of the Flow converted from yaml
         :type flow: dict
@@ -16,41 +23,55 @@ class FlowDeployment:
         :param stateful_processors: Any stateful processors that are defined at the root of the flow
           (e.g. not contained in a component)
         :type stateful_processors: dict({name: {"processor_id": proc_id}})
+        :param layouts: The positions of the elements of each process group keyed by the fingerprint of the group,
+          see flowlib.layout.LayoutCache
+        :type layouts: dict({fingerprint: {name: (x, y)}})
+        :param fingerprints: The fingerprints of the deployed flow and its elements keyed by element path, see flowlib.fingerprint
+        :type fingerprints: dict({element_path: fingerprint})
+        :param config_fingerprints: The fingerprints of the rendered config each processor was deployed with keyed by element path,
+          see flowlib.fingerprint.fingerprint_configs()
+        :type config_fingerprints: dict({element_path: fingerprint})
+        :attr _components: The deployed components keyed by name, in the same order as components
+        :type _components: dict(str:DeployedComponent)
         """
         self.flow = flow
         self.components = list()
+        self._components = dict()
         self.root_group_id = root_group_id
         self.stateful_processors = stateful_processors or dict()
+        self.layouts = layouts or dict()
+        self.fingerprints = fingerprints or dict()
+        self.config_fingerprints = config_fingerprints or dict()
 
     def add_component(self, dc):
         """
         :param dc: The component that was loaded
         :type dc: DeployedComponent
         """
-        c = list(filter(lambda x: x.component['name'] == dc.component['name'], self.components))
-        if len(c) > 0:
-            raise FlowLibException("A component named {} already exists".format(dc.component['name']))
+        name = dc.component['name']
+        if name in self._components:
+            raise FlowLibException("A component named {} already exists".format(name))
         else:
+            self._components[name] = dc
             self.components.append(dc)
 
     def get_component(self, name):
         """
         :param name: The name of the component
         :type name: str
-        :returns: The first DeployedComponent found or None
+        :returns: The DeployedComponent or None
         """
-        c = list(filter(lambda x: x.component['name'] == name, self.components))
-        if len(c) <= 0:
-            return None
-        else:
-            return c[0]
+        return self._components.get(name)
 
     def as_dict(self):
         return {
             'flow': self.flow,
             'components': [c.as_dict() for c in self.components],
             'root_group_id': self.root_group_id,
-            'stateful_processors': self.stateful_processors
+            'stateful_processors': self.stateful_processors,
+            'layouts': self.layouts,
+            'fingerprints': self.fingerprints,
+            'config_fingerprints': self.config_fingerprints
         }
 
     def save(self, buf):
@@ -60,6 +81,32 @@ class FlowDeployment:
         """
         buf.write(json.dumps(self.as_dict(), indent=2))
 
+    def encode(self):
+        """
+        A compact encoding of the deployment, for saving in the comments of the flow's process group
+        :returns: str
+        """
+        content = json.dumps(self.as_dict(), separators=(',', ':')).encode('utf-8')
+        # mtime is fixed so that the same deployment is always encoded the same way
+        compressed = gzip.compress(content, mtime=0)
+        return "{}:{}:{}".format(DEPLOYMENT_MAGIC, DEPLOYMENT_ENCODING_VERSION, base64.b64encode(compressed).decode('ascii'))
+
+    @staticmethod
+    def decode(s):
+        """
+        :param s: A deployment created with encode(), or the plain json saved by older versions of flowlib
+        :type s: str
+        :returns: FlowDeployment
+        :raises: FlowLibException
+        """
+        if not s.startswith(DEPLOYMENT_MAGIC + ':'):
+            return FlowDeployment.from_dict(json.loads(s))
+
+        _, version, content = s.split(':', 2)
+        if version != str(DEPLOYMENT_ENCODING_VERSION):
+            raise FlowLibException("Unsupported deployment encoding version {}, upgrade flowlib to read this deployment".format(version))
+        return FlowDeployment.from_dict(json.loads(gzip.decompress(base64.b64decode(content))))
+
     @staticmethod
     def from_dict(d):
         components = d.pop('components')
@@ -69,10 +116,12 @@ class FlowDeployment:
         return deployment
 
     def __repr__(self):
-        return str(vars(self))
+        return str(self.as_dict())
 
 
 class DeployedComponent:
+    __slots__ = ('component', 'stateful_processors')
+
     def __init__(self, component, stateful_processors=None):
         """
         :param component: The raw dictionary value of the Component converted from yaml
@@ -90,4 +139,4 @@ class DeployedComponent:
         }
 
     def __repr__(self):
-        return str(vars(self))
+        return str(self.as_dict())
@@ -14,9 +14,10 @@ class Flow:
 
     PG_NAME_DELIMETER = '/'
 
-    def __init__(self, raw, name=None, canvas=None, flowlib_version=None, version=None, controller_services=None, comments=None, global_vars=None, components=None):
+    def __init__(self, raw, name=None, canvas=None, flowlib_version=None, version=None, controller_services=None, comments=None, global_vars=None, components=None, layout=None):
         """
-        :param raw: The raw dictionary value of the Flow converted from yaml
+        :param raw: The raw dictionary value of the Flow converted from yaml, it is never modified
+          so it can be frozen and shared with the deployment (see flowlib.model.frozen)
         :type raw: dict
         :param name: The name of the Flow
         :type name: str
@@ -32,6 +33,8 @@ class Flow:
         :type comments: str
         :param global_vars: Global variables for jinja var injection in NiFi component properties
         :type global_vars: dict(str:Any)
+        :param layout: The layout used to position the elements of each process group (e.g. layered, spring), see flowlib.layout
+        :type layout: str
         :param _loaded_components: A map of components (component_path) loaded while initializing the flow, these are re-useable components
         :type _loaded_components: dict(str:FlowComponent)
         :attr _elements: A map of elements defining the flow logic, may be deeply nested if the FlowElement is a ProcessGroup itself.
@@ -43,6 +46,13 @@ class Flow:
         :type _is_initialized: bool
         :attr _is_valid: Whether this flow has been been validated (elements and connections)
         :type _is_valid: bool
+        :attr fingerprints: The fingerprint of the flow and of every element keyed by element path, computed by
+          flow.initialize(), see flowlib.fingerprint
+        :type fingerprints: dict(str:str)
+        :attr _paths: Every element added with add_element() keyed by element path
+        :type _paths: dict(str:FlowElement)
+        :attr _indexes: The components by source_file and controllers by name, see _index()
+        :type _indexes: dict(str:tuple)
         """
         self.raw = raw
         self.name = name
@@ -51,12 +61,17 @@ class Flow:
         self.version = version
         self.comments = comments
         self.controller_services = controller_services or list()
-        self.global_vars = global_vars or dict()
+        # global vars are templated in place
+        self.global_vars = dict(global_vars or dict())
+        self.layout = layout
         self._is_initialized = False
         self._is_valid = False
         self._controllers = None
         self._loaded_components = dict()
         self._elements = dict()
+        self.fingerprints = dict()
+        self._paths = dict()
+        self._indexes = dict()
         self._id = None
 
     @property
@@ -80,15 +95,24 @@ class Flow:
         self._id = _id
 
 
-    def initialize(self, component_dir=None, with_components=None):
+    def initialize(self, component_dir=None, with_components=None, component_cache_dir=None):
         if self._is_initialized == False:
             from flowlib.parser import init_flow
-            init_flow(self, component_dir=component_dir, with_components=with_components)
+            from flowlib.fingerprint import fingerprint_flow
+            init_flow(self, component_dir=component_dir, with_components=with_components, component_cache_dir=component_cache_dir)
+            self.fingerprints = fingerprint_flow(self)
             self._is_initialized = True
         else:
             log.warn("Flow has already been initialized. Will not re-initialize")
 
 
+    @property
+    def fingerprint(self):
+        """
+        :returns: str The fingerprint of the whole flow, or None if the flow has not been initialized
+        """
+        return self.fingerprints.get(self.name)
+
     def validate(self):
         if not self._is_initialized:
             raise FlowValidationException("Cannot validate an uninitialized flow. Call flow.initialize() first")
@@ -108,7 +132,7 @@ class Flow:
         :type name: str
         """
         if self.components:
-            filtered = list(filter(lambda x: x.source_file == path, self.components.values()))
+            filtered = self._index('components', self.components, lambda c: c.source_file).get(path, list())
             if len(filtered) > 1:
                 raise FlowLibException("Found multiple loaded components with source_file {}".format(path))
             if len(filtered) == 1:
@@ -122,13 +146,34 @@ class Flow:
         :type name: str
         """
         if self._controllers:
-            filtered = list(filter(lambda c: c.name == name, self._controllers))
+            filtered = self._index('controllers', self._controllers, lambda c: c.name).get(name, list())
             if len(filtered) > 1:
                 raise FlowLibException("Found multiple controllers named {}".format(name))
             if len(filtered) == 1:
                 return filtered[0]
         return None
 
+    def find_element_by_path(self, path):
+        """
+        A helper method for looking up an element by its path on the canvas
+        :param path: The path of the element (e.g flow-name/group-name/element-name)
+        :type path: str
+        :returns: FlowElement or None
+        """
+        return self._paths.get(path)
+
+    def add_element(self, parent, element):
+        """
+        Add an element to the flow or to one of its process groups, recording its parent and path for constant time lookups
+        :param parent: The Flow or ProcessGroup which contains the element
+        :type parent: Flow or ProcessGroup
+        :param element: The element to add
+        :type element: FlowElement
+        """
+        parent._elements[element.name] = element
+        element._parent = parent
+        self._paths["{}{}{}".format(element.parent_path, Flow.PG_NAME_DELIMETER, element.name)] = element
+
     def get_parent_element(self, element):
         """
         A helper method for looking up parent elements from a breadcrumb path
@@ -136,6 +181,13 @@ class Flow:
         :type element: FlowElement
         """
         if isinstance(element, FlowElement):
+            if element._parent is not None:
+                return element._parent
+            # elements which were not added with add_element()
+            if element.parent_path == self.name:
+                return self
+            if element.parent_path in self._paths:
+                return self._paths[element.parent_path]
             target = self
             names = element.parent_path.split(Flow.PG_NAME_DELIMETER)
             for n in names[1:]:
@@ -146,9 +198,29 @@ class Flow:
         else:
             raise FlowLibException("Flow.get_parent_element() requires an element which is a subclass of FlowElement")
 
+    def _index(self, name, collection, key):
+        """
+        Group the values of a collection by a key. Values are only ever added to the flow, so the index is
+          rebuilt only when the collection is replaced or its size changes
+        :param name: The name of the index
+        :type name: str
+        :param collection: The dict or list to index
+        :type collection: dict or list
+        :param key: A function returning the key of a value
+        :type key: function
+        :returns: dict(Any:list)
+        """
+        index = self._indexes.get(name)
+        if not index or index[0] is not collection or index[1] != len(collection):
+            grouped = dict()
+            for v in (collection.values() if isinstance(collection, dict) else collection):
+                grouped.setdefault(key(v), list()).append(v)
+            index = self._indexes[name] = (collection, len(collection), grouped)
+        return index[2]
+
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 class FlowElement(ABC):
     """
@@ -168,18 +240,30 @@ class FlowElement(ABC):
     :type name: str
     :param connections: A list of Connections defining this Elements connections to other Elements
     :type connections: list(Connection)
+    :attr _parent: The Flow or ProcessGroup which contains this element, see Flow.add_element()
+    :type _parent: Flow or ProcessGroup
     """
+    # flows may have thousands of elements, slots keep them compact. Subclasses must declare their own attributes
+    __slots__ = ('_id', '_parent_id', '_parent_path', '_src_component_name', '_type', '_parent', 'name', 'connections')
+
     def __init__(self, **kwargs):
         self._id = kwargs.get('_id')
         self._parent_id = kwargs.get('_parent_id')
         self._parent_path = kwargs.get('_parent_path')
         self._src_component_name = kwargs.get('_src_component_name')
         self._type = kwargs.get('_type')
+        self._parent = None
         self.name = kwargs.get('name')
         self.connections = [Connection(**c) for c in kwargs.get('connections')] if kwargs.get('connections') else []
 
     @staticmethod
-    def from_dict(elem_dict):
+    def from_dict(elem_dict, **kwargs):
+        """
+        :param elem_dict: The raw definition of the element, it is not modified so it can be shared by every instance of a component
+        :type elem_dict: dict
+        :param kwargs: Attributes which are not part of the definition (e.g. _parent_path)
+        :returns: FlowElement
+        """
         if not isinstance(elem_dict, dict) or not elem_dict.get('type'):
             raise FlowLibException("FlowElement.from_dict() requires a dict with a 'type' field, one of ['processor', 'process_group', 'input_port', 'output_port']")
 
@@ -189,19 +273,20 @@ class FlowElement(ABC):
         if Flow.PG_NAME_DELIMETER in name:
             raise FlowLibException("Invalid element: '{}'. Element names may not contain '{}' characters".format(name, Flow.PG_NAME_DELIMETER))
 
-        elem_dict['_type'] = elem_dict.pop('type')
-        if elem_dict['_type'] == 'process_group':
-            if elem_dict.get('vars'):
-                elem_dict['_vars'] = elem_dict.pop('vars')
-            return ProcessGroup(**elem_dict)
-        elif elem_dict['_type'] == 'remote_process_group':
-            return RemoteProcessGroup(**elem_dict)
-        elif elem_dict['_type'] == 'processor':
-            return Processor(**elem_dict)
-        elif elem_dict['_type'] == 'input_port':
-            return InputPort(**elem_dict)
-        elif elem_dict['_type'] == 'output_port':
-            return OutputPort(**elem_dict)
+        attrs = dict(elem_dict, **kwargs)
+        attrs['_type'] = attrs.pop('type')
+        if attrs['_type'] == 'process_group':
+            if attrs.get('vars'):
+                attrs['_vars'] = attrs.pop('vars')
+            return ProcessGroup(**attrs)
+        elif attrs['_type'] == 'remote_process_group':
+            return RemoteProcessGroup(**attrs)
+        elif attrs['_type'] == 'processor':
+            return Processor(**attrs)
+        elif attrs['_type'] == 'input_port':
+            return InputPort(**attrs)
+        elif attrs['_type'] == 'output_port':
+            return OutputPort(**attrs)
         else:
             raise FlowLibException("Element 'type' field must be one of ['processor', 'process_group', 'remote_process_group', 'input_port', 'output_port']")
 
@@ -235,15 +320,25 @@ class FlowElement(ABC):
             raise FlowLibException("Attempted to change readonly attribute after initialization")
         self._parent_path = path
 
+    @property
+    def src_component_name(self):
+        return self._src_component_name
+
+    @src_component_name.setter
+    def src_component_name(self, name):
+        self._src_component_name = name
+
     @property
     def type(self):
         return self._type
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 
 class RemoteProcessGroup(FlowElement):
+    __slots__ = ('config',)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.config = RemoteProcessGroupConfig(**kwargs['config'])
@@ -255,6 +350,8 @@ class RemoteProcessGroupConfig(RemoteProcessGroupDTO):
 
 
 class ProcessGroup(FlowElement):
+    __slots__ = ('component_path', 'controllers', 'vars', '_elements')
+
     def __init__(self, **kwargs):
         """
         Represents the instantiation of a flowlib Component
@@ -270,12 +367,15 @@ class ProcessGroup(FlowElement):
         """
         super().__init__(**kwargs)
         self.component_path = kwargs.get('component_path')
-        self.controllers = kwargs.get('controllers', dict())
+        # the controller names are replaced with the controllers when the component is initialized
+        self.controllers = dict(kwargs.get('controllers') or dict())
         self.vars = kwargs.get('_vars', dict())
         self._elements = dict()
 
 
 class Processor(FlowElement):
+    __slots__ = ('config',)
+
     def __init__(self, **kwargs):
         """
         Represents a processor element within a process group
@@ -285,9 +385,7 @@ class Processor(FlowElement):
         super().__init__(**kwargs)
         if not kwargs.get('config', {}).get('package_id'):
             raise FlowLibException("Invalid processor definition. config.package_id is a required field")
-        if not 'properties' in kwargs.get('config', {}):
-            kwargs['config']['properties'] = dict()
-        self.config = ProcessorConfig(kwargs['config'].pop('package_id'), **kwargs['config'])
+        self.config = ProcessorConfig(**_config(kwargs['config']))
 
 
 class ProcessorConfig(ProcessorConfigDTO):
@@ -296,20 +394,27 @@ class ProcessorConfig(ProcessorConfigDTO):
         self.package_id = package_id
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 
 class InputPort(FlowElement):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
 
 class OutputPort(FlowElement):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
 
 class Connection:
+    __slots__ = ('name', 'from_port', 'to_port', 'relationships', 'back_pressure_object_threshold', 'back_pressure_data_size_threshold',
+                 'flow_file_expiration', 'load_balance_strategy', 'prioritizers', 'load_balance_compression')
+
     def __init__(self, name, from_port=None, to_port=None, relationships=None, back_pressure_object_threshold=None, back_pressure_data_size_threshold=None, flow_file_expiration=None, load_balance_strategy=None, prioritizers=None, load_balance_compression=None):
         self.name = name
         self.from_port = from_port
@@ -322,19 +427,32 @@ class Connection:
         self.prioritizers = prioritizers
         self.load_balance_compression = load_balance_compression
 
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'from_port': self.from_port,
+            'to_port': self.to_port,
+            'relationships': self.relationships,
+            'back_pressure_object_threshold': self.back_pressure_object_threshold,
+            'back_pressure_data_size_threshold': self.back_pressure_data_size_threshold,
+            'flow_file_expiration': self.flow_file_expiration,
+            'load_balance_strategy': self.load_balance_strategy,
+            'prioritizers': self.prioritizers,
+            'load_balance_compression': self.load_balance_compression
+        }
+
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 
 class ControllerService:
+    __slots__ = ('_id', '_parent_id', 'name', 'config')
+
     def __init__(self, name, config):
         self._id = None
         self._parent_id = None
         self.name = name
-
-        if not 'properties' in config:
-            config['properties'] = dict()
-        self.config = ControllerServiceConfig(config.pop('package_id'), **config)
+        self.config = ControllerServiceConfig(**_config(config))
 
     @property
     def id(self):
@@ -357,7 +475,7 @@ class ControllerService:
         self._parent_id = _id
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 
 class ControllerServiceConfig(ControllerServiceDTO):
@@ -366,17 +484,16 @@ class ControllerServiceConfig(ControllerServiceDTO):
         self.package_id = package_id
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 
 class ReportingTask:
+    __slots__ = ('_id', 'name', 'config')
+
     def __init__(self, name, config):
         self._id = None
         self.name = name
-
-        if not 'properties' in config:
-            config['properties'] = dict()
-        self.config = ReportingTaskConfig(config.pop('package_id'), **config)
+        self.config = ReportingTaskConfig(**_config(config))
 
     @property
     def id(self):
@@ -389,7 +506,7 @@ class ReportingTask:
         self._id = _id
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
 
 
 class ReportingTaskConfig(ReportingTaskDTO):
@@ -398,4 +515,28 @@ class ReportingTaskConfig(ReportingTaskDTO):
         self.package_id = package_id
 
     def __repr__(self):
-        return str(vars(self))
+        return str(_attrs(self))
+
+
+def _config(config):
+    """
+    :param config: The raw config of a processor, controller service or reporting task, it is not modified
+    :type config: dict
+    :returns: dict The kwargs for the element's config, with its own copy of the properties since they are templated in place
+    """
+    config = dict(config)
+    config['properties'] = dict(config.get('properties') or dict())
+    return config
+
+
+def _attrs(obj):
+    """
+    :param obj: A Flow, FlowElement or any other model object, with or without __slots__
+    :returns: dict The attributes of the object, without the parent pointers and indexes which would repeat the whole flow
+    """
+    attrs = dict(vars(obj)) if hasattr(obj, '__dict__') else dict()
+    for cls in type(obj).__mro__:
+        for k in getattr(cls, '__slots__', ()):
+            if hasattr(obj, k):
+                attrs[k] = getattr(obj, k)
+    return {k: v for k, v in attrs.items() if k not in ('_parent', '_paths', '_indexes', 'fingerprints')}
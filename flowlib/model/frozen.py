@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError("'{}' object is read-only".format(type(self).__name__))
+
+
+class FrozenDict(dict):
+    """
+    A read-only dict. The raw yaml definitions of flows and components are frozen so that they can be shared by
+      every element and deployment built from them without defensive copies. It is still a dict, so it compares
+      equal to and serializes (e.g. json.dumps) the same way as the dict it was frozen from
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """
+    A read-only list, see FrozenDict
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(value):
+    """
+    Recursively convert the dicts and lists of a raw yaml or json value into FrozenDicts and FrozenLists
+    :param value: The value to freeze
+    :type value: Any
+    :returns: The frozen value, values which are already frozen are returned as they are
+    """
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(v) for v in value)
+    return value
@@ -3,7 +3,8 @@ import subprocess
 import sys
 import json
 import re
-import requests
+
+import flowlib.nifi.transport
 
 def call_move_cmd(container, source_endpoint, dest_endpoint, command):
     cmd = "/opt/nifi/nifi-toolkit-current/bin/cli.sh {cmd} --baseUrl {url} -ot json"
@@ -49,11 +50,13 @@ def call_cmd(container, endpoint, command):
 
 def call_api(endpoint, method, path, data=None):
     url = "{}/nifi-api/{}".format(endpoint, path)
+    session = flowlib.nifi.transport.session()
+    timeout = flowlib.nifi.transport.timeout()
     if method.casefold() == 'delete':
-        requests.delete(url)
+        session.delete(url, timeout=timeout)
     elif method.casefold() == 'post':
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
-        response = requests.post(url=url, headers=headers, data=json.dumps(data))
+        response = session.post(url=url, headers=headers, data=json.dumps(data), timeout=timeout)
         if response.status_code != 201:
             return response.text
         else:
@@ -0,0 +1,946 @@
+# -*- coding: utf-8 -*-
+import os
+import copy
+import json
+import uuid
+import asyncio
+import contextlib
+
+import nipyapi
+import urllib3
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+import flowlib.fingerprint
+import flowlib.layout
+import flowlib.parser
+import flowlib.plan
+import flowlib.nifi.deploy
+import flowlib.nifi.docs
+import flowlib.nifi.transport
+import flowlib.profile
+from flowlib.logger import log
+from flowlib.nifi.canvas import CanvasIndex
+from flowlib.nifi.state import ZookeeperClient
+from flowlib.exceptions import FlowLibException, FlowNotFoundException, NiFiApiException
+from flowlib.model.flow import InputPort, OutputPort, RemoteProcessGroup, ProcessGroup, Processor
+
+# The max number of requests a client has in flight at once
+DEFAULT_CONCURRENCY = 100
+
+PORT_PATHS = {
+    'input_port': 'input-ports',
+    'output_port': 'output-ports',
+    'INPUT_PORT': 'input-ports',
+    'OUTPUT_PORT': 'output-ports'
+}
+
+
+class _Response:
+    # nipyapi deserializes models from the raw response body of its own rest client
+    def __init__(self, data):
+        self.data = data
+
+
+class AsyncNiFiClient:
+
+    def __init__(self, nifi_endpoint, concurrency=DEFAULT_CONCURRENCY, ssl=None):
+        """
+        An asyncio client for the NiFi rest api. Requests and responses use the nipyapi models so that entities
+          can be used the same way as the entities returned by nipyapi, e.g. with flowlib.nifi.canvas.CanvasIndex.
+          The client must be opened before it is used, either with open() or as an async context manager.
+          Requests are retried and timed out using the settings of flowlib.nifi.transport
+        :param nifi_endpoint: The NiFi endpoint, e.g. http://localhost:8080
+        :type nifi_endpoint: str
+        :param concurrency: The max number of requests to have in flight at once
+        :type concurrency: int
+        :param ssl: The ssl setting to use for https connections, see aiohttp.TCPConnector
+        :type ssl: ssl.SSLContext or bool
+        """
+        if not aiohttp:
+            raise FlowLibException("The asyncio NiFi client requires aiohttp, install it with: pip install b23-flowlib[async]")
+
+        self.nifi_endpoint = nifi_endpoint.rstrip('/')
+        self.host = "{}/nifi-api".format(self.nifi_endpoint)
+        self.client_id = str(uuid.uuid4())
+        self.concurrency = int(concurrency)
+        self._ssl = ssl
+        self._semaphore = None
+        self._session = None
+        self._models = nipyapi.nifi.ApiClient()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session:
+            return
+        settings = flowlib.nifi.transport.settings()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ssl=self._ssl),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=settings['connect_timeout'], sock_read=settings['read_timeout']),
+            headers={'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        )
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, method, path, response_type=None, params=None, body=None):
+        """
+        Make a request to the NiFi api, retrying it with jittered exponential backoff if it fails with a retryable error
+        :param method: The http method
+        :type method: str
+        :param path: The api path relative to /nifi-api, e.g. /flow/about
+        :type path: str
+        :param response_type: The name of the nipyapi model to deserialize the response as, the response is ignored if None
+        :type response_type: str
+        :param params: The query parameters
+        :type params: dict
+        :param body: A nipyapi model or a dict to send as the json body of the request
+        :returns: The deserialized response
+        :raises: FlowLibException if the request fails
+        """
+        if not self._session:
+            raise FlowLibException("The AsyncNiFiClient has not been opened. Call open() first")
+
+        settings = flowlib.nifi.transport.settings()
+        url = self.host + path
+        headers = None
+        data = None
+        if body is not None:
+            headers = {'Content-Type': 'application/json'}
+            data = json.dumps(self._models.sanitize_for_serialization(body))
+        if params:
+            params = {k: str(v) for k, v in params.items() if v is not None}
+
+        profiler = flowlib.profile.profiler()
+        # the query parameters are not part of the endpoint of the call, e.g. the revision of a delete
+        profile_path = urllib3.util.parse_url(url).path or '/'
+        start = None
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    start = profiler.now() if profiler else None
+                    async with self._session.request(method, url, params=params, data=data, headers=headers) as response:
+                        status = response.status
+                        text = await response.text()
+                    if profiler:
+                        profiler.record('nifi', method, profile_path, status, start, profiler.now() - start, len(data or ''), len(text))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if profiler and start is not None:
+                    profiler.record('nifi', method, profile_path, type(e).__name__, start, profiler.now() - start, len(data or ''))
+                # connection errors mean the request was never sent, any other error may have happened after NiFi applied it
+                if attempt < settings['retries'] and (isinstance(e, aiohttp.ClientConnectorError) or method in flowlib.nifi.transport.IDEMPOTENT_METHODS):
+                    await asyncio.sleep(flowlib.nifi.transport.backoff(settings['backoff_factor'], attempt))
+                    attempt += 1
+                    continue
+                raise NiFiApiException("NiFi api request {} {} failed: {}".format(method, path, e))
+
+            if status < 400:
+                break
+            if attempt < settings['retries'] and flowlib.nifi.transport.is_retry(method, status):
+                log.debug("NiFi api request {} {} failed with status {}, retrying...".format(method, path, status))
+                await asyncio.sleep(flowlib.nifi.transport.backoff(settings['backoff_factor'], attempt))
+                attempt += 1
+                continue
+            raise NiFiApiException("NiFi api request {} {} failed with status {}: {}".format(method, path, status, text), status)
+
+        if response_type and text:
+            return self._models.deserialize(_Response(text), response_type)
+        return None
+
+    def _revision(self, version=0):
+        return nipyapi.nifi.RevisionDTO(version=version, client_id=self.client_id)
+
+    def _removal_params(self, entity):
+        return {'version': entity.revision.version, 'clientId': entity.revision.client_id or self.client_id}
+
+    # Flow
+
+    async def get_about(self):
+        """
+        :returns: nipyapi.nifi.models.about_entity.AboutEntity
+        """
+        return await self.request('GET', '/flow/about', 'AboutEntity')
+
+    async def wait_until_ready(self, retries=12, delay=5):
+        """
+        Wait for the NiFi api to be ready to accept requests
+        :raises: FlowLibException if the api is not ready after the provided number of retries
+        """
+        log.debug("Waiting for NiFi api to be ready at {}...".format(self.nifi_endpoint))
+        for _ in range(retries):
+            try:
+                return await self.get_about()
+            except FlowLibException:
+                await asyncio.sleep(delay)
+        raise FlowLibException("Timeout reached while waiting for NiFi Rest API to be ready")
+
+    async def get_root_pg_id(self):
+        """
+        :returns: str The NiFi uuid of the root process group
+        """
+        return (await self.get_process_group('root')).id
+
+    async def get_process_group_flow(self, pg_id):
+        """
+        :returns: nipyapi.nifi.models.process_group_flow_entity.ProcessGroupFlowEntity
+        """
+        return await self.request('GET', '/flow/process-groups/{}'.format(pg_id), 'ProcessGroupFlowEntity')
+
+    async def recurse_flow(self, pg_id='root'):
+        """
+        Get the flow of a process group and all of its descendants. Like nipyapi.canvas.recurse_flow(), the flow of
+          each child process group is attached to it as nipyapi_extended. The child flows are fetched concurrently
+        :returns: nipyapi.nifi.models.process_group_flow_entity.ProcessGroupFlowEntity
+        """
+        pg_flow = await self.get_process_group_flow(pg_id)
+        pgs = pg_flow.process_group_flow.flow.process_groups or []
+        children = await asyncio.gather(*[self.recurse_flow(pg.id) for pg in pgs])
+        for pg, child in zip(pgs, children):
+            pg.__setattr__('nipyapi_extended', child)
+        return pg_flow
+
+    async def schedule_components(self, pg_id, running, components=None):
+        """
+        Start or stop the components of a process group
+        :param running: True to start the components, False to stop them
+        :type running: bool
+        :param components: The entities to schedule, every component in the process group is scheduled if None
+        :type components: list
+        :returns: nipyapi.nifi.models.schedule_components_entity.ScheduleComponentsEntity
+        """
+        body = nipyapi.nifi.ScheduleComponentsEntity(id=pg_id, state='RUNNING' if running else 'STOPPED')
+        if components:
+            body.components = {c.id: c.revision for c in components}
+        return await self.request('PUT', '/flow/process-groups/{}'.format(pg_id), 'ScheduleComponentsEntity', body=body)
+
+    async def get_processor_types(self):
+        return (await self.request('GET', '/flow/processor-types', 'ProcessorTypesEntity')).processor_types
+
+    async def get_controller_service_types(self):
+        return (await self.request('GET', '/flow/controller-service-types', 'ControllerServiceTypesEntity')).controller_service_types
+
+    async def get_reporting_task_types(self):
+        return (await self.request('GET', '/flow/reporting-task-types', 'ReportingTaskTypesEntity')).reporting_task_types
+
+    # Process Groups
+
+    async def get_process_group(self, pg_id):
+        return await self.request('GET', '/process-groups/{}'.format(pg_id), 'ProcessGroupEntity')
+
+    async def get_process_groups(self, parent_pg_id):
+        """
+        :returns: list(ProcessGroupEntity) The child process groups of a process group
+        """
+        return (await self.request('GET', '/process-groups/{}/process-groups'.format(parent_pg_id), 'ProcessGroupsEntity')).process_groups
+
+    async def get_process_group_status(self, pg_id):
+        return await self.request('GET', '/flow/process-groups/{}/status'.format(pg_id), 'ProcessGroupStatusEntity')
+
+    async def create_process_group(self, parent_pg_id, name, position):
+        body = nipyapi.nifi.ProcessGroupEntity(
+            revision=self._revision(),
+            component=nipyapi.nifi.ProcessGroupDTO(name=name, position=_position(position))
+        )
+        return await self.request('POST', '/process-groups/{}/process-groups'.format(parent_pg_id), 'ProcessGroupEntity', body=body)
+
+    async def update_process_group(self, pg):
+        return await self.request('PUT', '/process-groups/{}'.format(pg.id), 'ProcessGroupEntity', body=pg)
+
+    async def delete_process_group(self, pg):
+        return await self.request('DELETE', '/process-groups/{}'.format(pg.id), 'ProcessGroupEntity', params=self._removal_params(pg))
+
+    # Processors
+
+    async def get_processor(self, processor_id):
+        return await self.request('GET', '/processors/{}'.format(processor_id), 'ProcessorEntity')
+
+    async def create_processor(self, parent_pg_id, package_id, name, position, config=None):
+        """
+        :param config: The configuration of the new processor
+        :type config: nipyapi.nifi.models.processor_config_dto.ProcessorConfigDTO
+        """
+        body = nipyapi.nifi.ProcessorEntity(
+            revision=self._revision(),
+            component=nipyapi.nifi.ProcessorDTO(
+                position=_position(position),
+                type=package_id,
+                name=name,
+                config=config or nipyapi.nifi.ProcessorConfigDTO()
+            )
+        )
+        return await self.request('POST', '/process-groups/{}/processors'.format(parent_pg_id), 'ProcessorEntity', body=body)
+
+    async def update_processor(self, processor):
+        return await self.request('PUT', '/processors/{}'.format(processor.id), 'ProcessorEntity', body=processor)
+
+    async def delete_processor(self, processor):
+        return await self.request('DELETE', '/processors/{}'.format(processor.id), 'ProcessorEntity', params=self._removal_params(processor))
+
+    async def get_processor_state(self, processor_id):
+        """
+        :returns: nipyapi.nifi.models.component_state_dto.ComponentStateDTO
+        """
+        return (await self.request('GET', '/processors/{}/state'.format(processor_id), 'ComponentStateEntity')).component_state
+
+    # Ports
+
+    async def get_port(self, kind, port_id):
+        """
+        :param kind: One of input_port, output_port
+        :type kind: str
+        """
+        return await self.request('GET', '/{}/{}'.format(PORT_PATHS[kind], port_id), 'PortEntity')
+
+    async def create_port(self, parent_pg_id, kind, name, position):
+        """
+        :param kind: One of input_port, output_port
+        :type kind: str
+        """
+        body = nipyapi.nifi.PortEntity(
+            revision=self._revision(),
+            component=nipyapi.nifi.PortDTO(parent_group_id=parent_pg_id, position=_position(position), name=name)
+        )
+        return await self.request('POST', '/process-groups/{}/{}'.format(parent_pg_id, PORT_PATHS[kind]), 'PortEntity', body=body)
+
+    async def delete_port(self, kind, port):
+        return await self.request('DELETE', '/{}/{}'.format(PORT_PATHS[kind], port.id), 'PortEntity', params=self._removal_params(port))
+
+    # Remote Process Groups
+
+    async def get_remote_process_group(self, rpg_id):
+        return await self.request('GET', '/remote-process-groups/{}'.format(rpg_id), 'RemoteProcessGroupEntity')
+
+    async def create_remote_process_group(self, parent_pg_id, config):
+        """
+        :param config: The configuration of the new remote process group
+        :type config: nipyapi.nifi.models.remote_process_group_dto.RemoteProcessGroupDTO
+        """
+        body = nipyapi.nifi.RemoteProcessGroupEntity(revision=self._revision(), component=config)
+        return await self.request('POST', '/process-groups/{}/remote-process-groups'.format(parent_pg_id), 'RemoteProcessGroupEntity', body=body)
+
+    async def delete_remote_process_group(self, rpg):
+        return await self.request('DELETE', '/remote-process-groups/{}'.format(rpg.id), 'RemoteProcessGroupEntity', params=self._removal_params(rpg))
+
+    # Connections
+
+    async def create_connection(self, pg_id, connection):
+        """
+        :param connection: The connection to create, see flowlib.nifi.deploy.connection_entity()
+        :type connection: nipyapi.nifi.models.connection_entity.ConnectionEntity
+        """
+        connection.revision = self._revision()
+        return await self.request('POST', '/process-groups/{}/connections'.format(pg_id), 'ConnectionEntity', body=connection)
+
+    async def delete_connection(self, connection, purge=False):
+        """
+        :param purge: Whether to drop any flowfiles queued in the connection first, NiFi refuses to delete a connection with queued flowfiles
+        :type purge: bool
+        """
+        if purge:
+            await self.purge_connection(connection.id)
+        return await self.request('DELETE', '/connections/{}'.format(connection.id), 'ConnectionEntity', params=self._removal_params(connection))
+
+    async def purge_connection(self, connection_id, delay=1):
+        """
+        Drop the flowfiles queued in a connection and wait for the drop request to finish
+        """
+        path = '/flowfile-queues/{}/drop-requests'.format(connection_id)
+        drop = (await self.request('POST', path, 'DropRequestEntity')).drop_request
+        while not drop.finished:
+            await asyncio.sleep(delay)
+            drop = (await self.request('GET', '{}/{}'.format(path, drop.id), 'DropRequestEntity')).drop_request
+        await self.request('DELETE', '{}/{}'.format(path, drop.id))
+        if drop.failure_reason:
+            raise FlowLibException("Failed to purge connection {}: {}".format(connection_id, drop.failure_reason))
+
+    # Controller Services
+
+    async def get_controller_service(self, controller_id):
+        return await self.request('GET', '/controller-services/{}'.format(controller_id), 'ControllerServiceEntity')
+
+    async def get_controller_services(self, pg_id=None):
+        """
+        :param pg_id: The process group to list the controller services of, the controller level services are listed if None
+        :type pg_id: str
+        :returns: list(ControllerServiceEntity)
+        """
+        path = '/flow/process-groups/{}/controller-services'.format(pg_id) if pg_id else '/flow/controller/controller-services'
+        return (await self.request('GET', path, 'ControllerServicesEntity')).controller_services
+
+    async def create_controller_service(self, parent_pg_id, config):
+        """
+        :param parent_pg_id: The process group to create the controller service in, it is created at the controller level if None
+        :type parent_pg_id: str
+        :param config: The type, name and configuration of the new controller service
+        :type config: nipyapi.nifi.models.controller_service_dto.ControllerServiceDTO
+        """
+        body = nipyapi.nifi.ControllerServiceEntity(revision=self._revision(), component=config)
+        path = '/process-groups/{}/controller-services'.format(parent_pg_id) if parent_pg_id else '/controller/controller-services'
+        return await self.request('POST', path, 'ControllerServiceEntity', body=body)
+
+    async def set_controller_service_enabled(self, controller, enabled=True, delay=None, max_wait=None):
+        """
+        Enable or disable a controller service and wait for it to reach that state
+        :type controller: nipyapi.nifi.models.controller_service_entity.ControllerServiceEntity
+        :returns: ControllerServiceEntity
+        """
+        state = 'ENABLED' if enabled else 'DISABLED'
+        delay = delay or nipyapi.config.long_retry_delay
+        max_wait = max_wait or nipyapi.config.long_max_wait
+        body = nipyapi.nifi.ControllerServiceRunStatusEntity(revision=controller.revision, state=state)
+        controller = await self.request('PUT', '/controller-services/{}/run-status'.format(controller.id), 'ControllerServiceEntity', body=body)
+
+        waited = 0
+        while controller.component.state != state:
+            if waited >= max_wait:
+                raise FlowLibException("Timeout reached while waiting for controller service {} to be {}".format(controller.id, state))
+            await asyncio.sleep(delay)
+            waited += delay
+            controller = await self.get_controller_service(controller.id)
+        return controller
+
+    async def delete_controller_service(self, controller):
+        return await self.request('DELETE', '/controller-services/{}'.format(controller.id), 'ControllerServiceEntity', params=self._removal_params(controller))
+
+    # Reporting Tasks
+
+    async def get_reporting_tasks(self):
+        return (await self.request('GET', '/flow/reporting-tasks', 'ReportingTasksEntity')).reporting_tasks
+
+    async def get_reporting_task(self, task_id):
+        return await self.request('GET', '/reporting-tasks/{}'.format(task_id), 'ReportingTaskEntity')
+
+    async def create_reporting_task(self, config):
+        """
+        :param config: The type, name and configuration of the new reporting task
+        :type config: nipyapi.nifi.models.reporting_task_dto.ReportingTaskDTO
+        """
+        body = nipyapi.nifi.ReportingTaskEntity(revision=self._revision(), component=config)
+        return await self.request('POST', '/controller/reporting-tasks', 'ReportingTaskEntity', body=body)
+
+    async def set_reporting_task_running(self, task, running=True):
+        body = nipyapi.nifi.ReportingTaskRunStatusEntity(revision=task.revision, state='RUNNING' if running else 'STOPPED')
+        return await self.request('PUT', '/reporting-tasks/{}/run-status'.format(task.id), 'ReportingTaskEntity', body=body)
+
+    async def delete_reporting_task(self, task):
+        return await self.request('DELETE', '/reporting-tasks/{}'.format(task.id), 'ReportingTaskEntity', params=self._removal_params(task))
+
+
+async def get_previous_deployment(nifi_endpoint, flow_name, config=None, client=None):
+    """
+    Get the currently deployed flow and its components (including processor state) from a running NiFi instance.
+      The state of every stateful processor is fetched concurrently
+    :param nifi_endpoint: A NiFi endpoint
+    :type nifi_endpoint: str
+    :param flow_name: The name of the flow PG to get
+    :type flow_name: str
+    :param config: If config.state_source is zookeeper, the processor state is read directly from NiFi's zookeeper
+      instead of from the NiFi api
+    :type config: FlowLibConfig
+    :param client: The client to use, a new client is opened for the nifi_endpoint if None
+    :type client: AsyncNiFiClient
+    :returns: flowlib.model.deployment.FlowDeployment
+    """
+    async with _open_client(nifi_endpoint, client) as nifi:
+        await nifi.wait_until_ready()
+        flow_pg = await _find_flow_by_name(nifi, flow_name)
+
+        status = await nifi.get_process_group_status(flow_pg.id)
+        if status.process_group_status.aggregate_snapshot.flow_files_queued > 0:
+            log.warn("There are active flowfiles queued for this flow. Exporting or redeploying a flow with items enqueued may lead to dropped flowfiles")
+
+        # load the deployment from the root PG comments
+        deployment = flowlib.nifi.deploy.load_deployment(flow_pg)
+
+        processor_ids = [p['processor_id'] for p in flowlib.nifi.deploy.stateful_processors(deployment)]
+        if config and config.state_source == 'zookeeper':
+            # zookeeper is only reachable with a blocking client, so read state from a worker thread
+            states = await asyncio.get_running_loop().run_in_executor(None, _get_zookeeper_states, config, processor_ids)
+        else:
+            states = dict()
+            component_states = await _gather([nifi.get_processor_state(proc_id) for proc_id in processor_ids])
+            for proc_id, component_state in zip(processor_ids, component_states):
+                state = component_state.cluster_state
+                if state and state.total_entry_count > 0:
+                    states[proc_id] = {entry.key: entry.value for entry in state.state}
+        flowlib.nifi.deploy.set_exported_state(deployment, states)
+
+        return deployment
+
+
+def _get_zookeeper_states(config, processor_ids):
+    with ZookeeperClient(config.zookeeper_connection, config.zookeeper_root_node, config.zookeeper_acl) as client:
+        return client.get_processor_states(processor_ids)
+
+
+async def deploy_flow(flow, config, deployment=None, force=False, client=None):
+    """
+    Deploy a Flow to NiFi via the Rest api, making every independent api call concurrently.
+      The flow's canvas elements are created as soon as their process group exists, and controller services
+      and connections are all created concurrently.
+      Incremental and snapshot deployments are only supported by flowlib.nifi.rest.deploy_flow()
+    :param flow: An initialized Flow instance
+    :type flow: flowlib.model.flow.Flow
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param deployment: If a deployment is specified, then we will use the state from
+      the one provided instead of attempting to export the currently deployed flow first.
+    :type deployment: FlowDeployment
+    :param force: Whether to overwrite a previously deployed data flow
+    :type force: bool
+    :param client: The client to use, a new client is opened for config.nifi_endpoint if None.
+      Deploying with a shared client limits the requests in flight for every deployment to that NiFi instance
+    :type client: AsyncNiFiClient
+    """
+    flowlib.nifi.deploy.check_flow(flow)
+
+    async with _open_client(config.nifi_endpoint, client) as nifi:
+        await nifi.wait_until_ready()
+        previous_deployment = deployment
+        if not previous_deployment:
+            try:
+                previous_deployment = await get_previous_deployment(config.nifi_endpoint, flow.name, config, client=nifi)
+            except FlowNotFoundException:
+                pass
+
+        # create a new FlowDeployment
+        deployment = flowlib.nifi.deploy.new_deployment(flow)
+
+        canvas_root_pg = await nifi.get_process_group('root')
+        log.info("Deploying {} to NiFi".format(flow.name))
+
+        canvas = CanvasIndex()
+        canvas.add_flow((await nifi.recurse_flow(canvas_root_pg.id)).process_group_flow.flow)
+
+        previous_flow_pg = None
+        if previous_deployment:
+            try:
+                previous_flow_pg = await _find_flow_by_name(nifi, flow.name)
+                log.info("Found ProcessGroup of previously deployed flow: {}".format(previous_flow_pg.id))
+            except FlowNotFoundException:
+                pass
+
+        flow_pg = None
+        try:
+            if previous_flow_pg and not force:
+                raise FlowLibException("A flow with that name already exists, use the --force option to overwrite it")
+
+            # lay out every process group in a worker while the flow's process group and controllers are created,
+            # templating below only changes the config of elements and not the names and connections the layout uses
+            layout = asyncio.get_running_loop().run_in_executor(None, flowlib.layout.generate_flow_layout, flow,
+                flowlib.nifi.deploy.layout_cache(config, deployment, previous_deployment), config.layout_processes)
+
+            # create a PG for the new flow
+            flow_pg_element = ProcessGroup(name="(deploying) {}".format(flow.name), _type="process_group", _parent_path=flow.name)
+            flow_pg = await _create_process_group(nifi, flow_pg_element, canvas_root_pg, flowlib.layout.TOP_LEVEL_PG_LOCATION, deployment, canvas, is_flow_root=True)
+            flow.id = flow_pg.id
+
+            await _create_controllers(nifi, flow, flow_pg)
+            # the jinja globals are shared by every flow, so re-apply this flow's globals in case another
+            # flow has been initialized since. Templating does not await so concurrent deployments can't interleave here
+            flowlib.parser.env.globals.update(**flow.global_vars)
+            flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components)
+
+            positions = await layout
+            await _create_canvas_elements(nifi, flow._elements, flow_pg, config, canvas, deployment, previous_deployment, positions,
+                flow.layout or flowlib.layout.DEFAULT_LAYOUT)
+            # zookeeper is only reachable with a blocking client, so migrate state from a worker thread
+            await asyncio.get_running_loop().run_in_executor(None, flowlib.nifi.deploy.migrate_state,
+                config, deployment, previous_deployment)
+            await _create_connections(nifi, flow, canvas)
+            await _gather([_set_controller_enabled(nifi, c, enabled=True) for c in flow._controllers])
+
+            if previous_flow_pg and force:
+                await _remove_flow(nifi, previous_flow_pg.id, force=force)
+
+        except:
+            # rename new flow to failed and re-raise the exception
+            if flow_pg:
+                await _rename_process_group(nifi, "(failed) {}".format(flow.name), flow_pg.id)
+            raise
+
+        # we finished creating the new flow without errors so replace the old one
+        await _rename_process_group(nifi, flow.name, flow_pg.id)
+
+        # find all deployed flows and re-organize the top level PGs
+        pgs = flowlib.nifi.deploy.layout_top_level_groups(await nifi.get_process_groups(canvas_root_pg.id))
+        await _gather([nifi.update_process_group(pg) for pg in pgs])
+
+        deployment.config_fingerprints = flowlib.fingerprint.fingerprint_configs(flow)
+        await _save_deployment(nifi, flow_pg.id, deployment)
+
+
+async def generate_docs(config, dest, force=False, client=None):
+    """
+    Use the configured NiFi api endpoint to generate html docs containing example YAML definitions for the available
+      processors, controller service, and reporting tasks. The descriptors of every component type are fetched concurrently
+    :type config: FlowLibConfig
+    :param dest: The destination directory to create the flowlib documentation
+    :type dest: str
+    :param client: The client to use, a new client is opened for config.nifi_endpoint if None
+    :type client: AsyncNiFiClient
+    """
+    if os.path.exists(dest):
+        log.warn("Destination directory {} already exists. Will not update static descriptors...".format(dest))
+
+    async with _open_client(config.nifi_endpoint, client) as nifi:
+        about = await nifi.wait_until_ready()
+        reporting_tasks, controller_services, processors, root_pg = await asyncio.gather(
+            nifi.get_reporting_task_types(),
+            nifi.get_controller_service_types(),
+            nifi.get_processor_types(),
+            nifi.get_process_group('root')
+        )
+
+        mode = 'w' if force else 'x'
+        descriptors = list()
+        for t in reporting_tasks:
+            descriptors.append(_gen_doc_descriptor(os.path.join(dest, 'reporting-tasks'), t.type, mode,
+                lambda t=t: _get_reporting_task_descriptors(nifi, t.type)))
+        for t in controller_services:
+            descriptors.append(_gen_doc_descriptor(os.path.join(dest, 'controllers'), t.type, mode,
+                lambda t=t: _get_controller_service_descriptors(nifi, t.type, root_pg.id)))
+        for t in processors:
+            descriptors.append(_gen_doc_descriptor(os.path.join(dest, 'processors'), t.type, mode,
+                lambda t=t: _get_processor_descriptors(nifi, t.type, root_pg.id)))
+        await _gather(descriptors)
+
+    flowlib.nifi.docs.gen_doc_html(dest, nifi_version=about.about)
+
+
+@contextlib.asynccontextmanager
+async def _open_client(nifi_endpoint, client=None):
+    """
+    Use the provided client, or open a new client for the nifi_endpoint which is closed on exit
+    """
+    if client:
+        await client.open()
+        yield client
+    else:
+        async with AsyncNiFiClient(nifi_endpoint) as client:
+            yield client
+
+
+async def _gather(aws):
+    """
+    Wait for all of the awaitables to complete
+    :returns: list of the results of each awaitable, in the same order as aws
+    :raises: The first exception raised by any awaitable, once all of the others have completed
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return results
+
+
+async def _result(value):
+    return value
+
+
+async def _retry_conflicts(update):
+    """
+    Await update(), and await it again with a backoff when NiFi rejects it with a revision conflict (409).
+      update() must read the current revision of the entity it updates every time it is called
+    :param update: A coroutine function which reads an entity and updates it
+    :returns: The result of update()
+    """
+    settings = flowlib.nifi.transport.settings()
+    attempt = 0
+    while True:
+        try:
+            return await update()
+        except NiFiApiException as e:
+            if e.status != flowlib.nifi.transport.CONFLICT_STATUS or attempt >= settings['retries']:
+                raise
+            log.debug("Revision conflict, retrying the update: {}".format(e))
+            await asyncio.sleep(flowlib.nifi.transport.backoff(settings['backoff_factor'], attempt))
+            attempt += 1
+
+
+def _position(position):
+    return nipyapi.nifi.PositionDTO(x=float(position[0]), y=float(position[1]))
+
+
+async def _find_flow_by_name(nifi, name):
+    """
+    Returns the ProcessGroupEntity of the flow, flows are always deployed to the root process group
+    :raises: FlowLibException if multiple flows with that name are found
+    :raises: FlowNotFoundException if no flow is found with that name
+    """
+    pgs = [pg for pg in await nifi.get_process_groups('root') if pg.component.name == name]
+    if len(pgs) > 1:
+        raise FlowLibException("Found multiple Flow ProcessGroups named {}".format(name))
+    elif len(pgs) == 0:
+        raise FlowNotFoundException("No flow ProcessGroup named {} is deployed".format(name))
+    return pgs[0]
+
+
+async def _rename_process_group(nifi, name, pg_id):
+    async def rename():
+        flow_pg = await nifi.get_process_group(pg_id)
+        flow_pg.component.name = name
+        return await nifi.update_process_group(flow_pg)
+    return await _retry_conflicts(rename)
+
+
+async def _save_deployment(nifi, flow_pg_id, deployment):
+    """
+    Save the FlowDeployment in the comments of the flow's process group
+    """
+    async def save():
+        # re-fetch the deployed flow PG for its latest revision
+        flow_pg = await nifi.get_process_group(flow_pg_id)
+        flow_pg.component.comments = deployment.encode()
+        return await nifi.update_process_group(flow_pg)
+    return await _retry_conflicts(save)
+
+
+async def _create_controllers(nifi, flow, flow_pg):
+    """
+    Create the controller services for the flow
+    """
+    all_controller_types = [t.type for t in await nifi.get_controller_service_types()]
+    for c in flow._controllers:
+        if c.config.package_id not in all_controller_types:
+            raise FlowLibException("{} is not a valid NiFi Controller Service type".format(c.config.package_id))
+
+    async def create(c):
+        config = copy.copy(c.config)
+        config.type = c.config.package_id
+        config.name = c.name
+        controller = await nifi.create_controller_service(flow_pg.id, config)
+        c.id = controller.id
+        c.parent_id = flow_pg.id
+
+    await _gather([create(c) for c in flow._controllers])
+
+
+async def _set_controller_enabled(nifi, c, enabled=True):
+    controller = await nifi.get_controller_service(c.id)
+    await nifi.set_controller_service_enabled(controller, enabled)
+
+
+async def _create_canvas_elements(nifi, elements, parent_pg, config, canvas, current_deployment, previous_deployment=None, positions=None,
+    layout_type=flowlib.layout.DEFAULT_LAYOUT):
+    """
+    Recursively creates the actual NiFi elements (process_groups, processors, inputs, outputs) on the canvas.
+      Every element in the group is created concurrently and the elements of each child process group
+      are created as soon as the process group exists
+    :param elements: The elements to deploy
+    :type elements: dict(str:model.FlowElement)
+    :param parent_pg: The process group in which to create the elements
+    :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param positions: The (x,y) positions of elements keyed by element path, the positions of any other elements
+      are generated from the layout of their group
+    :type positions: dict(str:tuple)
+    :param layout_type: The type of layout of the groups whose elements have no positions, one of flowlib.layout.LAYOUT_TYPES
+    :type layout_type: str
+    """
+    positions = positions or dict()
+    layout = None
+    tasks = list()
+    for el in elements.values():
+        position = positions.get(flowlib.plan.element_path(el))
+        if not position:
+            layout = layout or flowlib.layout.generate_layout(elements, layout_type)
+            position = layout[el.name]
+        tasks.append(_create_canvas_element(nifi, el, parent_pg, position, config, canvas, current_deployment, previous_deployment, positions,
+            layout_type))
+    await _gather(tasks)
+
+
+async def _create_canvas_element(nifi, el, parent_pg, position, config, canvas, current_deployment, previous_deployment=None, positions=None,
+    layout_type=flowlib.layout.DEFAULT_LAYOUT):
+    """
+    Create a single element on the NiFi canvas, and the elements of a process group
+    :returns: The NiFi entity that was created
+    """
+    if isinstance(el, ProcessGroup):
+        pg = await _create_process_group(nifi, el, parent_pg, position, current_deployment, canvas)
+        await _create_canvas_elements(nifi, el._elements, pg, config, canvas, current_deployment, previous_deployment, positions, layout_type)
+        return pg
+    elif isinstance(el, Processor):
+        return await _create_processor(nifi, el, parent_pg, position, config, canvas, current_deployment, previous_deployment)
+    elif isinstance(el, RemoteProcessGroup):
+        return await _create_remote_process_group(nifi, el, parent_pg, canvas)
+    elif isinstance(el, (InputPort, OutputPort)):
+        return await _create_port(nifi, el, parent_pg, position, canvas)
+    else:
+        raise FlowLibException("Unsupported Element Type: {}".format(el.type))
+
+
+async def _create_process_group(nifi, element, parent_pg, position, current_deployment, canvas, is_flow_root=False):
+    name = element.name if is_flow_root else "{}/{}".format(element.name, parent_pg.id)
+    log.info("Creating ProcessGroup: {}".format(name))
+    if canvas.get('process_group', name):
+        log.error("Found existing ProcessGroup: {}".format(name))
+        raise FlowLibException("Re-deploying a flow is not yet supported")
+
+    pg = await nifi.create_process_group(parent_pg.id, name, position)
+    canvas.add('process_group', pg)
+    if is_flow_root:
+        current_deployment.root_group_id = pg.id
+
+    element.id = pg.id
+    element.parent_id = parent_pg.id
+    return pg
+
+
+async def _create_processor(nifi, element, parent_pg, position, config, canvas, current_deployment, previous_deployment=None):
+    name = "{}/{}".format(element.name, parent_pg.id)
+    log.info("Creating Processor: {}".format(name))
+    if canvas.get('processor', name):
+        log.error("Found existing Processor: {}".format(name))
+        raise FlowLibException("Re-deploying a flow is not yet supported")
+
+    p = await nifi.create_processor(parent_pg.id, element.config.package_id, name, position, element.config)
+    canvas.add('processor', p)
+
+    if p.component.persists_state:
+        flowlib.nifi.deploy.record_stateful_processor(element, p, current_deployment)
+
+    element.id = p.id
+    element.parent_id = parent_pg.id
+    return p
+
+
+async def _create_port(nifi, element, parent_pg, position, canvas):
+    name = "{}/{}".format(element.name, parent_pg.id)
+    label = 'InputPort' if element.type == 'input_port' else 'OutputPort'
+    log.info("Creating {}: {}".format(label, name))
+    if canvas.get(element.type, name):
+        log.error("Found existing {}: {}".format(label, name))
+        raise FlowLibException("Re-deploying a flow is not yet supported")
+
+    port = await nifi.create_port(parent_pg.id, element.type, name, position)
+    canvas.add(element.type, port)
+
+    element.id = port.id
+    element.parent_id = parent_pg.id
+    return port
+
+
+async def _create_remote_process_group(nifi, element, parent_pg, canvas):
+    element.config.name = element.name
+    rpg = await nifi.create_remote_process_group(parent_pg.id, element.config)
+    canvas.add('remote_process_group', rpg)
+    element.id = rpg.id
+    element.parent_id = parent_pg.id
+    return rpg
+
+
+async def _get_entity(nifi, kind, identifier, canvas):
+    if kind != 'remote_process_group':
+        e = canvas.get_by_id(identifier)
+        if e:
+            return e
+
+    if kind in ['input_port', 'output_port']:
+        e = await nifi.get_port(kind, identifier)
+    elif kind == 'processor':
+        e = await nifi.get_processor(identifier)
+    elif kind == 'process_group':
+        e = await nifi.get_process_group(identifier)
+    elif kind == 'remote_process_group':
+        # RPGs are always re-fetched because NiFi populates their remote ports after they are created
+        e = await nifi.get_remote_process_group(identifier)
+    else:
+        raise FlowLibException("{} is not a valid NiFi api type".format(kind))
+
+    canvas.add(kind, e)
+    return e
+
+
+async def _create_connections(nifi, flow, canvas):
+    """
+    Create all of the connections between elements defined in the Flow
+    """
+    async def create(source_element, dest_element, c, group):
+        log.info("Creating connection from {}/{} to {}".format(source_element.parent_path, source_element.name, c.name))
+        source, dest = await asyncio.gather(
+            _get_entity(nifi, source_element.type, source_element.id, canvas),
+            _get_entity(nifi, dest_element.type, dest_element.id, canvas)
+        )
+        return await nifi.create_connection(group.id, flowlib.nifi.deploy.connection_entity(source, dest, c))
+
+    connections = flowlib.plan.plan_connections(flow)
+    log.info("Creating {} connections".format(len(connections)))
+    await _gather([create(*c) for c in connections])
+
+
+async def _remove_flow(nifi, flow_pg_id, force=False):
+    """
+    Delete a deployed Flow from the NiFi canvas so that flows can be re-deployed
+    """
+    log.info("Stopping processors...")
+    await nifi.schedule_components(flow_pg_id, False)
+
+    log.info("Deleting flow connections...")
+    connections = list()
+    flows = [(await nifi.recurse_flow(flow_pg_id)).process_group_flow.flow]
+    while flows:
+        f = flows.pop()
+        connections.extend(f.connections or [])
+        flows.extend([pg.nipyapi_extended.process_group_flow.flow for pg in f.process_groups or []])
+    await _gather([nifi.delete_connection(c, purge=force) for c in connections])
+
+    log.info("Deleting flow controller services...")
+    controllers = [c for c in await nifi.get_controller_services(flow_pg_id) if c.component.parent_group_id == flow_pg_id]
+    controllers = await _gather([nifi.set_controller_service_enabled(c, enabled=False) if c.component.state != 'DISABLED' else _result(c)
+        for c in controllers])
+    await _gather([nifi.delete_controller_service(c) for c in controllers])
+
+    log.info("Deleting flow process group...")
+    await nifi.delete_process_group(await nifi.get_process_group(flow_pg_id))
+
+
+async def _gen_doc_descriptor(doc_dir, package_id, mode, get_descriptors):
+    """
+    Write the property descriptors of a component type to a yaml file in doc_dir
+    :param mode: 'x' to skip existing descriptor files, 'w' to overwrite them
+    :param get_descriptors: A coroutine function returning the property descriptors of the component type
+    """
+    os.makedirs(doc_dir, exist_ok=True)
+    path = flowlib.nifi.docs.doc_descriptor_path(doc_dir, package_id)
+    if mode == 'x' and os.path.exists(path):
+        log.warn("Descriptors already exist for {}, skipping...".format(package_id))
+        return
+
+    descriptors = await get_descriptors()
+    with open(path, mode) as f:
+        f.write(flowlib.nifi.docs.dump_doc_descriptors(descriptors))
+
+
+async def _get_reporting_task_descriptors(nifi, package_id):
+    # create and delete a temp reporting task
+    task = await nifi.create_reporting_task(nipyapi.nifi.ReportingTaskDTO(type=package_id, name='doc-temp'))
+    await nifi.delete_reporting_task(task)
+    return task.component.descriptors
+
+
+async def _get_controller_service_descriptors(nifi, package_id, root_pg_id):
+    # create and delete a temp controller service in the root pg
+    controller = await nifi.create_controller_service(root_pg_id, nipyapi.nifi.ControllerServiceDTO(type=package_id, name='doc-temp'))
+    await nifi.delete_controller_service(controller)
+    return controller.component.descriptors
+
+
+async def _get_processor_descriptors(nifi, package_id, root_pg_id):
+    # create and delete a temp processor in the root pg
+    processor = await nifi.create_processor(root_pg_id, package_id, 'doc-temp', flowlib.layout.TOP_LEVEL_PG_LOCATION)
+    await nifi.delete_processor(processor)
+    return processor.component.config.descriptors
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import nipyapi
+
+from flowlib.exceptions import FlowLibException
+
+
+class CanvasIndex:
+
+    KINDS = ['process_group', 'processor', 'input_port', 'output_port', 'remote_process_group']
+
+    def __init__(self):
+        """
+        An in-memory index of the entities on the NiFi canvas, keyed by component name and by id.
+        The canvas is read once at the start of a deployment and every entity flowlib creates
+        is added to the index so that existence checks never have to walk the canvas again,
+        and so that entities can be looked up again (e.g. when connecting them) without re-fetching them.
+        The index is safe to share between the threads of a concurrent deployment.
+        :attr _by_name: A map of {kind: {name: entity}} for each supported kind of canvas entity
+        :type _by_name: dict(str:dict(str:Any))
+        :attr _by_id: A map of {id: entity} for every entity in the index
+        :type _by_id: dict(str:Any)
+        """
+        self._by_name = {kind: dict() for kind in CanvasIndex.KINDS}
+        self._by_id = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_canvas(pg_id='root'):
+        """
+        Construct a CanvasIndex by reading the process group (and all of its descendants) from the NiFi api
+        :param pg_id: The NiFi uuid of the process group to index
+        :type pg_id: str
+        :returns: CanvasIndex
+        """
+        index = CanvasIndex()
+        pg_flow = nipyapi.canvas.recurse_flow(pg_id)
+        index.add_flow(pg_flow.process_group_flow.flow)
+        return index
+
+    def add_flow(self, flow):
+        """
+        Add all of the entities in a FlowDTO to the index, including the child flows
+          attached to each process group by nipyapi.canvas.recurse_flow()
+        :type flow: nipyapi.nifi.models.flow_dto.FlowDTO
+        """
+        for pg in flow.process_groups or []:
+            self.add('process_group', pg)
+            child = getattr(pg, 'nipyapi_extended', None)
+            if child:
+                self.add_flow(child.process_group_flow.flow)
+        for p in flow.processors or []:
+            self.add('processor', p)
+        for ip in flow.input_ports or []:
+            self.add('input_port', ip)
+        for op in flow.output_ports or []:
+            self.add('output_port', op)
+        for rpg in flow.remote_process_groups or []:
+            self.add('remote_process_group', rpg)
+
+    def add(self, kind, entity):
+        """
+        Add an entity to the index
+        :param kind: One of process_group, processor, input_port, output_port, remote_process_group
+        :type kind: str
+        :param entity: The NiFi entity returned by the api
+        """
+        if kind not in self._by_name:
+            raise FlowLibException("{} is not a valid NiFi api type".format(kind))
+        with self._lock:
+            self._by_name[kind][entity.component.name] = entity
+            self._by_id[entity.id] = entity
+
+    def remove(self, kind, entity):
+        """
+        Remove an entity from the index after it has been deleted from the canvas
+        :param kind: One of process_group, processor, input_port, output_port, remote_process_group
+        :type kind: str
+        :param entity: The NiFi entity returned by the api
+        """
+        if kind not in self._by_name:
+            raise FlowLibException("{} is not a valid NiFi api type".format(kind))
+        with self._lock:
+            self._by_name[kind].pop(entity.component.name, None)
+            self._by_id.pop(entity.id, None)
+
+    def get(self, kind, name):
+        """
+        :param kind: One of process_group, processor, input_port, output_port, remote_process_group
+        :type kind: str
+        :param name: The exact name of the entity on the canvas
+        :type name: str
+        :returns: The entity or None if no entity of that kind has the provided name
+        """
+        if kind not in self._by_name:
+            raise FlowLibException("{} is not a valid NiFi api type".format(kind))
+        with self._lock:
+            return self._by_name[kind].get(name)
+
+    def get_by_id(self, identifier):
+        """
+        :param identifier: The NiFi uuid of the entity
+        :type identifier: str
+        :returns: The entity or None if it is not in the index
+        """
+        with self._lock:
+            return self._by_id.get(identifier)
+
+    def __repr__(self):
+        return str({kind: list(entities.keys()) for kind, entities in self._by_name.items()})
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+The steps of a deployment which don't call the NiFi api, shared by the blocking client in flowlib.nifi.rest and
+  the asyncio client in flowlib.nifi.aio
+"""
+import nipyapi
+
+import flowlib.layout
+from flowlib.logger import log
+from flowlib.nifi.state import ZookeeperClient
+from flowlib.exceptions import FlowLibException
+from flowlib.model.deployment import FlowDeployment, DeployedComponent
+
+
+def check_flow(flow):
+    """
+    :param flow: The flow to deploy
+    :type flow: flowlib.model.flow.Flow
+    :raises: FlowLibException if the flow is not ready to be deployed
+    """
+    if not flow._is_initialized:
+        raise FlowLibException("Flow has not yet been initialized. Call flow.initialize() first")
+    if not flow._is_valid:
+        raise FlowLibException("Flow has not yet been validated. Call flow.validate() first")
+
+
+def new_deployment(flow):
+    """
+    :param flow: The flow to deploy
+    :type flow: flowlib.model.flow.Flow
+    :returns: flowlib.model.deployment.FlowDeployment A new deployment of the flow and of the components it loaded
+    """
+    deployment = FlowDeployment(flow.raw, fingerprints=flow.fingerprints)
+    for component in flow._loaded_components.values():
+        deployment.add_component(DeployedComponent(component.raw))
+    return deployment
+
+
+def layout_top_level_groups(pgs):
+    """
+    Position the process groups of the deployed flows on the root of the canvas, ordered by name
+    :param pgs: The process groups in the root process group of the canvas
+    :type pgs: list(nipyapi.nifi.models.process_group_entity.ProcessGroupEntity)
+    :returns: list(ProcessGroupEntity) The process groups ordered by name, with their new positions set
+    """
+    log.info("Found {} deployed flows, updating top level canvas layout.".format(len(pgs)))
+    pgs = sorted(pgs, key=lambda e: e.component.name)
+    positions = flowlib.layout.generate_top_level_pg_positions(pgs)
+    for pg in pgs:
+        pg.component.position = positions.get(pg.component.name, flowlib.layout.DEFAULT_POSITION)
+    return pgs
+
+
+def load_deployment(flow_pg):
+    """
+    Load the FlowDeployment that flowlib saved in the comments of a flow's process group
+    :param flow_pg: The process group of a deployed flow
+    :type flow_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :returns: flowlib.model.deployment.FlowDeployment
+    """
+    try:
+        return FlowDeployment.decode(flow_pg.component.comments)
+    except Exception as e:
+        log.error(e)
+        raise FlowLibException("Failed to serialize the previously deployed Flow")
+
+
+def stateful_processors(deployment):
+    """
+    :type deployment: flowlib.model.deployment.FlowDeployment
+    :returns: list(dict) The stateful processors of the flow and of all of its components
+    """
+    processors = list(deployment.stateful_processors.values())
+    for c in deployment.components:
+        processors.extend(c.stateful_processors.values())
+    return processors
+
+
+def set_exported_state(deployment, states):
+    """
+    Set the exported state of each stateful processor in the deployment
+    :type deployment: flowlib.model.deployment.FlowDeployment
+    :param states: The state k,v pairs of each processor, keyed by processor id
+    :type states: dict(str:dict(str:str))
+    """
+    for p in stateful_processors(deployment):
+        if states.get(p['processor_id']):
+            p['state'] = states[p['processor_id']]
+        else:
+            log.info("Processor was specified as persisting state but no cluster state was found for {}, will not export state".format(p['processor_id']))
+
+
+def layout_cache(config, current_deployment, previous_deployment=None):
+    """
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param current_deployment: The current flow deployment, the layouts that are used are saved with it
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :param previous_deployment: The previous flow deployment, its layouts are reused for unchanged process groups
+    :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    :returns: flowlib.layout.LayoutCache
+    """
+    cache = flowlib.layout.LayoutCache(previous_deployment.layouts if previous_deployment else None, config.layout_cache_dir)
+    current_deployment.layouts = cache.layouts
+    return cache
+
+
+def record_stateful_processor(element, processor, current_deployment):
+    """
+    Add a stateful processor to the deployment's stateful_processors so that its state can be migrated later
+    :param element: The deployed Processor
+    :type element: model.Processor
+    :param processor: The processor entity on the NiFi canvas
+    :type processor: nipyapi.nifi.models.processor_entity.ProcessorEntity
+    :param current_deployment: The current flow deployment
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    """
+    if element.src_component_name == 'root':
+        current_deployment.stateful_processors[element.name] = {'processor_id': processor.id}
+    else:
+        component_path = element.parent_path + "/" + element.name
+        deployed_component = current_deployment.get_component(element.src_component_name)
+        deployed_component.stateful_processors[component_path] = {
+            "group_id": processor.component.parent_group_id,
+            "processor_id": processor.id
+        }
+
+
+def migrate_state(config, current_deployment, previous_deployment=None):
+    """
+    Set the state of the new stateful processors to their state from the previous deployment, if there is any.
+      All of the state is written with a single zookeeper session, which is closed when the migration is done
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param current_deployment: The current flow deployment, with its stateful processors recorded
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :param previous_deployment: The previous flow deployment
+    :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    """
+    states = get_state_migrations(current_deployment, previous_deployment)
+    if not states:
+        return
+
+    log.info("Migrating processor state for {} processors".format(len(states)))
+    with ZookeeperClient(config.zookeeper_connection, config.zookeeper_root_node, config.zookeeper_acl) as client:
+        client.set_processor_states(states)
+
+
+def get_state_migrations(current_deployment, previous_deployment=None):
+    """
+    Match the stateful processors of the current deployment with the processors of the previous deployment by their path
+    :param current_deployment: The current flow deployment, with its stateful processors recorded
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :param previous_deployment: The previous flow deployment
+    :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    :returns: dict(str:dict) The previous state to set for each new processor, keyed by processor id
+    """
+    matches = list()
+    for name, p in current_deployment.stateful_processors.items():
+        previous = previous_deployment.stateful_processors.get(name, {}) if previous_deployment else dict()
+        matches.append((name, p, previous))
+    for c in current_deployment.components:
+        previous_component = previous_deployment.get_component(c.component['name']) if previous_deployment else None
+        for path, p in c.stateful_processors.items():
+            previous = previous_component.stateful_processors.get(path, {}) if previous_component else dict()
+            matches.append((path, p, previous))
+
+    states = dict()
+    for path, p, previous in matches:
+        if previous.get('processor_id') == p['processor_id']:
+            # the processor was not re-created so it still has its state
+            continue
+        if previous.get('state'):
+            states[p['processor_id']] = previous['state']
+        else:
+            log.info("Processor {} is marked as stateful but no previous state was found, nothing to migrate...".format(path))
+    return states
+
+
+def connection_entity(source, dest, c):
+    """
+    Build the entity for creating a connection between two NiFi entities
+    :param source: The NiFi entity of the connection's source
+    :param dest: The NiFi entity of the connection's destination
+    :param c: The connection to create
+    :type c: flowlib.model.flow.Connection
+    :returns: nipyapi.nifi.models.connection_entity.ConnectionEntity
+    """
+    source_id = source.component.id
+    source_group_id = source.component.parent_group_id
+    dest_id = dest.component.id
+    dest_group_id = dest.component.parent_group_id
+
+    # if source or dest are a RPG then we need the IDs of the target input or output
+    # ports from the remote instance
+    if isinstance(source, nipyapi.nifi.RemoteProcessGroupEntity):
+        source_type = 'REMOTE_OUTPUT_PORT'
+        target = [op for op in source.component.contents.output_ports if op.name == c.from_port]
+        if len(target) != 1:
+            raise FlowLibException("Output port {} not found. Found: {}".format(c.from_port, [op.name for op in source.component.contents.output_ports]))
+        source_id = target[0].id
+        source_group_id = target[0].group_id
+    else:
+        source_type = nipyapi.utils.infer_object_label_from_class(source)
+
+    if isinstance(dest, nipyapi.nifi.RemoteProcessGroupEntity):
+        dest_type = 'REMOTE_INPUT_PORT'
+        target = [ip for ip in dest.component.contents.input_ports if ip.name == c.to_port]
+        if len(target) != 1:
+            raise FlowLibException("Input port {} not found. Found: {}".format(c.to_port, [ip.name for ip in dest.component.contents.input_ports]))
+        dest_id = target[0].id
+        dest_group_id = target[0].group_id
+    else:
+        dest_type = nipyapi.utils.infer_object_label_from_class(dest)
+
+    return nipyapi.nifi.ConnectionEntity(
+        revision=nipyapi.nifi.RevisionDTO(version=0),
+        source_type=source_type,
+        destination_type=dest_type,
+        component=nipyapi.nifi.ConnectionDTO(
+            source=nipyapi.nifi.ConnectableDTO(
+                id=source_id,
+                group_id=source_group_id,
+                type=source_type
+            ),
+            back_pressure_data_size_threshold=c.back_pressure_data_size_threshold,
+            back_pressure_object_threshold=c.back_pressure_object_threshold,
+            load_balance_strategy=c.load_balance_strategy,
+            flow_file_expiration=c.flow_file_expiration,
+            load_balance_compression=c.load_balance_compression,
+            prioritizers=c.prioritizers,
+            name=c.name,
+            destination=nipyapi.nifi.ConnectableDTO(
+                id=dest_id,
+                group_id=dest_group_id,
+                type=dest_type
+            ),
+            selected_relationships=c.relationships
+        )
+    )
@@ -11,6 +11,7 @@ from flowlib.exceptions import FlowLibException
 from flowlib.model.flow import Processor, ControllerService, ReportingTask
 from flowlib.logger import log
 import flowlib.nifi.rest
+import flowlib.profile
 
 
 def generate_docs(config, dest, force=False):
@@ -43,10 +44,14 @@ def generate_docs(config, dest, force=False):
     if force: # otherwise set mode to 'w' and overwrite all descriptors
         mode='w'
 
-    _gen_reporting_task_doc_descriptors(reporting_task_doc_dir, reporting_tasks, mode)
-    _gen_controller_service_doc_descriptors(controllers_doc_dir, controller_services, root_pg, mode)
-    _gen_processor_doc_descriptors(processors_doc_dir, processors, root_pg, mode)
-    _gen_doc_html(dest)
+    with flowlib.profile.phase('reporting-tasks'):
+        _gen_reporting_task_doc_descriptors(reporting_task_doc_dir, reporting_tasks, mode)
+    with flowlib.profile.phase('controllers'):
+        _gen_controller_service_doc_descriptors(controllers_doc_dir, controller_services, root_pg, mode)
+    with flowlib.profile.phase('processors'):
+        _gen_processor_doc_descriptors(processors_doc_dir, processors, root_pg, mode)
+    with flowlib.profile.phase('html'):
+        gen_doc_html(dest)
 
 
 def _get_available_component_package_ids(component_type):
@@ -71,7 +76,7 @@ def _gen_reporting_task_doc_descriptors(doc_dir, reporting_tasks, mode='x'):
     for rt in reporting_tasks:
         try:
             # write props to doc file
-            with open('{}.{}'.format(os.path.join(doc_dir, rt), 'yaml'), mode) as f:
+            with open(doc_descriptor_path(doc_dir, rt), mode) as f:
                 # create temp reporting task
                 task = nipyapi.nifi.ControllerApi().create_reporting_task(
                     body=nipyapi.nifi.ReportingTaskEntity(
@@ -88,7 +93,7 @@ def _gen_reporting_task_doc_descriptors(doc_dir, reporting_tasks, mode='x'):
                     version=task.revision.version,
                     client_id=task.revision.client_id
                 )
-                f.write(yaml.safe_dump({ k:v.to_dict() for k,v in task.component.descriptors.items() }))
+                f.write(dump_doc_descriptors(task.component.descriptors))
         except FileExistsError:
             log.warn("Reporting task descriptors already exist for {}, skipping...".format(rt))
 
@@ -98,13 +103,13 @@ def _gen_controller_service_doc_descriptors(doc_dir, controller_services, root_p
     for cs in controller_services:
         try:
             # write props to doc file
-            with open('{}.{}'.format(os.path.join(doc_dir, cs), 'yaml'), mode) as f:
+            with open(doc_descriptor_path(doc_dir, cs), mode) as f:
                 # create temp controller service in root pg
                 controller_type = nipyapi.nifi.models.DocumentedTypeDTO(type=cs)
                 controller = nipyapi.canvas.create_controller(root_pg, controller_type, name='doc-temp')
                 # delete the temp controller service
                 nipyapi.canvas.delete_controller(controller, force=True)
-                f.write(yaml.safe_dump({ k:v.to_dict() for k,v in controller.component.descriptors.items() }))
+                f.write(dump_doc_descriptors(controller.component.descriptors))
         except FileExistsError:
             log.warn("Controller service descriptors already exist for {}, skipping...".format(cs))
 
@@ -114,23 +119,43 @@ def _gen_processor_doc_descriptors(doc_dir, processors, root_pg, mode='x'):
     for p in processors:
         try:
             # write props to doc file
-            with open('{}.{}'.format(os.path.join(doc_dir, p), 'yaml'), mode) as f:
+            with open(doc_descriptor_path(doc_dir, p), mode) as f:
                 # create temp processor in root pg
                 processor_type = nipyapi.nifi.models.DocumentedTypeDTO(type=p)
                 processor = nipyapi.canvas.create_processor(root_pg, processor_type, TOP_LEVEL_PG_LOCATION, name='doc-temp')
                 # delete the temp processor
                 nipyapi.canvas.delete_processor(processor, force=True)
-                f.write(yaml.safe_dump({ k:v.to_dict() for k,v in processor.component.config.descriptors.items() }))
+                f.write(dump_doc_descriptors(processor.component.config.descriptors))
         except FileExistsError:
             log.warn("Processor descriptors already exist for {}, skipping...".format(p))
 
 
-def _gen_doc_html(doc_dir):
+def doc_descriptor_path(doc_dir, package_id):
+    """
+    :returns: str The path of the yaml file with the property descriptors of a component type
+    """
+    return '{}.{}'.format(os.path.join(doc_dir, package_id), 'yaml')
+
+
+def dump_doc_descriptors(descriptors):
+    """
+    :param descriptors: The property descriptors of a component type
+    :type descriptors: dict(str:nipyapi.nifi.models.property_descriptor_dto.PropertyDescriptorDTO)
+    :returns: str The yaml content of the descriptors file
+    """
+    return yaml.safe_dump({k: v.to_dict() for k, v in descriptors.items()})
+
+
+def gen_doc_html(doc_dir, nifi_version=None):
+    """
+    :param nifi_version: The AboutDTO of the NiFi instance the docs were generated from, it is fetched if not provided
+    :type nifi_version: nipyapi.nifi.models.about_dto.AboutDTO
+    """
     log.info("Generating html helper docs at {}".format(doc_dir))
     context = {
         'flowlib_info': {
             'version': flowlib.__version__,
-            'nifi_version': flowlib.nifi.rest.get_nifi_rest_api_info().about
+            'nifi_version': nifi_version or flowlib.nifi.rest.get_nifi_rest_api_info().about
         },
         'reporting_tasks': [],
         'controller_services': [],
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+A local journal of the entities created by a deployment, so that a deployment which fails part way through can be
+  resumed by only creating what is missing. The journal is a json document per line, an entry is appended (and flushed)
+  as soon as each entity is created so that the journal is complete up to the last entity created before a failure
+"""
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from flowlib.exceptions import FlowLibException
+from flowlib.logger import log
+
+JOURNAL_VERSION = 1
+
+
+class DeployJournal:
+    def __init__(self, path, flow_name, fingerprint, entries=None, resumed=False):
+        """
+        :param path: The journal file
+        :type path: str
+        :param flow_name: The name of the flow being deployed
+        :type flow_name: str
+        :param fingerprint: The fingerprint of the flow being deployed, a deployment can only be resumed with the same flow
+        :type fingerprint: str
+        :param entries: The id and revision version of every journaled entity, keyed by (kind, path)
+        :type entries: dict((str, str):dict)
+        :param resumed: Whether the journal was loaded to resume a failed deployment
+        :type resumed: bool
+        """
+        self.path = path
+        self.flow_name = flow_name
+        self.fingerprint = fingerprint
+        self.entries = entries or dict()
+        self.resumed = resumed
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def journal_path(journal_dir, flow_name):
+        """
+        :returns: str The journal file of a flow
+        """
+        return os.path.join(journal_dir, "{}.jsonl".format(urllib.parse.quote(flow_name, safe='')))
+
+    @staticmethod
+    def start(journal_dir, flow):
+        """
+        Start a new journal for deploying the flow, replacing the journal of any previous deployment of the flow
+        :param journal_dir: The directory to write the journal to
+        :type journal_dir: str
+        :param flow: The initialized flow being deployed
+        :type flow: flowlib.model.flow.Flow
+        :returns: DeployJournal
+        """
+        os.makedirs(journal_dir, exist_ok=True)
+        journal = DeployJournal(DeployJournal.journal_path(journal_dir, flow.name), flow.name, flow.fingerprint)
+        with open(journal.path, 'w') as f:
+            f.write(json.dumps({
+                'version': JOURNAL_VERSION,
+                'flow': flow.name,
+                'fingerprint': journal.fingerprint,
+                'started': time.time()
+            }) + '\n')
+        return journal
+
+    @staticmethod
+    def load(journal_dir, flow):
+        """
+        Load the journal of a failed deployment of the flow
+        :param journal_dir: The directory the journal was written to
+        :type journal_dir: str
+        :param flow: The initialized flow being deployed
+        :type flow: flowlib.model.flow.Flow
+        :returns: DeployJournal
+        :raises: FlowLibException if there is no journal for the flow, or if the flow has changed since it was written
+        """
+        if not journal_dir:
+            raise FlowLibException("A journal_dir must be configured to resume a deployment")
+        path = DeployJournal.journal_path(journal_dir, flow.name)
+        if not os.path.isfile(path):
+            raise FlowLibException("No journal was found for {} at {}, there is no failed deployment to resume".format(flow.name, path))
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            raise FlowLibException("The journal {} is corrupt, the deployment can't be resumed".format(path))
+        if header.get('version') != JOURNAL_VERSION:
+            raise FlowLibException("The journal {} was written by an incompatible version of flowlib".format(path))
+        if header.get('fingerprint') != flow.fingerprint:
+            raise FlowLibException("{} has changed since the deployment failed, it can't be resumed".format(flow.name))
+
+        entries = dict()
+        for i, line in enumerate(lines[1:]):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last entry may have only been partially written when the deployment died
+                if i == len(lines) - 2:
+                    log.warning("Ignoring the partially written last entry of the journal {}".format(path))
+                    break
+                raise FlowLibException("The journal {} is corrupt, the deployment can't be resumed".format(path))
+            entries[(entry['kind'], entry['path'])] = entry
+        log.info("Loaded {} journaled entities of the failed deployment of {}".format(len(entries), flow.name))
+        return DeployJournal(path, flow.name, header['fingerprint'], entries, resumed=True)
+
+    def record(self, kind, path, entity):
+        """
+        Journal an entity created by the deployment
+        :param kind: The kind of the entity, e.g processor, controller_service or connection
+        :type kind: str
+        :param path: What the entity was created for, e.g the path of an element
+        :type path: str
+        :param entity: The NiFi entity returned by the api
+        """
+        entry = {
+            'kind': kind,
+            'path': path,
+            'id': entity.id,
+            'version': entity.revision.version if entity.revision else None
+        }
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.entries[(kind, path)] = entry
+
+    def get(self, kind, path):
+        """
+        :returns: dict The id and revision version of the journaled entity, or None if it was not journaled
+        """
+        with self._lock:
+            return self.entries.get((kind, path))
+
+    def remove(self):
+        """
+        Delete the journal once the deployment has completed
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return str({'path': self.path, 'flow': self.flow_name, 'entries': len(self.entries), 'resumed': self.resumed})
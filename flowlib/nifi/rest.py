@@ -1,22 +1,47 @@
 # -*- coding: utf-8 -*-
-import io
 import os
+import copy
 import json
 import yaml
 import time
 import re
+import statistics
 import uuid
+import tempfile
+import concurrent.futures
 
 import nipyapi
 import urllib3
 
+import flowlib.fingerprint
 import flowlib.layout
+import flowlib.nifi.deploy
 import flowlib.parser
+import flowlib.plan
+import flowlib.nifi.snapshot
+import flowlib.nifi.transport
+import flowlib.profile
 from flowlib.logger import log
+from flowlib.nifi.canvas import CanvasIndex
+from flowlib.nifi.journal import DeployJournal
 from flowlib.nifi.state import ZookeeperClient
 from flowlib.exceptions import FlowLibException, FlowNotFoundException
-from flowlib.model.deployment import FlowDeployment, DeployedComponent
-from flowlib.model.flow import InputPort, OutputPort, RemoteProcessGroup, ProcessGroup, Processor
+from flowlib.model.flow import Flow, InputPort, OutputPort, RemoteProcessGroup, ProcessGroup, Processor
+from flowlib.model.frozen import freeze
+
+# the name of a replaced flow which is kept so that the deployment can be rolled back, see config.keep_previous
+PREVIOUS_FLOW_NAME = "(previous-{}) {}"
+
+# the NiFi defaults of the connection settings, a setting which is no longer defined is reset to its default when a
+#  connection is updated in place
+_CONNECTION_DEFAULTS = {
+    'back_pressure_object_threshold': 10000,
+    'back_pressure_data_size_threshold': '1 GB',
+    'flow_file_expiration': '0 sec',
+    'load_balance_strategy': 'DO_NOT_LOAD_BALANCE',
+    'load_balance_compression': 'DO_NOT_COMPRESS',
+    'prioritizers': []
+}
 
 
 def get_nifi_rest_api_info():
@@ -30,13 +55,14 @@ def wait_for_nifi_api(nifi_endpoint, retries=12, delay=5):
     while i < retries:
         if nipyapi.utils.is_endpoint_up("{}/nifi".format(nifi_endpoint)):
             nipyapi.config.nifi_config.host = "{}/nifi-api".format(nifi_endpoint)
+            flowlib.nifi.transport.install(nipyapi.config.nifi_config)
             return
         i += 1
         time.sleep(delay)
     raise FlowLibException("Timeout reached while waiting for NiFi Rest API to be ready")
 
 
-def get_previous_deployment(nifi_endpoint, flow_name):
+def get_previous_deployment(nifi_endpoint, flow_name, config=None):
     """
     Get the currently deployed flow and its components
       (including processor state) from a running NiFi instance
@@ -44,6 +70,9 @@ def get_previous_deployment(nifi_endpoint, flow_name):
     :type nifi_endpoint: str
     :param flow_name: The name of the flow PG to get
     :type flow_name: str
+    :param config: If config.state_source is zookeeper, the processor state is read directly from NiFi's zookeeper
+      instead of from the NiFi api
+    :type config: FlowLibConfig
     :returns: flowlib.model.deployment.FlowDeployment
     """
     wait_for_nifi_api(nifi_endpoint)
@@ -54,32 +83,42 @@ def get_previous_deployment(nifi_endpoint, flow_name):
         log.warn("There are active flowfiles queued for this flow. Exporting or redeploying a flow with items enqueued may lead to dropped flowfiles")
 
     # load the deployment from the root PG comments
-    try:
-        deployment = FlowDeployment.from_dict(json.loads(flow_pg.component.comments))
-    except Exception as e:
-        log.error(e)
-        raise FlowLibException("Failed to serialize the previously deployed Flow")
-
-    # set state for flow canvas level stateful processors
-    for k,v in deployment.stateful_processors.items():
-        proc_id = v['processor_id']
+    deployment = flowlib.nifi.deploy.load_deployment(flow_pg)
+
+    # set state for the flow canvas level and component level stateful processors
+    processor_ids = [p['processor_id'] for p in flowlib.nifi.deploy.stateful_processors(deployment)]
+    if config and config.state_source == 'zookeeper':
+        log.info("Reading state for {} processors from zookeeper".format(len(processor_ids)))
+        with ZookeeperClient(config.zookeeper_connection, config.zookeeper_root_node, config.zookeeper_acl) as client:
+            states = client.get_processor_states(processor_ids)
+    else:
+        states = _get_processor_states(processor_ids)
+    flowlib.nifi.deploy.set_exported_state(deployment, states)
+
+    return deployment
+
+
+def _get_processor_states(processor_ids):
+    """
+    Get the cluster state of many processors from the NiFi api, the requests are made concurrently
+      using every connection of the http pool
+    :param processor_ids: The NiFi uuids of the processors
+    :type processor_ids: list(str)
+    :returns: dict(str:dict(str:str)) The state k,v pairs of each processor which has cluster state
+    """
+    def get_state(proc_id):
         state = nipyapi.nifi.apis.ProcessorsApi().get_state(proc_id).component_state.cluster_state
         if state and state.total_entry_count > 0:
-            deployment.stateful_processors[k]['state'] = { entry.key:entry.value for entry in state.state }
-        else:
-            log.info("Processor was specified as persisting state but no cluster state was found for {}, will not export state".format(proc_id))
-
-    # set state for component level stateful processors
-    for c in deployment.components:
-        for k,v in c.stateful_processors.items():
-            proc_id = v['processor_id']
-            state = nipyapi.nifi.apis.ProcessorsApi().get_state(proc_id).component_state.cluster_state
-            if state and state.total_entry_count > 0:
-                c.stateful_processors[k]['state'] = { entry.key:entry.value for entry in state.state }
-            else:
-                log.info("Processor was specified as persisting state but no cluster state was found for {}, will not export state".format(proc_id))
+            return { entry.key:entry.value for entry in state.state }
+        return None
 
-    return deployment
+    executor = _deploy_executor(flowlib.nifi.transport.settings()['pool_size'])
+    try:
+        states = _run_concurrently(executor, get_state, processor_ids)
+    finally:
+        if executor:
+            executor.shutdown()
+    return {proc_id: state for proc_id, state in zip(processor_ids, states) if state}
 
 
 def configure_flow_controller(nifi_endpoint, reporting_task_controllers, reporting_tasks,
@@ -126,6 +165,7 @@ def configure_flow_controller(nifi_endpoint, reporting_task_controllers, reporti
 def nifi_export(config):
     endpoint = f'{config.nifi_endpoint}/nifi-api'
     nipyapi.utils.set_endpoint(endpoint)
+    flowlib.nifi.transport.install(nipyapi.config.nifi_config)
 
     _pg = nipyapi.canvas.recurse_flow(pg_id=nipyapi.canvas.get_root_pg_id()).process_group_flow.to_dict()
 
@@ -142,6 +182,7 @@ def nifi_export(config):
 def nifi_import(config):
     endpoint = f'{config.nifi_endpoint}/nifi-api'
     nipyapi.utils.set_endpoint(endpoint)
+    flowlib.nifi.transport.install(nipyapi.config.nifi_config)
 
     pgi = nipyapi.nifi.apis.process_groups_api.ProcessGroupsApi()
 
@@ -223,7 +264,7 @@ def registry_export(registry_options):
     return flow_content
 
 
-def deploy_flow(flow, config, deployment=None, force=False):
+def deploy_flow(flow, config, deployment=None, force=False, incremental=False, resume=False):
     """
     Deploy a Flow to NiFi via the Rest api
     :param flow: An initialized Flow instance
@@ -237,102 +278,883 @@ def deploy_flow(flow, config, deployment=None, force=False):
     :type deployment: FlowDeployment
     :param force: Whether to overwrite a previously deployed data flow
     :type force: bool
+    :param incremental: Whether to update a previously deployed data flow in place by only applying
+      the changes between it and the new flow. A full deployment is done if the flow is not yet deployed
+    :type incremental: bool
+    :param resume: Whether to resume a failed deployment of the same flow from its journal in config.journal_dir,
+      only the entities which were not created by the failed deployment are created
+    :type resume: bool
     """
-    if not flow._is_initialized:
-        raise FlowLibException("Flow has not yet been initialized. Call flow.initialize() first")
-    if not flow._is_valid:
-        raise FlowLibException("Flow has not yet been validated. Call flow.validate() first")
-
-    wait_for_nifi_api(config.nifi_endpoint)
-    previous_deployment = deployment
-    try:
-        # if a deployment was not provided, then check to see if the flow is already deployed
-        # if it was provided and the flow already exists, then it will be overwritten if force is True
-        if not previous_deployment:
-            previous_deployment = get_previous_deployment(config.nifi_endpoint, flow.name)
-    except FlowNotFoundException:
-        pass
-
-    # create a new FlowDeployment
-    deployment = FlowDeployment(flow.raw)
-    for component in flow._loaded_components.values():
-        deployment.add_component(DeployedComponent(component.raw))
+    flowlib.nifi.deploy.check_flow(flow)
+    if resume and (incremental or config.snapshot_deploy):
+        raise FlowLibException("Only full deployments can be resumed, re-run an incremental or snapshot deployment instead")
 
-    canvas_root_id = nipyapi.canvas.get_root_pg_id()
-    canvas_root_pg = nipyapi.canvas.get_process_group(canvas_root_id, identifier_type='id')
-    log.info("Deploying {} to NiFi".format(flow.name))
-
-    previous_flow_pg = None
-    if previous_deployment:
+    with flowlib.profile.phase('prepare'):
+        wait_for_nifi_api(config.nifi_endpoint)
+        previous_deployment = deployment
         try:
-            previous_flow_pg = _find_flow_by_name(flow.name)
+            # if a deployment was not provided, then check to see if the flow is already deployed
+            # if it was provided and the flow already exists, then it will be overwritten if force is True
+            if not previous_deployment:
+                previous_deployment = get_previous_deployment(config.nifi_endpoint, flow.name, config)
         except FlowNotFoundException:
             pass
-        if previous_flow_pg:
-            log.info("Found ProcessGroup of previously deployed flow: {}".format(previous_flow_pg.id))
-        if previous_flow_pg and deployment:
-            log.info("An explicit FlowDeployment was provided for this deployment so any existing state will be overwritten if the --force flag is true")
+
+        # create a new FlowDeployment
+        deployment = flowlib.nifi.deploy.new_deployment(flow)
+
+        canvas_root_id = nipyapi.canvas.get_root_pg_id()
+        canvas_root_pg = nipyapi.canvas.get_process_group(canvas_root_id, identifier_type='id')
+        log.info("Deploying {} to NiFi".format(flow.name))
+
+        # read the canvas once so that existence checks for new elements don't each have to walk the whole canvas
+        canvas = CanvasIndex.from_canvas(canvas_root_id)
+
+        previous_flow_pg = None
+        if previous_deployment:
+            try:
+                previous_flow_pg = _find_flow_by_name(flow.name)
+            except FlowNotFoundException:
+                pass
+            if previous_flow_pg:
+                log.info("Found ProcessGroup of previously deployed flow: {}".format(previous_flow_pg.id))
+            if previous_flow_pg and deployment:
+                log.info("An explicit FlowDeployment was provided for this deployment so any existing state will be overwritten if the --force flag is true")
+
+        journal = None
+        if resume:
+            journal = DeployJournal.load(config.journal_dir, flow)
+        elif config.journal_dir and not incremental and not config.snapshot_deploy:
+            journal = DeployJournal.start(config.journal_dir, flow)
+
+    executor = _deploy_executor(config.deploy_concurrency)
+    if incremental and previous_flow_pg:
+        try:
+            _deploy_flow_incremental(flow, config, previous_flow_pg, canvas, deployment, previous_deployment, executor)
+        except:
+            # the flow is partially updated, rename it to failed and re-raise the exception
+            _rename_process_group("(failed) {}".format(flow.name), previous_flow_pg.id)
+            log.error("The incremental deployment of {0} failed, the partially updated flow was renamed to (failed) {0}".format(flow.name))
+            raise
+        finally:
+            if executor:
+                executor.shutdown()
+        with flowlib.profile.phase('save'):
+            deployment.config_fingerprints = flowlib.fingerprint.fingerprint_configs(flow)
+            _save_deployment(previous_flow_pg.id, deployment)
+        return
+    elif incremental:
+        log.info("{} has not been deployed yet, doing a full deployment".format(flow.name))
 
     flow_pg = None
     try:
         if previous_flow_pg and not force:
              raise FlowLibException("A flow with that name already exists, use the --force option to overwrite it")
 
-        # create a PG for the new flow
-        flow_pg_element = ProcessGroup(name="(deploying) {}".format(flow.name), _type="process_group", _parent_path=flow.name)
-        flow_pg = _create_process_group(flow_pg_element, canvas_root_pg, flowlib.layout.TOP_LEVEL_PG_LOCATION, deployment, is_flow_root=True)
-        flow.id = flow_pg.id
-
-        _create_controllers(flow, flow_pg)
-        # we have to wait until the controllers exist in NiFi before applying jinja templating
-        # because the controller() jinja helper needs to lookup controller IDs for injecting into the processor's properties
-        flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components)
-
-        _create_canvas_elements_recursive(flow._elements, flow_pg, config, deployment, previous_deployment)
-        #
-        _create_connections_recursive(flow, flow._elements)
-        _set_controllers_enabled(flow._controllers, enabled=True)
+        # lay out every process group before anything is created, so that creating the flow only waits on api calls
+        with flowlib.profile.phase('layout'):
+            positions = flowlib.layout.generate_flow_layout(flow, flowlib.nifi.deploy.layout_cache(config, deployment, previous_deployment),
+                config.layout_processes)
+        if config.snapshot_deploy:
+            flow_pg = _deploy_flow_snapshot(flow, config, canvas_root_pg, canvas, deployment, previous_deployment, positions)
+        else:
+            # create a PG for the new flow
+            with flowlib.profile.phase('controllers'):
+                if resume:
+                    flow_pg = _resume_flow_process_group(flow, deployment, canvas, journal)
+                else:
+                    flow_pg_element = ProcessGroup(name="(deploying) {}".format(flow.name), _type="process_group", _parent_path=flow.name)
+                    flow_pg = _create_process_group(flow_pg_element, canvas_root_pg, flowlib.layout.TOP_LEVEL_PG_LOCATION, deployment, canvas, is_flow_root=True)
+                    if journal:
+                        journal.record('process_group', flow.name, flow_pg)
+                flow.id = flow_pg.id
+
+                _create_controllers(flow, flow_pg, journal)
+            # we have to wait until the controllers exist in NiFi before applying jinja templating
+            # because the controller() jinja helper needs to lookup controller IDs for injecting into the processor's properties
+            with flowlib.profile.phase('elements'):
+                flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components)
+
+                _create_canvas_elements_recursive([(flow._elements, flow_pg)], config, canvas, deployment, previous_deployment, executor, positions, journal,
+                    flow.layout or flowlib.layout.DEFAULT_LAYOUT)
+            with flowlib.profile.phase('state'):
+                flowlib.nifi.deploy.migrate_state(config, deployment, previous_deployment)
+            #
+            with flowlib.profile.phase('connections'):
+                _create_connections(flow, canvas, executor, journal)
+        with flowlib.profile.phase('enable'):
+            _set_controllers_enabled(flow._controllers, enabled=True)
 
         if previous_flow_pg and force:
-            _remove_flow(previous_flow_pg.id, force=force)
+            with flowlib.profile.phase('remove'):
+                if config.keep_previous:
+                    _retain_flow(flow.name, previous_flow_pg.id, config.keep_previous, canvas_root_id)
+                else:
+                    _remove_flow(previous_flow_pg.id, force=force)
 
     except:
         # rename new flow to failed and re-raise the exception
         if flow_pg:
             _rename_process_group("(failed) {}".format(flow.name), flow_pg.id)
+            if journal:
+                log.error("The deployment of {} failed, it can be resumed with --resume".format(flow.name))
         raise
+    finally:
+        if executor:
+            executor.shutdown()
+
+    with flowlib.profile.phase('save'):
+        # we finished creating the new flow without errors so replace the old one
+        _rename_process_group(flow.name, flow_pg.id)
 
-    # we finished creating the new flow without errors so replace the old one
-    _rename_process_group(flow.name, flow_pg.id)
+        _layout_top_level_groups(canvas_root_id)
+        deployment.config_fingerprints = flowlib.fingerprint.fingerprint_configs(flow)
+        _save_deployment(flow_pg.id, deployment)
 
-    # find all deployed flows and re-organize the top level PGs
+    if journal:
+        journal.remove()
+
+
+def _layout_top_level_groups(canvas_root_id):
+    """
+    Find all deployed flows and re-organize the top level PGs
+    :param canvas_root_id: The NiFi uuid of the root process group of the canvas
+    :type canvas_root_id: str
+    """
     pgs = nipyapi.nifi.ProcessGroupsApi().get_process_groups(canvas_root_id).process_groups
-    log.info("Found {} deployed flows, updating top level canvas layout.".format(len(pgs)))
-    pgs = sorted(pgs, key=lambda e: e.component.name)
-    positions = flowlib.layout.generate_top_level_pg_positions(pgs)
-    for pg in pgs:
-        pg.component.position = positions.get(pg.component.name, flowlib.layout.DEFAULT_POSITION)
+    for pg in flowlib.nifi.deploy.layout_top_level_groups(pgs):
         log.info("Setting position for {} to {}".format(pg.component.name, pg.position))
         nipyapi.nifi.apis.ProcessGroupsApi().update_process_group(pg.id, pg)
 
-    # re-fetch the deployed flow PG
-    flow_pg = nipyapi.canvas.get_process_group(flow_pg.id, identifier_type='id')
 
-    # write deployment to buffer
-    s = io.StringIO()
-    deployment.save(s)
+def rollback_flow(config, flow_name):
+    """
+    Swap a deployed flow with the flow it replaced, which was kept by deploying with keep_previous. The deployed flow is
+      stopped, its controller services are disabled and it is kept as the previous flow, so rolling back again restores it.
+      The state of the stateful processors is migrated to the restored flow, which is started if the deployed flow was running
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param flow_name: The name of the deployed flow
+    :type flow_name: str
+    """
+    # the state of the deployed flow is exported with it
+    current_deployment = get_previous_deployment(config.nifi_endpoint, flow_name, config)
+    canvas_root_id = nipyapi.canvas.get_root_pg_id()
+    flow_pg = nipyapi.canvas.get_process_group(_find_flow_by_name(flow_name).id, identifier_type='id')
+    previous_pg = _find_previous_flows(flow_name, canvas_root_id).get(1)
+    if not previous_pg:
+        raise FlowLibException("No previous deployment of {} was kept, it can't be rolled back".format(flow_name))
+
+    log.info("Rolling back {} to ProcessGroup {}".format(flow_name, previous_pg.id))
+    running = bool(flow_pg.running_count)
+    restored = False
+    try:
+        with flowlib.profile.phase('stop'):
+            nipyapi.canvas.schedule_process_group(flow_pg.id, False)
+            _set_controllers_enabled(_flow_controllers(flow_pg.id), enabled=False)
+            # the names stay unique while the flows are swapped
+            _rename_process_group("(rolling back) {}".format(flow_name), flow_pg.id)
+
+        with flowlib.profile.phase('state'):
+            flowlib.nifi.deploy.migrate_state(config, flowlib.nifi.deploy.load_deployment(previous_pg), current_deployment)
+
+        with flowlib.profile.phase('start'):
+            _set_controllers_enabled(_flow_controllers(previous_pg.id), enabled=True)
+            _rename_process_group(flow_name, previous_pg.id)
+            restored = True
+            _rename_process_group(PREVIOUS_FLOW_NAME.format(1, flow_name), flow_pg.id)
+            if running:
+                nipyapi.canvas.schedule_process_group(previous_pg.id, True)
+    except:
+        # put the deployed flow back the way it was, so that it keeps running and can be found by its name
+        log.error("Failed to roll back {}, restoring ProcessGroup {}".format(flow_name, flow_pg.id))
+        nipyapi.canvas.schedule_process_group(previous_pg.id, False)
+        _set_controllers_enabled([c for c in _flow_controllers(previous_pg.id) if c.component.state != 'DISABLED'], enabled=False)
+        if restored:
+            _rename_process_group(PREVIOUS_FLOW_NAME.format(1, flow_name), previous_pg.id)
+        _rename_process_group(flow_name, flow_pg.id)
+        _set_controllers_enabled([c for c in _flow_controllers(flow_pg.id) if c.component.state != 'ENABLED'], enabled=True)
+        if running:
+            nipyapi.canvas.schedule_process_group(flow_pg.id, True)
+        raise
+
+    with flowlib.profile.phase('save'):
+        _layout_top_level_groups(canvas_root_id)
+
 
-    # save in NiFi instance PG comments
-    s.seek(0)
-    flow_pg.component.comments = s.read()
-    nipyapi.nifi.apis.ProcessGroupsApi().update_process_group(flow_pg.id, flow_pg)
+def _retain_flow(flow_name, flow_pg_id, keep_previous, canvas_root_id):
+    """
+    Keep the process group of a replaced flow instead of removing it, so that the deployment can be rolled back.
+      The flow is stopped and its controller services are disabled, its queues and processor state are left intact.
+      The flows kept by previous deployments are renamed to make room, and the oldest are removed
+    :param flow_name: The name of the flow
+    :type flow_name: str
+    :param flow_pg_id: The NiFi uuid of the process group of the replaced flow
+    :type flow_pg_id: str
+    :param keep_previous: How many replaced flows to keep
+    :type keep_previous: int
+    :param canvas_root_id: The NiFi uuid of the root process group of the canvas
+    :type canvas_root_id: str
+    """
+    retained = _find_previous_flows(flow_name, canvas_root_id)
+    for k in sorted(retained.keys(), reverse=True):
+        if k >= keep_previous:
+            log.info("Removing {}".format(retained[k].component.name))
+            _remove_flow(retained[k].id, force=True)
+        else:
+            _rename_process_group(PREVIOUS_FLOW_NAME.format(k + 1, flow_name), retained[k].id)
 
+    log.info("Keeping the replaced flow as {}".format(PREVIOUS_FLOW_NAME.format(1, flow_name)))
+    nipyapi.canvas.schedule_process_group(flow_pg_id, False)
+    _set_controllers_enabled(_flow_controllers(flow_pg_id), enabled=False)
+    _rename_process_group(PREVIOUS_FLOW_NAME.format(1, flow_name), flow_pg_id)
+
+
+def _find_previous_flows(flow_name, canvas_root_id):
+    """
+    :param flow_name: The name of the flow
+    :type flow_name: str
+    :param canvas_root_id: The NiFi uuid of the root process group of the canvas
+    :type canvas_root_id: str
+    :returns: dict(int:ProcessGroupEntity) The process groups of the replaced flows kept by previous deployments,
+      keyed by how many deployments ago they were replaced
+    """
+    pattern = re.compile(r'^\(previous-(\d+)\) {}$'.format(re.escape(flow_name)))
+    retained = dict()
+    for pg in nipyapi.nifi.ProcessGroupsApi().get_process_groups(canvas_root_id).process_groups:
+        match = pattern.match(pg.component.name)
+        if match:
+            retained[int(match.group(1))] = pg
+    return retained
 
-def _get_nifi_entity_by_id(kind, identifier):
+
+def _flow_controllers(flow_pg_id):
+    """
+    :param flow_pg_id: The NiFi uuid of a flow's process group
+    :type flow_pg_id: str
+    :returns: list(ControllerServiceEntity) The controller services of the flow
+    """
+    controllers = nipyapi.canvas.list_all_by_kind('controllers', pg_id=flow_pg_id, descendants=False)
+    if controllers and not isinstance(controllers, list):
+        controllers = [controllers]
+    return controllers or list()
+
+
+def _resume_flow_process_group(flow, current_deployment, canvas, journal):
+    """
+    Find the process group of the failed deployment being resumed, and mark it as deploying again
+    :param flow: The flow being deployed
+    :type flow: flowlib.model.flow.Flow
+    :param current_deployment: The current flow deployment
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
+    :param journal: The journal of the failed deployment
+    :type journal: flowlib.nifi.journal.DeployJournal
+    :returns: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    """
+    entry = journal.get('process_group', flow.name)
+    flow_pg = canvas.get_by_id(entry['id']) if entry else None
+    if not flow_pg:
+        raise FlowLibException("The process group of the failed deployment of {} was not found, it can't be resumed".format(flow.name))
+
+    log.info("Resuming the deployment of {} in ProcessGroup {}".format(flow.name, flow_pg.id))
+    name = "(deploying) {}".format(flow.name)
+    if flow_pg.component.name != name:
+        _rename_process_group(name, flow_pg.id)
+    current_deployment.root_group_id = flow_pg.id
+    return flow_pg
+
+
+def _resumed_entity(el, parent_pg, canvas, journal):
+    """
+    Find the entity of an element which was already created by the failed deployment being resumed
+    :param el: The element to deploy
+    :type el: model.FlowElement
+    :param parent_pg: The process group the element is created in
+    :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
+    :param journal: The journal of the failed deployment
+    :type journal: flowlib.nifi.journal.DeployJournal
+    :returns: The NiFi entity, or None if the element still has to be created
+    :raises: FlowLibException if the entity was changed since it was created
+    """
+    path = flowlib.plan.element_path(el)
+    entry = journal.get(el.type, path)
+    entity = canvas.get_by_id(entry['id']) if entry else None
+    if entity is None and not isinstance(el, RemoteProcessGroup):
+        # the entity may have been created right before the deployment failed, without being journaled
+        entity = canvas.get(el.type, "{}/{}".format(el.name, parent_pg.id))
+        if entity:
+            log.warning("{} was created but not journaled by the failed deployment, resuming with it".format(path))
+    elif entity and entity.revision and entity.revision.version != entry['version']:
+        raise FlowLibException("{} was changed since the deployment failed, use --force to re-deploy the flow".format(path))
+    return entity
+
+
+def plan_deploy(flow, config, deployment=None, force=False, incremental=False):
+    """
+    Plan the deployment of a Flow without changing anything on the NiFi canvas. The canvas is only read, and the
+      latency of those reads is used to estimate how long the deployment would take
+    :param flow: An initialized Flow instance
+    :type flow: flowlib.model.flow.Flow
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param deployment: The deployment to use instead of the currently deployed flow, see deploy_flow
+    :type deployment: FlowDeployment
+    :param force: Whether the deployment would overwrite a previously deployed data flow
+    :type force: bool
+    :param incremental: Whether the deployment would update a previously deployed data flow in place
+    :type incremental: bool
+    :returns: (list(flowlib.plan.Operation), float) The operations the deployment would make in order, and its
+      estimated duration in seconds
+    """
+    flowlib.nifi.deploy.check_flow(flow)
+
+    # the reads are always timed, the recording is only kept if profiling was already enabled
+    recording = flowlib.profile.profiler()
+    profiler = recording or flowlib.profile.enable()
+    first = len(profiler.calls)
+    try:
+        with flowlib.profile.phase('prepare'):
+            wait_for_nifi_api(config.nifi_endpoint)
+            previous_deployment = deployment
+            try:
+                if not previous_deployment:
+                    previous_deployment = get_previous_deployment(config.nifi_endpoint, flow.name, config)
+            except FlowNotFoundException:
+                pass
+
+            # the deployment reads the whole canvas before creating anything
+            canvas_root_id = nipyapi.canvas.get_root_pg_id()
+            nipyapi.canvas.get_process_group(canvas_root_id, identifier_type='id')
+            CanvasIndex.from_canvas(canvas_root_id)
+
+            previous_flow_pg = None
+            if previous_deployment:
+                try:
+                    previous_flow_pg = _find_flow_by_name(flow.name)
+                except FlowNotFoundException:
+                    pass
+
+        with flowlib.profile.phase('plan'):
+            operations = _plan_operations(flow, config, canvas_root_id, previous_flow_pg, previous_deployment, force, incremental)
+    finally:
+        if not recording:
+            flowlib.profile.disable()
+
+    calls = profiler.calls[first:]
+    latencies = dict()
+    for c in calls:
+        latencies.setdefault((c['method'], c['endpoint']), list()).append(c['seconds'])
+    latencies = {k: statistics.median(v) for k, v in latencies.items()}
+    default_latency = statistics.median([c['seconds'] for c in calls]) if calls else 0
+    # the deployment makes the same reads, and then the operations
+    seconds = sum(c['seconds'] for c in calls) + flowlib.plan.estimate_seconds(operations, latencies, default_latency,
+        max(1, config.deploy_concurrency or 1))
+    log.info("Planned {} operations for deploying {}".format(len(operations), flow.name))
+    return operations, seconds
+
+
+def _plan_operations(flow, config, canvas_root_id, previous_flow_pg=None, previous_deployment=None, force=False, incremental=False):
+    """
+    :returns: list(flowlib.plan.Operation) The operations that deploy_flow would make
+    """
+    state_node = '{}/components'.format(config.zookeeper_root_node)
+    if incremental and previous_flow_pg:
+        plan, _ = _plan_incremental_deploy(flow, previous_flow_pg, flowlib.nifi.deploy.new_deployment(flow))
+        added_paths = plan.added_paths()
+        recreated = set(el.id for path, el in flowlib.plan.element_paths(plan.removed).items()
+            if path in added_paths and isinstance(el, Processor))
+        return flowlib.plan.incremental_operations(flow, plan, _elements_to_stop(plan),
+            _count_migrated_states(previous_deployment, recreated), state_node)
+    elif incremental:
+        log.info("{} has not been deployed yet, doing a full deployment".format(flow.name))
+
+    if previous_flow_pg and not force:
+        raise FlowLibException("A flow with that name already exists, use the --force option to overwrite it")
+
+    def contents(pg_id):
+        connections = nipyapi.canvas.list_all_connections(pg_id=pg_id, descendants=True)
+        return [c.id for c in connections], [c.component.name for c in _flow_controllers(pg_id)]
+
+    replaced = None
+    retained = dict()
+    if previous_flow_pg:
+        replaced = contents(previous_flow_pg.id)
+        if config.keep_previous:
+            retained = {k: contents(pg.id) if k >= config.keep_previous else None
+                for k, pg in _find_previous_flows(flow.name, canvas_root_id).items()}
+
+    # the replaced flow is removed (or kept) before the top level process groups are laid out
+    pgs = nipyapi.nifi.ProcessGroupsApi().get_process_groups(canvas_root_id).process_groups
+    top_level_groups = len(pgs) + 1
+    if previous_flow_pg:
+        top_level_groups -= len([k for k in retained if k >= config.keep_previous]) if config.keep_previous else 1
+    return flowlib.plan.deploy_operations(flow, replaced, top_level_groups, _count_migrated_states(previous_deployment),
+        config.snapshot_deploy, state_node, config.keep_previous, retained)
+
+
+def _count_migrated_states(previous_deployment, processor_ids=None):
+    """
+    :param previous_deployment: The previous flow deployment, with the exported state of its stateful processors
+    :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    :param processor_ids: Only count the state of these processors, the state of all processors is counted if None
+    :type processor_ids: set(str)
+    :returns: int The number of processors whose state would be migrated
+    """
+    if not previous_deployment:
+        return 0
+    return len([p for p in flowlib.nifi.deploy.stateful_processors(previous_deployment)
+        if p.get('state') and (processor_ids is None or p['processor_id'] in processor_ids)])
+
+
+def _deploy_flow_incremental(flow, config, flow_pg, canvas, current_deployment, previous_deployment=None, executor=None):
+    """
+    Update a previously deployed flow in place by only applying the changes between the deployed flow
+      and the new flow. Unchanged elements are left running and their queues and state are left intact
+    :param flow: An initialized Flow instance
+    :type flow: flowlib.model.flow.Flow
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param flow_pg: The process group of the previously deployed flow
+    :type flow_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
+    :param current_deployment: The current flow deployment
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :param previous_deployment: The previous flow deployment, used for migrating the state of re-created processors
+    :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    :param executor: A worker pool for creating elements concurrently, elements are created serially if None
+    :type executor: concurrent.futures.Executor
+    """
+    with flowlib.profile.phase('plan'):
+        plan, deployed_elements = _plan_incremental_deploy(flow, flow_pg, current_deployment)
+        if plan.is_empty():
+            log.info("No changes found for {}".format(flow.name))
+        else:
+            log.info("Incrementally deploying {}: {}".format(flow.name, plan))
+        removed_paths = set(flowlib.plan.element_paths(plan.removed).keys())
+
+    with flowlib.profile.phase('stop'):
+        # only the components which are changed or have connections changing need to be stopped
+        stopped = _schedule_elements(_elements_to_stop(plan), running=False)
+
+    with flowlib.profile.phase('remove'):
+        if plan.connections_removed or plan.connections_updated:
+            deployed_connections = nipyapi.canvas.list_all_connections(flow_pg.id, descendants=True)
+            for source, dest, c, _ in plan.connections_removed:
+                for entity in [e for e in deployed_connections if _is_deployed_connection(e, source, dest, c)]:
+                    log.info("Deleting connection from {} to {}".format(flowlib.plan.element_path(source), flowlib.plan.element_path(dest)))
+                    if entity.status and entity.status.aggregate_snapshot and entity.status.aggregate_snapshot.flow_files_queued:
+                        log.warning("Dropping {} queued flowfiles from connection {}".format(entity.status.aggregate_snapshot.flow_files_queued, entity.id))
+                    nipyapi.canvas.delete_connection(entity, purge=True)
+
+        for el in plan.removed:
+            path = flowlib.plan.element_path(el)
+            if path not in deployed_elements:
+                log.warning("{} was not found on the NiFi canvas, nothing to remove".format(path))
+                continue
+            log.info("Deleting {}: {}".format(el.type, path))
+            kind, entity = deployed_elements[path]
+            if kind == 'process_group':
+                nipyapi.canvas.delete_process_group(entity, force=True)
+            elif kind == 'processor':
+                nipyapi.canvas.delete_processor(entity, force=True)
+            elif kind == 'remote_process_group':
+                nipyapi.canvas.delete_remote_process_group(entity)
+            else:
+                nipyapi.canvas.delete_port(_get_nifi_entity_by_id(kind, entity.id))
+            canvas.remove(kind, entity)
+
+    with flowlib.profile.phase('update'):
+        for previous, el in plan.updated:
+            log.info("Updating Processor: {}".format(flowlib.plan.element_path(el)))
+            update = copy.copy(el.config)
+            # properties which are no longer defined have to be explicitly unset
+            update.properties = dict({k: None for k in previous.config.properties}, **el.config.properties)
+            nipyapi.canvas.update_processor(_get_nifi_entity_by_id('processor', el.id), update)
+        for (source, dest, previous, _), (_, _, c, _) in plan.connections_updated:
+            log.info("Updating connection from {} to {}".format(flowlib.plan.element_path(source), flowlib.plan.element_path(dest)))
+            for entity in [e for e in deployed_connections if _is_deployed_connection(e, source, dest, previous)]:
+                _update_connection(entity, c)
+
+    with flowlib.profile.phase('elements'):
+        # create the new elements in their existing parent process groups
+        groups = dict()
+        positions = dict()
+        layout_type = flow.layout or flowlib.layout.DEFAULT_LAYOUT
+        layouts = flowlib.nifi.deploy.layout_cache(config, current_deployment, previous_deployment)
+        # the elements of added process groups are laid out the same way a full deployment lays them out
+        pending = list()
+        for el in plan.added:
+            parent = flow.get_parent_element(el)
+            if el.parent_path not in groups:
+                parent_pg = flow_pg if isinstance(parent, Flow) else deployed_elements[el.parent_path][1]
+                groups[el.parent_path] = (dict(), parent_pg)
+                pending.append(parent)
+            groups[el.parent_path][0][el.name] = el
+            if isinstance(el, ProcessGroup):
+                pending.extend(e for e in flowlib.plan.element_paths(el._elements).values() if isinstance(e, ProcessGroup))
+                pending.append(el)
+        for group in pending:
+            if group._elements:
+                layout = layouts.get_layout(group._elements, layout_type)
+                positions.update({flowlib.plan.element_path(e): layout[e.name] for e in group._elements.values()})
+        if groups:
+            _create_canvas_elements_recursive(list(groups.values()), config, canvas, current_deployment, previous_deployment, executor,
+                positions, layout_type=layout_type)
+    with flowlib.profile.phase('state'):
+        # processors which were not re-created keep their state
+        flowlib.nifi.deploy.migrate_state(config, current_deployment, previous_deployment)
+
+    with flowlib.profile.phase('connections'):
+        log.info("Creating {} connections".format(len(plan.connections_added)))
+        _run_concurrently(executor, lambda c: _create_connection(c[0], c[1], c[2], c[3].id, canvas), plan.connections_added)
+
+    with flowlib.profile.phase('start'):
+        # restart the components that were running before, except for the ones that were removed
+        _schedule_elements([el for el in stopped if flowlib.plan.element_path(el) not in removed_paths], running=True)
+
+
+def _plan_incremental_deploy(flow, flow_pg, current_deployment):
+    """
+    Diff a previously deployed flow with the new flow, and match the elements of both flows with the entities on the canvas.
+      Nothing on the canvas is changed
+    :param flow: An initialized Flow instance, its processor properties are templated
+    :type flow: flowlib.model.flow.Flow
+    :param flow_pg: The process group of the previously deployed flow
+    :type flow_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param current_deployment: The current flow deployment, the stateful processors which are not re-created are recorded in it
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :returns: (flowlib.plan.DeployPlan, dict(str:(str, entity))) The changes to make, and the kind and entity of each deployed element by path
+    """
+    # always diff against the flow that is actually deployed, even if an explicit deployment was provided
+    deployed = flowlib.nifi.deploy.load_deployment(flow_pg)
+    if deployed.flow.get('controller_services') != flow.raw.get('controller_services'):
+        raise FlowLibException("The controller services of {} have changed, use --force to re-deploy the flow".format(flow.name))
+
+    previous_raw = freeze(deployed.flow)
+    previous_flow = Flow(previous_raw, **previous_raw)
+    previous_flow.initialize(with_components=deployed.components)
+
+    flow.id = flow_pg.id
+    previous_flow.id = flow_pg.id
+    current_deployment.root_group_id = flow_pg.id
+
+    # the controller services are unchanged, so re-use the ones that are already deployed
+    controllers = {c.component.name: c for c in nipyapi.canvas.list_all_controllers(flow_pg.id, descendants=False)
+        if c.component.parent_group_id == flow_pg.id}
+    for c in previous_flow._controllers + flow._controllers:
+        if c.name not in controllers:
+            raise FlowLibException("Controller service {} of {} was not found, use --force to re-deploy the flow".format(c.name, flow.name))
+        c.id = controllers[c.name].id
+        c.parent_id = flow_pg.id
+
+    # the new flow is compared with the rendered processor configs that were actually deployed. Flows deployed by older
+    #  versions of flowlib didn't save them, so their processor properties are rendered again with the current env
+    if not deployed.config_fingerprints:
+        flowlib.parser.replace_flow_element_vars_recursive(previous_flow, previous_flow._elements, previous_flow.components)
+    flowlib.parser.env.globals.update(**flow.global_vars)
+    flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components)
+
+    plan = flowlib.plan.diff_flows(previous_flow, flow, deployed.config_fingerprints)
+
+    # match the elements of both flows with the entities on the canvas
+    deployed_elements = _get_deployed_elements(flow.name, nipyapi.canvas.recurse_flow(flow_pg.id).process_group_flow.flow)
+    for path, el in flowlib.plan.element_paths(previous_flow._elements).items():
+        if path in deployed_elements:
+            el.id = deployed_elements[path][1].id
+            el.parent_id = deployed_elements[path][1].component.parent_group_id
+
+    added_paths = plan.added_paths()
+    for path, el in flowlib.plan.element_paths(flow._elements).items():
+        if path in added_paths:
+            continue
+        if path not in deployed_elements:
+            raise FlowLibException("{} was not found on the NiFi canvas, use --force to re-deploy the flow".format(path))
+        kind, entity = deployed_elements[path]
+        el.id = entity.id
+        el.parent_id = entity.component.parent_group_id
+        if isinstance(el, Processor) and entity.component.persists_state:
+            flowlib.nifi.deploy.record_stateful_processor(el, entity, current_deployment)
+
+    return plan, deployed_elements
+
+
+def _elements_to_stop(plan):
+    """
+    Only the components which are changed or have connections changing need to be stopped during an incremental deployment
+    :type plan: flowlib.plan.DeployPlan
+    :returns: list(FlowElement) The deployed elements to stop
+    """
+    added_paths = plan.added_paths()
+    removed_paths = set(flowlib.plan.element_paths(plan.removed).keys())
+    stop = dict()
+    for _, el in plan.updated:
+        stop[el.id] = el
+    for source, dest, _, _ in plan.connections_removed:
+        for el in (source, dest):
+            if el.id and flowlib.plan.element_path(el) not in removed_paths:
+                stop[el.id] = el
+    for source, _, _, _ in plan.connections_added:
+        if flowlib.plan.element_path(source) not in added_paths:
+            stop[source.id] = source
+    for el in plan.removed:
+        if el.id and isinstance(el, (Processor, InputPort, OutputPort)):
+            stop[el.id] = el
+    return list(stop.values())
+
+
+def _deploy_flow_snapshot(flow, config, parent_pg, canvas, current_deployment, previous_deployment=None, positions=None):
+    """
+    Create the whole flow with a single upload by compiling it into a NiFi VersionedFlowSnapshot,
+      then read the created flow back once to record the NiFi ids of its elements
+    :param flow: An initialized Flow instance
+    :type flow: flowlib.model.flow.Flow
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    :param parent_pg: The process group in which to create the flow
+    :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
+    :param current_deployment: The current flow deployment
+    :type current_deployment: flowlib.model.deployment.FlowDeployment
+    :param previous_deployment: The previous flow deployment
+    :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    :param positions: The (x,y) positions of every element of the flow keyed by element path, generated if None
+    :type positions: dict(str:tuple)
+    :returns: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity The process group of the new flow
+    """
+    # the controllers don't exist yet, so controller() lookups reference the controllers within the snapshot
+    flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components,
+        controller_id=flowlib.nifi.snapshot.controller_versioned_id)
+
+    name = "(deploying) {}".format(flow.name)
+    if not positions:
+        with flowlib.profile.phase('layout'):
+            positions = flowlib.layout.generate_flow_layout(flow, flowlib.nifi.deploy.layout_cache(config, current_deployment, previous_deployment),
+                config.layout_processes)
+    with flowlib.profile.phase('elements'):
+        snapshot = flowlib.nifi.snapshot.compile_flow(flow, name, _get_bundles(), positions)
+        flow_pg = _upload_flow_snapshot(parent_pg.id, name, snapshot, flowlib.layout.TOP_LEVEL_PG_LOCATION)
+        canvas.add('process_group', flow_pg)
+        flow.id = flow_pg.id
+        current_deployment.root_group_id = flow_pg.id
+
+        controllers = {c.component.name: c for c in nipyapi.canvas.list_all_controllers(flow_pg.id, descendants=False)
+            if c.component.parent_group_id == flow_pg.id}
+        for c in flow._controllers:
+            c.id = controllers[c.name].id
+            c.parent_id = flow_pg.id
+        # NiFi replaced the snapshot ids of the controllers when the snapshot was uploaded, so do the same to the
+        #  processor properties so that they match the deployed processors
+        _replace_controller_ids(flow, {flowlib.nifi.snapshot.controller_versioned_id(c): c.id for c in flow._controllers})
+
+        deployed_elements = _get_deployed_elements(flow.name, nipyapi.canvas.recurse_flow(flow_pg.id).process_group_flow.flow)
+        for path, el in flowlib.plan.element_paths(flow._elements).items():
+            if path not in deployed_elements:
+                raise FlowLibException("{} was not created from the uploaded flow snapshot".format(path))
+            kind, entity = deployed_elements[path]
+            canvas.add(kind, entity)
+            el.id = entity.id
+            el.parent_id = entity.component.parent_group_id
+            if isinstance(el, Processor) and entity.component.persists_state:
+                flowlib.nifi.deploy.record_stateful_processor(el, entity, current_deployment)
+    with flowlib.profile.phase('state'):
+        flowlib.nifi.deploy.migrate_state(config, current_deployment, previous_deployment)
+
+    return flow_pg
+
+
+def _replace_controller_ids(flow, ids):
+    """
+    Replace the controller ids injected into the processor properties of a flow by controller() lookups
+    :param flow: An initialized Flow instance, its processor properties are templated
+    :type flow: flowlib.model.flow.Flow
+    :param ids: The ids to inject keyed by the ids to replace
+    :type ids: dict(str:str)
+    """
+    for el in flowlib.plan.element_paths(flow._elements).values():
+        if isinstance(el, Processor) and el.config.properties:
+            properties = dict()
+            for k, v in el.config.properties.items():
+                if isinstance(v, str):
+                    for versioned_id, controller_id in ids.items():
+                        v = v.replace(versioned_id, controller_id)
+                properties[k] = v
+            el.config.properties = properties
+
+
+def _get_bundles():
+    """
+    :returns: dict(str:dict) The bundle coordinates of every processor and controller service type available in NiFi
+    """
+    types = nipyapi.nifi.FlowApi().get_processor_types().processor_types \
+        + nipyapi.nifi.FlowApi().get_controller_service_types().controller_service_types
+    return {t.type: t.bundle.to_dict() for t in types}
+
+
+def _upload_flow_snapshot(parent_pg_id, name, snapshot, position):
+    """
+    Create a process group from a flow snapshot
+    :param parent_pg_id: The NiFi uuid of the process group in which to create the new process group
+    :type parent_pg_id: str
+    :param name: The name of the new process group
+    :type name: str
+    :param snapshot: A VersionedFlowSnapshot
+    :type snapshot: dict
+    :param position: The (x,y) position of the new process group
+    :type position: tuple
+    :returns: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    """
+    log.info("Uploading flow snapshot: {}".format(name))
+    # nipyapi only supports uploading files from disk
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json') as f:
+        json.dump(snapshot, f)
+        f.flush()
+
+        api_client = nipyapi.nifi.ProcessGroupsApi().api_client
+        return api_client.call_api('/process-groups/{id}/process-groups/upload', 'POST',
+            path_params={'id': parent_pg_id},
+            header_params={'Accept': 'application/json', 'Content-Type': 'multipart/form-data'},
+            post_params=[
+                ('groupName', name),
+                ('positionX', str(float(position[0]))),
+                ('positionY', str(float(position[1]))),
+                ('clientId', str(uuid.uuid4()))
+            ],
+            files={'file': f.name},
+            response_type='ProcessGroupEntity',
+            auth_settings=['tokenAuth', 'basicAuth'],
+            _return_http_data_only=True
+        )
+
+
+def _get_deployed_elements(parent_path, flow_dto):
+    """
+    Map the path of each element of a deployed flow to its entity on the NiFi canvas
+    :param parent_path: The path of the process group containing the flow_dto
+    :type parent_path: str
+    :param flow_dto: A flow returned by nipyapi.canvas.recurse_flow()
+    :type flow_dto: nipyapi.nifi.models.flow_dto.FlowDTO
+    :returns: dict(str:(str, entity)) of {element_path: (kind, entity)}
+    """
+    deployed = dict()
+    kinds = [
+        ('process_group', flow_dto.process_groups),
+        ('processor', flow_dto.processors),
+        ('input_port', flow_dto.input_ports),
+        ('output_port', flow_dto.output_ports),
+        ('remote_process_group', flow_dto.remote_process_groups)
+    ]
+    for kind, entities in kinds:
+        for e in entities or []:
+            # elements are named name/parent_id on the canvas and element names can't contain the delimeter
+            path = "{}{}{}".format(parent_path, Flow.PG_NAME_DELIMETER, e.component.name.split(Flow.PG_NAME_DELIMETER)[0])
+            deployed[path] = (kind, e)
+            child = getattr(e, 'nipyapi_extended', None)
+            if kind == 'process_group' and child:
+                deployed.update(_get_deployed_elements(path, child.process_group_flow.flow))
+    return deployed
+
+
+def _is_deployed_connection(entity, source_element, dest_element, c):
+    """
+    :param entity: A connection on the NiFi canvas
+    :type entity: nipyapi.nifi.models.connection_entity.ConnectionEntity
+    :returns: bool Whether the connection entity was created for the connection c between source_element and dest_element
+    """
+    def is_element(connectable, element, port):
+        # connections to a RPG are made to the ports of the remote instance
+        if isinstance(element, RemoteProcessGroup):
+            return connectable.group_id == element.id and connectable.name == port
+        return connectable.id == element.id
+
+    component = entity.component
+    return component.name == c.name \
+        and is_element(component.source, source_element, c.from_port) \
+        and is_element(component.destination, dest_element, c.to_port) \
+        and sorted(component.selected_relationships or []) == sorted(c.relationships or [])
+
+
+def _update_connection(entity, c):
+    """
+    Update the settings of a connection on the NiFi canvas in place, so that its queue is kept
+    :param entity: The connection on the NiFi canvas
+    :type entity: nipyapi.nifi.models.connection_entity.ConnectionEntity
+    :param c: The new definition of the connection, its source, destination and relationships are unchanged
+    :type c: flowlib.model.flow.Connection
+    :returns: nipyapi.nifi.models.connection_entity.ConnectionEntity
+    """
+    settings = dict(_CONNECTION_DEFAULTS, **{k: v for k, v in c.as_dict().items() if k in _CONNECTION_DEFAULTS and v is not None})
+    return nipyapi.nifi.ConnectionsApi().update_connection(entity.id, nipyapi.nifi.ConnectionEntity(
+        revision=entity.revision,
+        source_type=entity.source_type,
+        destination_type=entity.destination_type,
+        component=nipyapi.nifi.ConnectionDTO(id=entity.id, name=c.name, selected_relationships=c.relationships, **settings)
+    ))
+
+
+def _schedule_elements(elements, running=True):
+    """
+    Start or stop processors and ports on the NiFi canvas
+    :param elements: The deployed elements to schedule
+    :type elements: list(FlowElement)
+    :param running: Whether to start or stop the elements, elements which are not a processor or port are ignored
+    :type running: bool
+    :returns: list(FlowElement) The elements whose run state was changed
+    """
+    target = 'RUNNING' if running else 'STOPPED'
+    groups = dict()
+    for el in elements:
+        # RPGs are not scheduled, they only have their transmission enabled or disabled
+        if not isinstance(el, (Processor, InputPort, OutputPort)):
+            continue
+        e = _get_nifi_entity_by_id(el.type, el.id)
+        if e.component.state in [target, 'DISABLED']:
+            continue
+        groups.setdefault(e.component.parent_group_id, list()).append((el, e))
+
+    changed = list()
+    for group_id, scheduled in groups.items():
+        log.info("{} {} components in {}".format('Starting' if running else 'Stopping', len(scheduled), group_id))
+        nipyapi.canvas.schedule_components(group_id, running, [e for _, e in scheduled])
+        changed.extend([el for el, _ in scheduled])
+    return changed
+
+
+def _save_deployment(flow_pg_id, deployment):
+    """
+    Save the FlowDeployment in the comments of the flow's process group
+    :param flow_pg_id: The NiFi uuid of the flow's process group
+    :type flow_pg_id: str
+    :type deployment: flowlib.model.deployment.FlowDeployment
+    """
+    def save():
+        # re-fetch the deployed flow PG
+        flow_pg = nipyapi.canvas.get_process_group(flow_pg_id, identifier_type='id')
+
+        # save in NiFi instance PG comments
+        flow_pg.component.comments = deployment.encode()
+        return nipyapi.nifi.apis.ProcessGroupsApi().update_process_group(flow_pg.id, flow_pg)
+    return flowlib.nifi.transport.retry_conflicts(save)
+
+
+def _get_nifi_entity_by_id(kind, identifier, canvas=None):
     """
     :param kind: One of input_port, output_port, processor, process_group
     :param identifier: The NiFi API identifier uuid of the entity
+    :param canvas: If provided, return the entity from this index instead of fetching it from the api when possible
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
     """
+    if canvas and kind != 'remote_process_group':
+        # RPGs are always re-fetched because NiFi populates their remote ports after they are created
+        e = canvas.get_by_id(identifier)
+        if e:
+            return e
+
     log.debug("Getting Nifi {} Entity with id: {}".format(kind, identifier))
     if kind == 'input_port':
         e = nipyapi.nifi.InputPortsApi().get_input_port(identifier)
@@ -346,6 +1168,9 @@ def _get_nifi_entity_by_id(kind, identifier):
         e = nipyapi.nifi.RemoteProcessGroupsApi().get_remote_process_group(identifier)
     else:
         raise FlowLibException("{} is not a valid NiFi api type")
+
+    if canvas:
+        canvas.add(kind, e)
     return e
 
 
@@ -357,32 +1182,48 @@ def _rename_process_group(name, pg_id):
     :param pg_id: The NiFi uuid of the process group
     :type pg_id: str
     """
-    flow_pg = nipyapi.canvas.get_process_group(pg_id, identifier_type='id')
-    if not flow_pg:
-        raise FlowLibException("Failed to rename process group. No process group found with id {}".format(pg_id))
-    flow_pg.component.name = name
-    nipyapi.nifi.apis.ProcessGroupsApi().update_process_group(flow_pg.id, flow_pg)
+    def rename():
+        flow_pg = nipyapi.canvas.get_process_group(pg_id, identifier_type='id')
+        if not flow_pg:
+            raise FlowLibException("Failed to rename process group. No process group found with id {}".format(pg_id))
+        flow_pg.component.name = name
+        return nipyapi.nifi.apis.ProcessGroupsApi().update_process_group(flow_pg.id, flow_pg)
+    return flowlib.nifi.transport.retry_conflicts(rename)
 
 
-def _create_controllers(flow, flow_pg):
+def _create_controllers(flow, flow_pg, journal=None):
     """
     Create the controller services for the flow
     :param flow: A Flow instance
     :type flow: flowlib.model.flow.Flow
     :param flow_pg: The process group of the root flow being deployed
     :type flow_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param journal: Where to record every created controller service, the controller services it already has are not
+      created again if it was resumed
+    :type journal: flowlib.nifi.journal.DeployJournal
     """
+    deployed = dict()
+    if journal and journal.resumed:
+        deployed = {c.id: c for c in nipyapi.canvas.list_all_controllers(flow_pg.id, descendants=False)}
     all_controller_types = list(map(lambda x: x.type, nipyapi.canvas.list_all_controller_types()))
     for c in flow._controllers:
+        entry = journal.get('controller_service', c.name) if deployed else None
+        if entry and entry['id'] in deployed:
+            log.info("Resuming with the existing controller service: {}".format(c.name))
+            c.id = entry['id']
+            c.parent_id = flow_pg.id
+            continue
         if c.config.package_id not in all_controller_types:
             raise FlowLibException("{} is not a valid NiFi Controller Service type".format(c.config.package_id))
 
         controller_type = nipyapi.nifi.models.DocumentedTypeDTO(type=c.config.package_id)
         controller = nipyapi.canvas.create_controller(flow_pg, controller_type, name=c.name)
         controller = nipyapi.canvas.get_controller(controller.id, identifier_type='id')
-        nipyapi.canvas.update_controller(controller, c.config)
+        controller = nipyapi.canvas.update_controller(controller, c.config)
         c.id = controller.id
         c.parent_id = flow_pg.id
+        if journal:
+            journal.record('controller_service', c.name, controller)
 
 
 def _create_reporting_task_controllers(controllers):
@@ -457,65 +1298,178 @@ def _set_reporting_tasks_enabled(tasks, enabled=True):
         )
 
 
-def _create_canvas_elements_recursive(elements, parent_pg, config, current_deployment, previous_deployment=None):
+def _create_canvas_elements_recursive(groups, config, canvas, current_deployment, previous_deployment=None, executor=None, positions=None, journal=None,
+    layout_type=flowlib.layout.DEFAULT_LAYOUT):
     """
-    Recursively creates the actual NiFi elements (process_groups, processors, inputs, outputs) on the canvas
-    :param elements: The elements to deploy
-    :type elements: list(model.FlowElement)
-    :param parent_pg: The process group in which to create the processors
-    :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    Recursively creates the actual NiFi elements (process_groups, processors, inputs, outputs) on the canvas.
+      Sibling elements do not depend on each other, so all of the elements in the provided groups are created
+      together and then the child process groups of every group are recursed into as the next level
+    :param groups: The elements to deploy and the process group to create them in, for each group at the current depth
+    :type groups: list((dict(str:model.FlowElement), nipyapi.nifi.models.process_group_entity.ProcessGroupEntity))
     :param config: A valid FlowLibConfig object
     :type config: FlowLibConfig
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
     :param current_deployment: The current flow deployment
     :type current_deployment: flowlib.model.deployment.FlowDeployment
     :param previous_deployment: The previous flow deployment
     :type previous_deployment: flowlib.model.deployment.FlowDeployment or None
+    :param executor: A worker pool for creating elements concurrently, elements are created serially if None
+    :type executor: concurrent.futures.Executor
+    :param positions: The (x,y) positions of elements keyed by element path, the positions of any other elements
+      are generated from the layout of their group
+    :type positions: dict(str:tuple)
+    :param journal: Where to record every created element, elements it already has are not created again if it was resumed
+    :type journal: flowlib.nifi.journal.DeployJournal
+    :param layout_type: The type of layout of the groups whose elements have no positions, one of flowlib.layout.LAYOUT_TYPES
+    :type layout_type: str
+    """
+    positions = positions or dict()
+    tasks = list()
+    for elements, parent_pg in groups:
+        # Generate a dictionary of {name: (x,y)} positions for each element
+        layout = None
+        for el in elements.values():
+            position = positions.get(flowlib.plan.element_path(el))
+            if not position:
+                layout = layout or flowlib.layout.generate_layout(elements, layout_type)
+                position = layout[el.name]
+            tasks.append((el, parent_pg, position))
+
+    entities = _run_concurrently(executor, lambda t: _create_canvas_element(t[0], t[1], t[2], config, canvas,
+        current_deployment, previous_deployment, journal), tasks)
+
+    children = [(el._elements, pg) for (el, _, _), pg in zip(tasks, entities) if isinstance(el, ProcessGroup)]
+    if children:
+        _create_canvas_elements_recursive(children, config, canvas, current_deployment, previous_deployment, executor, positions, journal,
+            layout_type)
+
+
+def _create_canvas_element(el, parent_pg, position, config, canvas, current_deployment, previous_deployment=None, journal=None):
+    """
+    Create a single element on the NiFi canvas
+    :param el: The element to deploy
+    :type el: model.FlowElement
+    :param parent_pg: The process group in which to create the element
+    :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param journal: Where to record the created element
+    :type journal: flowlib.nifi.journal.DeployJournal
+    :returns: The NiFi entity that was created
     """
+    if journal and journal.resumed:
+        entity = _resumed_entity(el, parent_pg, canvas, journal)
+        if entity:
+            el.id = entity.id
+            el.parent_id = parent_pg.id
+            if isinstance(el, Processor) and entity.component.persists_state:
+                flowlib.nifi.deploy.record_stateful_processor(el, entity, current_deployment)
+            return entity
+
+    entity = _create_new_canvas_element(el, parent_pg, position, config, canvas, current_deployment, previous_deployment)
+    if journal:
+        journal.record(el.type, flowlib.plan.element_path(el), entity)
+    return entity
+
+
+def _create_new_canvas_element(el, parent_pg, position, config, canvas, current_deployment, previous_deployment=None):
+    if isinstance(el, ProcessGroup):
+        return _create_process_group(el, parent_pg, position, current_deployment, canvas)
+    elif isinstance(el, Processor):
+        return _create_processor(el, parent_pg, position, config, canvas, current_deployment, previous_deployment)
+    elif isinstance(el, RemoteProcessGroup):
+        return _create_remote_process_group(el, parent_pg, position, canvas)
+    elif isinstance(el, InputPort):
+        return _create_input_port(el, parent_pg, position, canvas)
+    elif isinstance(el, OutputPort):
+        return _create_output_port(el, parent_pg, position, canvas)
+    else:
+        raise FlowLibException("Unsupported Element Type: {}".format(el.type))
 
-    # Generate a dictionary of {name: (x,y)} positions for each element
-    positions = flowlib.layout.generate_layout(elements)
-
-    for el in elements.values():
-        position = positions[el.name]
-        if isinstance(el, ProcessGroup):
-            pg = _create_process_group(el, parent_pg, position, current_deployment)
-            _create_canvas_elements_recursive(el._elements, pg, config, current_deployment, previous_deployment)
-        elif isinstance(el, Processor):
-            _create_processor(el, parent_pg, position, config, current_deployment, previous_deployment)
-        elif isinstance(el, RemoteProcessGroup):
-            _create_remote_process_group(el, parent_pg, position)
-        elif isinstance(el, InputPort):
-            _create_input_port(el, parent_pg, position)
-        elif isinstance(el, OutputPort):
-            _create_output_port(el, parent_pg, position)
-        else:
-            raise FlowLibException("Unsupported Element Type: {}".format(el.type))
 
+def _run_concurrently(executor, fn, items):
+    """
+    Call fn for each item and block until every call has completed
+    :param executor: The worker pool to submit the calls to, the calls are made serially if None
+    :type executor: concurrent.futures.Executor
+    :param fn: A function taking a single item
+    :param items: The items to call fn with
+    :type items: list
+    :returns: list of the results of each call, in the same order as items
+    :raises: The first exception raised by any call, calls which have not yet started are cancelled
+    """
+    if not executor:
+        return [fn(i) for i in items]
+
+    futures = [executor.submit(fn, i) for i in items]
+    done, not_done = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+    for f in not_done:
+        f.cancel()
+    # let calls that are already in progress finish so nothing is still changing the canvas when we return
+    concurrent.futures.wait(not_done)
+
+    for f in futures:
+        if not f.cancelled() and f.exception():
+            raise f.exception()
+    return [f.result() for f in futures]
 
-def _create_connections_recursive(flow, elements):
+
+def _deploy_executor(concurrency):
+    """
+    :param concurrency: The max number of concurrent NiFi api calls to make while deploying
+    :type concurrency: int
+    :returns: concurrent.futures.ThreadPoolExecutor or None if concurrency is 1 or less
     """
-    Recursively creates the connections between elements defined in the Flow
+    if concurrency and int(concurrency) > 1:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=int(concurrency), thread_name_prefix='flowlib-deploy')
+    return None
+
+
+def _create_connections(flow, canvas, executor=None, journal=None):
+    """
+    Create all of the connections between elements defined in the Flow
     :param flow: The Flow to create connections for
     :type flow: Flow
-    :param elements: a list of FlowElements to connect together
-    :type elements: list(FlowElement)
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
+    :param executor: A worker pool for creating connections concurrently, connections are created serially if None
+    :type executor: concurrent.futures.Executor
+    :param journal: Where to record every created connection, the connections which already exist are not created
+      again if it was resumed
+    :type journal: flowlib.nifi.journal.DeployJournal
     """
-    for el in elements.values():
-        if isinstance(el, ProcessGroup):
-            _create_connections_recursive(flow, el._elements)
-        elif el.type in ['input_port', 'output_port', 'remote_process_group', 'processor']:
-            _create_element_connections(flow, el)
-        else:
-            raise FlowLibException("Unsupported Element Type: {}".format(el.type))
+    connections = flowlib.plan.plan_connections(flow)
+    if journal and journal.resumed:
+        deployed = nipyapi.canvas.list_all_connections(flow.id, descendants=True)
+        ids = set(e.id for e in deployed)
+
+        def exists(c):
+            entry = journal.get('connection', json.dumps(flowlib.plan.connection_key(c)))
+            if entry and entry['id'] in ids:
+                return True
+            # the connection may have been created right before the deployment failed, without being journaled
+            return any(_is_deployed_connection(e, c[0], c[1], c[2]) for e in deployed)
+
+        connections = [c for c in connections if not exists(c)]
+
+    def create(c):
+        entity = _create_connection(c[0], c[1], c[2], c[3].id, canvas)
+        if journal:
+            journal.record('connection', json.dumps(flowlib.plan.connection_key(c)), entity)
+        return entity
 
+    log.info("Creating {} connections".format(len(connections)))
+    _run_concurrently(executor, create, connections)
 
-def _create_remote_process_group(element, parent_pg, position):
+
+def _create_remote_process_group(element, parent_pg, position, canvas):
     """
     Create a Remote Process Group on the NiFi canvas
     :param element: The Remote Process Group to deploy
     :type element: flowlib.model.flow.RemoteProcessGroup
     :param parent_pg: The process group in which to create the new remote process group
     :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
     """
     element.config.name = element.name
     rpg = nipyapi.nifi.apis.ProcessGroupsApi().create_remote_process_group(
@@ -525,17 +1479,21 @@ def _create_remote_process_group(element, parent_pg, position):
             component=element.config
         )
     )
+    canvas.add('remote_process_group', rpg)
     element.id = rpg.id
     element.parent_id = parent_pg.id
+    return rpg
 
 
-def _create_process_group(element, parent_pg, position, current_deployment, is_flow_root=False):
+def _create_process_group(element, parent_pg, position, current_deployment, canvas, is_flow_root=False):
     """
     Create a Process Group on the NiFi canvas
     :param element: The Process Group to deploy
     :type element: model.ProcessGroup
     :param parent_pg: The process group in which to create the new process group
     :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
     :param is_flow_root: Whether the PG being created is the root of a flow being deployed
     :type is_flow_root: bool
     :param current_deployment: The current flow deployment
@@ -548,13 +1506,14 @@ def _create_process_group(element, parent_pg, position, current_deployment, is_f
         name = element.name
 
     log.info("Creating ProcessGroup: {}".format(name))
-    pg = nipyapi.canvas.get_process_group(name)
+    pg = canvas.get('process_group', name)
     if pg:
         log.error("Found existing ProcessGroup: {}".format(name))
         raise FlowLibException("Re-deploying a flow is not yet supported")
     else:
         log.debug("Creating ProcessGroup: {} with parent: {}".format(name, element.parent_path))
         pg = nipyapi.canvas.create_process_group(parent_pg, name, position)
+        canvas.add('process_group', pg)
 
         if is_flow_root:
             current_deployment.root_group_id = pg.id
@@ -564,7 +1523,7 @@ def _create_process_group(element, parent_pg, position, current_deployment, is_f
     return pg
 
 
-def _create_processor(element, parent_pg, position, config, current_deployment, previous_deployment=None):
+def _create_processor(element, parent_pg, position, config, canvas, current_deployment, previous_deployment=None):
     """
     Create a Processor on the NiFi canvas
     :param element: The Processor to deploy
@@ -573,6 +1532,8 @@ def _create_processor(element, parent_pg, position, config, current_deployment,
     :type parent_pg: nipyapi.nifi.models.process_group_entity.ProcessGroupEntity
     :param config: A valid FlowLibConfig object
     :type config: FlowLibConfig
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
     :param current_deployment: The current flow deployment
     :type current_deployment: flowlib.model.deployment.FlowDeployment
     :param previous_deployment: The previous flow deployment
@@ -580,7 +1541,7 @@ def _create_processor(element, parent_pg, position, config, current_deployment,
     """
     name = "{}/{}".format(element.name, parent_pg.id)
     log.info("Creating Processor: {}".format(name))
-    p = nipyapi.canvas.get_processor(name)
+    p = canvas.get('processor', name)
     if p:
         log.error("Found existing Processor: {}".format(name))
         raise FlowLibException("Re-deploying a flow is not yet supported")
@@ -588,40 +1549,19 @@ def _create_processor(element, parent_pg, position, config, current_deployment,
         log.debug("Creating Processor: {} with parent: {}".format(name, element.parent_path))
         _type = nipyapi.nifi.models.DocumentedTypeDTO(type=element.config.package_id)
         p = nipyapi.canvas.create_processor(parent_pg, _type, position, name, element.config)
+        canvas.add('processor', p)
 
         # If the processor is marked as stateful, add it to the deployment's stateful_processors
-        # and migrate the NiFi state if a previous_deployment is provided
+        # so that its state is migrated once the whole flow is created, see flowlib.nifi.deploy.migrate_state()
         if p.component.persists_state:
-            state = None
-            if element.src_component_name == 'root':
-                current_deployment.stateful_processors[element.name] = {'processor_id': p.id}
-                if previous_deployment:
-                    state = previous_deployment.stateful_processors.get(element.name, {}).get('state')
-            else:
-                component_path = element.parent_path + "/" + element.name
-                deployed_component = current_deployment.get_component(element.src_component_name)
-                deployed_component.stateful_processors[component_path] = {
-                    "group_id": parent_pg.id,
-                    "processor_id": p.id
-                }
-                if previous_deployment:
-                    previous_component = previous_deployment.get_component(element.src_component_name)
-                    if previous_component:
-                        state = previous_component.stateful_processors.get(component_path, {}).get('state')
-
-            if state:
-                log.info("Migrating processor state: {}".format(element.name))
-                client = ZookeeperClient(config.zookeeper_connection, config.zookeeper_root_node, config.zookeeper_acl)
-                client.set_processor_state(p.id, state)
-            else:
-                log.info("Processor {} is marked as stateful but no previous state was found, nothing to migrate...".format(element.name))
+            flowlib.nifi.deploy.record_stateful_processor(element, p, current_deployment)
 
     element.id = p.id
     element.parent_id = parent_pg.id
     return p
 
 
-def _create_input_port(element, parent_pg, position):
+def _create_input_port(element, parent_pg, position, canvas):
     """
     Create an Input Port on the NiFi canvas
     :param element: The InputPort to deploy
@@ -631,23 +1571,21 @@ def _create_input_port(element, parent_pg, position):
     """
     name = "{}/{}".format(element.name, parent_pg.id)
     log.info("Creating InputPort: {}".format(name))
-    filtered_ips = [ip for ip in nipyapi.canvas.list_all_input_ports() if name in ip.component.name]
-    ip = None
-    if len(filtered_ips) > 0:
-        ip = filtered_ips[0]
+    ip = canvas.get('input_port', name)
     if ip:
         log.error("Found existing InputPort: {}".format(name))
         raise FlowLibException("Re-deploying a flow is not yet supported")
     else:
         log.debug("Creating InputPort: {} with parent: {}".format(name, element.parent_path))
         ip = nipyapi.canvas.create_port(parent_pg.id, 'INPUT_PORT', name, 'STOPPED', position=position)
+        canvas.add('input_port', ip)
 
     element.id = ip.id
     element.parent_id = parent_pg.id
     return ip
 
 
-def _create_output_port(element, parent_pg, position):
+def _create_output_port(element, parent_pg, position, canvas):
     """
     Create an Output Port on the NiFi canvas
     :param element: The Output Port to deploy
@@ -657,137 +1595,43 @@ def _create_output_port(element, parent_pg, position):
     """
     name = "{}/{}".format(element.name, parent_pg.id)
     log.info("Creating OutputPort: {}".format(name))
-    filtered_ops = [op for op in nipyapi.canvas.list_all_output_ports() if name in op.component.name]
-    op = None
-    if len(filtered_ops) > 0:
-        op = filtered_ops[0]
+    op = canvas.get('output_port', name)
     if op:
         log.error("Found existing OutputPort: {}".format(name))
         raise FlowLibException("Re-deploying a flow is not yet supported")
     else:
         log.debug("Creating OutputPort: {} with parent: {}".format(name, element.parent_path))
         op = nipyapi.canvas.create_port(parent_pg.id, 'OUTPUT_PORT', name, 'STOPPED', position=position)
+        canvas.add('output_port', op)
 
     element.id = op.id
     element.parent_id = parent_pg.id
     return op
 
 
-def _create_element_connections(flow, source_element):
+def _create_connection(source_element, dest_element, c, group_id, canvas):
     """
-    Create the downstream connections for the element on the NiFi canvas
-    :param flow: The Flow to create connections in
-    :type flow: Flow
-    :param source_element: The source FlowElement to connect to its downstreams
+    Create a single connection on the NiFi canvas
+    :param source_element: The source FlowElement of the connection
     :type source_element: FlowElement
+    :param dest_element: The destination FlowElement of the connection
+    :type dest_element: FlowElement
+    :param c: The connection to create
+    :type c: flowlib.model.flow.Connection
+    :param group_id: The NiFi uuid of the process group to create the connection in
+    :type group_id: str
+    :param canvas: The index of entities on the NiFi canvas for this deployment
+    :type canvas: flowlib.nifi.canvas.CanvasIndex
     """
-    log.info("Creating downstream connections for element: {}/{}".format(source_element.parent_path, source_element.name))
-    parent = flow.get_parent_element(source_element)
+    log.info("Creating connection from {}/{} to {}".format(source_element.parent_path, source_element.name, c.name))
 
-    # If source is an output_port then the downstream connections are the parent's connections
-    if isinstance(source_element, OutputPort):
-        # We're only interested in connections from the current output port
-        if parent.connections:
-            connections = [c for c in parent.connections if c.from_port == source_element.name]
-        else:
-            connections = None
-    else:
-        connections = source_element.connections
-
-    if connections:
-        for c in connections:
-            if isinstance(source_element, (InputPort, Processor, RemoteProcessGroup)):
-                elements = parent._elements
-            elif isinstance(source_element, OutputPort):
-                # if source is an output port then we need to to search the
-                # parent's elements for the destination element
-                elements = flow.get_parent_element(parent)._elements
-            else:
-                raise FlowLibException("""
-                    Something went wrong, failed while recursively connecting flow elements on the canvas.
-                    Cannot create downstream connections for elements of type {}""".format(type(source_element)))
-
-            source = _get_nifi_entity_by_id(source_element.type, source_element.id)
-            source_id = source.component.id
-            source_group_id = source.component.parent_group_id
-
-            dest_element = elements.get(c.name)
-            if not dest_element:
-                raise FlowLibException("The destination element {} is not defined, must be one of: {}".format(c.name, elements.keys()))
-
-            if isinstance(dest_element, (OutputPort, Processor, RemoteProcessGroup)):
-                dest = _get_nifi_entity_by_id(dest_element.type, dest_element.id)
-            elif isinstance(dest_element, ProcessGroup):
-                d = [v for k,v in dest_element._elements.items() if isinstance(v, InputPort) and k == c.to_port][0]
-                dest = _get_nifi_entity_by_id(d.type, d.id)
-            else:
-                raise FlowLibException("""Connections cannot be defined for downstream elements of type 'input_port'.
-                  InputPorts can only be referenced from outside of the current component""")
-
-            dest_id = dest.component.id
-            dest_group_id = dest.component.parent_group_id
-
-            # if source or dest are a RPG then we need the IDs of the target input or output
-            # ports from the remote instance
-            if isinstance(source, nipyapi.nifi.RemoteProcessGroupEntity):
-                source_type = 'REMOTE_OUTPUT_PORT'
-                target = [op for op in source.component.contents.output_ports if op.name == c.from_port]
-                if len(target) != 1:
-                    raise FlowLibException("Output port {} not found. Found: {}".format(c.from_port, [op.name for op in dest.component.contents.output_ports]))
-                source_id = target[0].id
-                source_group_id = target[0].group_id
-            else:
-                source_type = nipyapi.utils.infer_object_label_from_class(source)
-
-            if isinstance(dest, nipyapi.nifi.RemoteProcessGroupEntity):
-                dest_type = 'REMOTE_INPUT_PORT'
-                target = [ip for ip in dest.component.contents.input_ports if ip.name == c.to_port]
-                if len(target) != 1:
-                    raise FlowLibException("Input port {} not found. Found: {}".format(c.to_port, [ip.name for ip in dest.component.contents.input_ports]))
-                dest_id = target[0].id
-                dest_group_id = target[0].group_id
-            else:
-                dest_type = nipyapi.utils.infer_object_label_from_class(dest)
+    # The entities are only read for their ids and types, so cached entities with an
+    # outdated revision are fine here. The new connection always starts at revision 0
+    source = _get_nifi_entity_by_id(source_element.type, source_element.id, canvas)
+    dest = _get_nifi_entity_by_id(dest_element.type, dest_element.id, canvas)
 
-            # if the source of the connection is an output port then the group_id for the connection is the id of
-            # the parent group of the group which contains the output port
-            if isinstance(source_element, OutputPort):
-                group_id = flow.get_parent_element(parent).id
-            else:
-                group_id = source_element.parent_id
-
-            log.debug("Creating connection between source {} and dest {} for relationships {}".format(source.component.name, dest.component.name, c.relationships))
-
-            nipyapi.nifi.ProcessGroupsApi().create_connection(
-                id=group_id,
-                body=nipyapi.nifi.ConnectionEntity(
-                    revision=nipyapi.nifi.RevisionDTO(version=0),
-                    source_type=source_type,
-                    destination_type=dest_type,
-                    component=nipyapi.nifi.ConnectionDTO(
-                        source=nipyapi.nifi.ConnectableDTO(
-                            id=source_id,
-                            group_id=source_group_id,
-                            type=source_type
-                        ),
-                        back_pressure_data_size_threshold=c.back_pressure_data_size_threshold,
-                        back_pressure_object_threshold=c.back_pressure_object_threshold,
-                        load_balance_strategy=c.load_balance_strategy,
-                        flow_file_expiration=c.flow_file_expiration,
-                        load_balance_compression=c.load_balance_compression,
-                        prioritizers=c.prioritizers,
-                        name=c.name,
-                        destination=nipyapi.nifi.ConnectableDTO(
-                            id=dest_id,
-                            group_id=dest_group_id,
-                            type=dest_type
-                        ),
-                        selected_relationships=c.relationships
-                    )
-                )
-            )
-    else:
-        log.debug("Terminal node, no downstream connections found for element {}".format(source_element.name))
+    log.debug("Creating connection between source {} and dest {} for relationships {}".format(source.component.name, dest.component.name, c.relationships))
+    return nipyapi.nifi.ProcessGroupsApi().create_connection(id=group_id, body=flowlib.nifi.deploy.connection_entity(source, dest, c))
 
 
 def _remove_flow(flow_pg_id, force=False):
@@ -807,10 +1651,7 @@ def _remove_flow(flow_pg_id, force=False):
         nipyapi.canvas.delete_connection(c, purge=force)
 
     log.info("Deleting flow controller services...")
-    controllers = nipyapi.canvas.list_all_by_kind('controllers', pg_id=flow_pg_id, descendants=False)
-    if controllers and not isinstance(controllers, list):
-        controllers = [controllers]
-    for c in controllers:
+    for c in _flow_controllers(flow_pg_id):
         nipyapi.canvas.delete_controller(c, force=force)
 
     log.info("Deleting flow process group...")
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import uuid
+
+import flowlib.layout
+import flowlib.plan
+from flowlib.exceptions import FlowLibException
+from flowlib.model.flow import Flow, InputPort, OutputPort, ProcessGroup, Processor, RemoteProcessGroup
+
+FLOW_ENCODING_VERSION = '1.0'
+
+# The values NiFi uses for any processor scheduling config that is not defined by the flow
+PROCESSOR_DEFAULTS = {
+    'scheduling_period': '0 sec',
+    'scheduling_strategy': 'TIMER_DRIVEN',
+    'execution_node': 'ALL',
+    'penalty_duration': '30 sec',
+    'yield_duration': '1 sec',
+    'bulletin_level': 'WARN',
+    'run_duration_millis': 0,
+    'concurrently_schedulable_task_count': 1
+}
+
+CONNECTABLE_TYPES = {
+    'processor': 'PROCESSOR',
+    'input_port': 'INPUT_PORT',
+    'output_port': 'OUTPUT_PORT'
+}
+
+
+def controller_versioned_id(controller):
+    """
+    The id of a controller service within a compiled snapshot. Processor properties must be templated
+      with this id for controller() lookups so that NiFi can resolve the reference when the snapshot is uploaded
+    :type controller: flowlib.model.flow.ControllerService
+    :returns: str
+    """
+    return _versioned_id("controller_service", controller.name)
+
+
+def compile_flow(flow, name, bundles, positions=None):
+    """
+    Compile an initialized Flow into a NiFi VersionedFlowSnapshot so that the whole flow can be created with one upload.
+      Since the NiFi uuids of the process groups are not known until the snapshot is uploaded, elements are named
+      with the versioned id of their process group instead (e.g. element-name/versioned-group-id)
+    :param flow: An initialized Flow instance, with its vars replaced using controller_versioned_id() for controller lookups
+    :type flow: flowlib.model.flow.Flow
+    :param name: The name of the process group to create for the flow
+    :type name: str
+    :param bundles: The bundle coordinates {group, artifact, version} of each processor and controller service type available in NiFi
+    :type bundles: dict(str:dict)
+    :param positions: The (x,y) positions of every element of the flow keyed by element path, generated if None
+    :type positions: dict(str:tuple)
+    :returns: dict The VersionedFlowSnapshot, ready to be serialized as json
+    """
+    groups = dict()
+    positions = positions or flowlib.layout.generate_flow_layout(flow)
+    contents = _versioned_group(flow, name, None, flowlib.layout.TOP_LEVEL_PG_LOCATION, bundles, groups, positions)
+    contents['comments'] = flow.comments or ''
+    contents['controllerServices'] = [_versioned_controller_service(c, contents['identifier'], bundles) for c in flow._controllers]
+
+    for source, dest, c, group in flowlib.plan.plan_connections(flow):
+        versioned_group = groups[flowlib.plan.element_path(group)]
+        versioned_group['connections'].append(_versioned_connection(source, dest, c, versioned_group['identifier']))
+
+    return {
+        'flowContents': contents,
+        'externalControllerServices': dict(),
+        'parameterContexts': dict(),
+        'flowEncodingVersion': FLOW_ENCODING_VERSION
+    }
+
+
+def _versioned_id(kind, path):
+    # versioned ids are derived from the element path so that compiling the same flow always produces the same ids
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "flowlib:{}:{}".format(kind, path)))
+
+
+def _element_id(element):
+    if isinstance(element, Flow):
+        return _versioned_id('process_group', element.name)
+    return _versioned_id(element.type, flowlib.plan.element_path(element))
+
+
+def _bundle(package_id, bundles):
+    bundle = bundles.get(package_id)
+    if not bundle:
+        raise FlowLibException("{} is not a valid NiFi Processor or Controller Service type".format(package_id))
+    return {'group': bundle['group'], 'artifact': bundle['artifact'], 'version': bundle['version']}
+
+
+def _position(position):
+    return {'x': float(position[0]), 'y': float(position[1])}
+
+
+def _versioned_group(element, name, group_id, position, bundles, groups, positions):
+    """
+    Recursively compile a Flow or ProcessGroup and all of its elements
+    :param groups: Collects every compiled group by element path so that connections can be added to them
+    :type groups: dict(str:dict)
+    :param positions: The (x,y) positions of every element of the flow keyed by element path
+    :type positions: dict(str:tuple)
+    """
+    identifier = _element_id(element)
+    group = {
+        'identifier': identifier,
+        'name': name,
+        'comments': '',
+        'position': _position(position),
+        'processGroups': list(),
+        'remoteProcessGroups': list(),
+        'processors': list(),
+        'inputPorts': list(),
+        'outputPorts': list(),
+        'connections': list(),
+        'labels': list(),
+        'funnels': list(),
+        'controllerServices': list(),
+        'variables': dict(),
+        'componentType': 'PROCESS_GROUP'
+    }
+    if group_id:
+        group['groupIdentifier'] = group_id
+    groups[flowlib.plan.element_path(element)] = group
+
+    for el in element._elements.values():
+        el_name = "{}/{}".format(el.name, identifier)
+        el_position = positions[flowlib.plan.element_path(el)]
+        if isinstance(el, ProcessGroup):
+            group['processGroups'].append(_versioned_group(el, el_name, identifier, el_position, bundles, groups, positions))
+        elif isinstance(el, Processor):
+            group['processors'].append(_versioned_processor(el, el_name, identifier, el_position, bundles))
+        elif isinstance(el, InputPort):
+            group['inputPorts'].append(_versioned_port(el, el_name, identifier, el_position, 'INPUT_PORT'))
+        elif isinstance(el, OutputPort):
+            group['outputPorts'].append(_versioned_port(el, el_name, identifier, el_position, 'OUTPUT_PORT'))
+        elif isinstance(el, RemoteProcessGroup):
+            # the remote ports of a RPG are only known once NiFi has connected to the remote instance
+            raise FlowLibException("RemoteProcessGroup {} cannot be deployed as part of a snapshot, deploy the flow without --snapshot-deploy".format(el.name))
+        else:
+            raise FlowLibException("Unsupported Element Type: {}".format(el.type))
+
+    return group
+
+
+def _versioned_processor(element, name, group_id, position, bundles):
+    config = element.config
+    processor = {
+        'identifier': _element_id(element),
+        'name': name,
+        'comments': config.comments or '',
+        'position': _position(position),
+        'type': config.package_id,
+        'bundle': _bundle(config.package_id, bundles),
+        'style': dict(),
+        'properties': {k: v for k, v in (config.properties or dict()).items() if v is not None},
+        'propertyDescriptors': dict(),
+        'autoTerminatedRelationships': config.auto_terminated_relationships or list(),
+        'scheduledState': 'ENABLED',
+        'componentType': 'PROCESSOR',
+        'groupIdentifier': group_id
+    }
+    for k, default in PROCESSOR_DEFAULTS.items():
+        value = getattr(config, k)
+        processor[_camel_case(k)] = value if value is not None else default
+    return processor
+
+
+def _versioned_port(element, name, group_id, position, port_type):
+    return {
+        'identifier': _element_id(element),
+        'name': name,
+        'position': _position(position),
+        'type': port_type,
+        'concurrentlySchedulableTaskCount': 1,
+        'allowRemoteAccess': False,
+        'scheduledState': 'ENABLED',
+        'componentType': port_type,
+        'groupIdentifier': group_id
+    }
+
+
+def _versioned_controller_service(controller, group_id, bundles):
+    config = controller.config
+    return {
+        'identifier': controller_versioned_id(controller),
+        'name': controller.name,
+        'comments': config.comments or '',
+        'type': config.package_id,
+        'bundle': _bundle(config.package_id, bundles),
+        'properties': {k: v for k, v in (config.properties or dict()).items() if v is not None},
+        'propertyDescriptors': dict(),
+        'controllerServiceApis': list(),
+        'scheduledState': 'DISABLED',
+        'componentType': 'CONTROLLER_SERVICE',
+        'groupIdentifier': group_id
+    }
+
+
+def _versioned_connection(source, dest, c, group_id):
+    return {
+        'identifier': _versioned_id('connection', "{}->{}:{}".format(flowlib.plan.element_path(source), flowlib.plan.element_path(dest), sorted(c.relationships or []))),
+        'name': c.name,
+        'source': _connectable(source),
+        'destination': _connectable(dest),
+        'selectedRelationships': c.relationships or list(),
+        'backPressureObjectThreshold': c.back_pressure_object_threshold,
+        'backPressureDataSizeThreshold': c.back_pressure_data_size_threshold,
+        'flowFileExpiration': c.flow_file_expiration or '0 sec',
+        'prioritizers': c.prioritizers or list(),
+        'loadBalanceStrategy': c.load_balance_strategy or 'DO_NOT_LOAD_BALANCE',
+        'loadBalanceCompression': c.load_balance_compression or 'DO_NOT_COMPRESS',
+        'bends': list(),
+        'labelIndex': 1,
+        'zIndex': 0,
+        'componentType': 'CONNECTION',
+        'groupIdentifier': group_id
+    }
+
+
+def _connectable(element):
+    return {
+        'id': _element_id(element),
+        'type': CONNECTABLE_TYPES[element.type],
+        'groupId': _versioned_id('process_group', element.parent_path),
+        'name': element.name
+    }
+
+
+def _camel_case(name):
+    first, *rest = name.split('_')
+    return first + ''.join(w.capitalize() for w in rest)
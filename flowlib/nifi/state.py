@@ -3,12 +3,19 @@ import io
 import struct
 
 from kazoo.client import KazooClient
+from kazoo.exceptions import NoNodeError, RolledBackError
+from kazoo.protocol.serialization import Create, SetData, int_struct, multiheader_struct
 from kazoo.security import CREATOR_ALL_ACL, OPEN_ACL_UNSAFE
 
+import flowlib.profile
 from flowlib.exceptions import FlowLibException
 
 MAX_STATE_SIZE = 1024 * 1024
 ENCODING_VERSION = b'\x01'
+# zookeeper drops the connection of a client which sends a request larger than jute.maxbuffer, which defaults to 1 MB - 1 byte
+JUTE_MAX_BUFFER = 0xfffff
+# the length, xid and type of a multi request, and the header which ends its list of operations
+MULTI_REQUEST_SIZE = 3 * int_struct.size + multiheader_struct.size
 
 
 class ZookeeperClient:
@@ -31,7 +38,21 @@ class ZookeeperClient:
         self.acl = CREATOR_ALL_ACL if acl == 'creator' else OPEN_ACL_UNSAFE
 
         self.client = KazooClient(hosts=self.connection)
-        self.client.start()
+        with flowlib.profile.call('zookeeper', 'CONNECT', self.connection):
+            self.client.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the zookeeper session
+        """
+        self.client.stop()
+        self.client.close()
 
     def set_processor_state(self, processor_id, state):
         """
@@ -41,20 +62,56 @@ class ZookeeperClient:
         :param state: The state k,v pairs to set in zookeeper
         :type state: dict(str:str)
         """
-        serialized = _serialize(state)
-        size = serialized.seek(0, 2)
-        if size > MAX_STATE_SIZE:
-            raise FlowLibException("Processor state size cannot exceed {} bytes but the serialized size is {} bytes".format(MAX_STATE_SIZE, size))
+        self.set_processor_states({processor_id: state})
 
-        # ensure node exists with the specified acl
-        path = '{}/components/{}'.format(self.root_node, processor_id)
-        if self.client.exists(path):
-            self.client.set_acls(path, acls=self.acl)
-        else:
-            self.client.create(path, acl=self.acl, makepath=True)
+    def set_processor_states(self, states):
+        """
+        Set the state in zookeeper for many processors at once. The existing znodes are read with pipelined requests
+          and then all of the znodes are created or updated with as few transactions as possible
+        :param states: The state k,v pairs to set in zookeeper for each processor
+        :type states: dict(str:dict(str:str))
+        """
+        values = dict()
+        for processor_id, state in states.items():
+            serialized = _serialize(state)
+            size = serialized.seek(0, 2)
+            if size > MAX_STATE_SIZE:
+                raise FlowLibException("Processor state size cannot exceed {} bytes but the serialized size is {} bytes".format(MAX_STATE_SIZE, size))
+            values[self._processor_path(processor_id)] = serialized.getvalue()
+        if not values:
+            return
+
+        # ensure each node exists with the specified acl
+        components = '{}/components'.format(self.root_node)
+        with flowlib.profile.call('zookeeper', 'ENSURE', components):
+            self.client.ensure_path(components, acl=self.acl)
+        # pipelined requests are profiled as a single call
+        with flowlib.profile.call('zookeeper', 'EXISTS', components):
+            exists = {path: self.client.exists_async(path) for path in values}
+            exists = {path: result.get() for path, result in exists.items()}
+        with flowlib.profile.call('zookeeper', 'SET_ACLS', components):
+            acls = [self.client.set_acls_async(path, self.acl) for path, stat in exists.items() if stat]
+            for result in acls:
+                result.get()
 
-        # set value
-        self.client.set(path, serialized.getvalue())
+        # a transaction is a single zookeeper request, so the serialized operations (their paths, values and ACLs) must fit in jute.maxbuffer
+        transaction = self.client.transaction()
+        size = MULTI_REQUEST_SIZE
+        for path, value in values.items():
+            acl = None if exists[path] else self.acl
+            operation_size = _operation_size(self.client.chroot + path, value, acl)
+            if transaction.operations and size + operation_size > JUTE_MAX_BUFFER:
+                with flowlib.profile.call('zookeeper', 'MULTI', components, size):
+                    _commit(transaction)
+                transaction = self.client.transaction()
+                size = MULTI_REQUEST_SIZE
+            if acl is None:
+                transaction.set_data(path, value)
+            else:
+                transaction.create(path, value, acl=acl)
+            size += operation_size
+        with flowlib.profile.call('zookeeper', 'MULTI', components, size):
+            _commit(transaction)
 
     def get_processor_state(self, processor_id):
         """
@@ -63,12 +120,65 @@ class ZookeeperClient:
         :type processor_id: str
         :returns: dict(str:str) The state k,v pairs to set in zookeeper
         """
-        path = '{}/components/{}'.format(self.root_node, processor_id)
-        if self.client.exists(path):
-            return _deserialize(self.client.get(path)[0])
+        path = self._processor_path(processor_id)
+        with flowlib.profile.call('zookeeper', 'EXISTS', path):
+            exists = self.client.exists(path)
+        if exists:
+            with flowlib.profile.call('zookeeper', 'GET', path) as call:
+                value = self.client.get(path)[0]
+                call['bytes_received'] = len(value)
+            return _deserialize(value)
         else:
             raise FlowLibException("Processor state does not exist at: {}".format(path))
 
+    def get_processor_states(self, processor_ids):
+        """
+        Get the state from zookeeper for many processors at once, using pipelined requests
+        :param processor_ids: The NiFi uuids of the processors
+        :type processor_ids: list(str)
+        :returns: dict(str:dict(str:str)) The state k,v pairs of each processor which has state in zookeeper
+        """
+        states = dict()
+        with flowlib.profile.call('zookeeper', 'GET', '{}/components'.format(self.root_node)) as call:
+            results = {processor_id: self.client.get_async(self._processor_path(processor_id)) for processor_id in processor_ids}
+            for processor_id, result in results.items():
+                try:
+                    value = result.get()[0]
+                except NoNodeError:
+                    continue
+                call['bytes_received'] += len(value)
+                states[processor_id] = _deserialize(value)
+        return states
+
+    def _processor_path(self, processor_id):
+        return '{}/components/{}'.format(self.root_node, processor_id)
+
+
+def _operation_size(path, value, acl=None):
+    """
+    :param path: The full path of the znode, including any chroot of the connection
+    :type path: str
+    :param value: The data to write to the znode
+    :type value: bytes
+    :param acl: The ACL to create the znode with, or None if the data of an existing znode is set
+    :type acl: list(kazoo.security.ACL)
+    :returns: int The serialized size of the operation in a zookeeper multi request
+    """
+    operation = SetData(path, value, -1) if acl is None else Create(path, value, acl, 0)
+    return multiheader_struct.size + len(operation.serialize())
+
+
+def _commit(transaction):
+    """
+    Commit a zookeeper transaction
+    :type transaction: kazoo.client.TransactionRequest
+    :raises: FlowLibException if the transaction failed, none of its operations are applied
+    """
+    # the operations which did not fail are reported as rolled back, so report the cause of the failure first
+    errors = sorted([r for r in transaction.commit() if isinstance(r, Exception)], key=lambda e: isinstance(e, RolledBackError))
+    if errors:
+        raise FlowLibException("Failed to set processor state in zookeeper: {}".format(errors[0]))
+
 
 def _serialize(state):
     """
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+
+import nipyapi
+import requests
+import requests.adapters
+import urllib3
+
+import flowlib.profile
+from flowlib.logger import log
+
+# Server errors are only retried for idempotent methods, NiFi may have applied a request before failing (e.g a cluster
+# node which created a component before returning 503), so retrying a POST could create duplicate components.
+# Revision conflicts (409) are not retried here because the same stale revision would be resent, see retry_conflicts()
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+CONFLICT_STATUS = 409
+# The methods which NiFi can safely apply twice, the same as urllib3's default (which was renamed in urllib3 1.26)
+IDEMPOTENT_METHODS = frozenset(['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
+
+_settings = {
+    'pool_size': 10,
+    'retries': 3,
+    'backoff_factor': 0.5,
+    'connect_timeout': 10,
+    'read_timeout': 120
+}
+_session = None
+_lock = threading.Lock()
+# The attribute of a nipyapi api client holding the endpoint and settings its transport was installed with
+_INSTALLED = '_flowlib_transport'
+
+
+class JitteredRetry(urllib3.util.Retry):
+    """
+    A urllib3 Retry with jittered exponential backoff, so that concurrent requests which fail
+      together do not all retry at the same time
+    """
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class _DefaultTimeoutMixin:
+    # nipyapi passes timeout=None unless a timeout is given for the call, which would disable the pool's default timeout
+    def urlopen(self, method, url, redirect=True, **kw):
+        if 'timeout' in kw and kw['timeout'] is None:
+            del kw['timeout']
+        return super().urlopen(method, url, redirect=redirect, **kw)
+
+
+class _ProfileMixin:
+    # records every call made through the pool when profiling is enabled, see flowlib.profile
+    def urlopen(self, method, url, redirect=True, **kw):
+        profiler = flowlib.profile.profiler()
+        if not profiler:
+            return super().urlopen(method, url, redirect=redirect, **kw)
+
+        service = 'registry' if '/nifi-registry-api' in url else 'nifi'
+        body = kw.get('body')
+        bytes_sent = len(body) if isinstance(body, (bytes, str)) else 0
+        start = profiler.now()
+        try:
+            response = super().urlopen(method, url, redirect=redirect, **kw)
+        except Exception as e:
+            profiler.record(service, method, urllib3.util.parse_url(url).path or '/', type(e).__name__, start, profiler.now() - start, bytes_sent)
+            raise
+        # nipyapi preloads the response, so its body has been read (and decompressed) by now. Streamed bodies are not read here
+        if kw.get('preload_content', True):
+            bytes_received = len(response.data or b'')
+        else:
+            bytes_received = int(response.headers.get('Content-Length') or 0)
+        profiler.record(service, method, urllib3.util.parse_url(url).path or '/', response.status, start, profiler.now() - start,
+            bytes_sent, bytes_received)
+        return response
+
+
+class PoolManager(_ProfileMixin, _DefaultTimeoutMixin, urllib3.PoolManager):
+    pass
+
+
+class ProxyManager(_ProfileMixin, _DefaultTimeoutMixin, urllib3.ProxyManager):
+    pass
+
+
+def configure(config):
+    """
+    Configure the http transport used for all NiFi and NiFi Registry api calls
+    :param config: A valid FlowLibConfig object
+    :type config: FlowLibConfig
+    """
+    global _session
+    with _lock:
+        # there should always be enough connections for every concurrent deployment worker
+        _settings['pool_size'] = max(int(config.http_pool_size), int(config.deploy_concurrency or 1))
+        _settings['retries'] = int(config.http_retries)
+        _settings['backoff_factor'] = float(config.http_backoff_factor)
+        _settings['connect_timeout'] = float(config.http_connect_timeout)
+        _settings['read_timeout'] = float(config.http_read_timeout)
+        _session = None
+
+    # the NiFi api client is installed once its endpoint is known, see flowlib.nifi.rest.wait_for_nifi_api()
+    if nipyapi.config.nifi_config.api_client:
+        install(nipyapi.config.nifi_config)
+    install(nipyapi.config.registry_config)
+
+
+def install(api_config):
+    """
+    Replace the connection pool of a nipyapi api client with a pooled, keep-alive transport using the configured settings.
+      The api client is created if it does not exist yet
+    :param api_config: nipyapi.config.nifi_config or nipyapi.config.registry_config
+    :type api_config: nipyapi.nifi.configuration.Configuration or nipyapi.registry.configuration.Configuration
+    :returns: The api client
+    """
+    if not api_config.api_client:
+        if api_config is nipyapi.config.registry_config:
+            api_config.api_client = nipyapi.registry.ApiClient()
+        else:
+            api_config.api_client = nipyapi.nifi.ApiClient()
+
+    api_client = api_config.api_client
+    with _lock:
+        installed = (api_config.host, api_config.proxy, tuple(sorted(_settings.items())))
+        # keep the pool, and its keep-alive connections, unless the endpoint or the settings have changed
+        if getattr(api_client, _INSTALLED, None) == installed:
+            return api_client
+        # the client keeps the host it was created with, keep it in sync with the configured endpoint
+        api_client.host = api_config.host
+        api_client.default_headers['Accept-Encoding'] = 'gzip'
+        api_client.rest_client.pool_manager = _pool_manager(api_client.rest_client.pool_manager, api_config.proxy)
+        setattr(api_client, _INSTALLED, installed)
+    log.debug("Configured http transport for {}: {}".format(api_config.host, _settings))
+    return api_client
+
+
+def retry_conflicts(update):
+    """
+    Call update(), and call it again with a backoff when NiFi rejects it with a revision conflict (409).
+      update() must read the current revision of the entity it updates every time it is called
+    :param update: A function which reads an entity and updates it
+    :type update: function
+    :returns: The result of update()
+    """
+    attempt = 0
+    while True:
+        try:
+            return update()
+        except (nipyapi.nifi.rest.ApiException, nipyapi.registry.rest.ApiException) as e:
+            if e.status != CONFLICT_STATUS or attempt >= _settings['retries']:
+                raise
+            log.debug("Revision conflict, retrying the update: {}".format(e.reason))
+            time.sleep(backoff(_settings['backoff_factor'], attempt))
+            attempt += 1
+
+
+def is_retry(method, status):
+    """
+    :returns: bool Whether a request which failed with the status should be retried, for http clients which are not built on urllib3
+    """
+    return status in RETRY_STATUSES and method.upper() in IDEMPOTENT_METHODS
+
+
+def backoff(backoff_factor, attempt):
+    """
+    :returns: float A jittered exponential backoff in seconds before retrying a failed request
+    """
+    return random.uniform(0, backoff_factor * (2 ** attempt))
+
+
+def session():
+    """
+    :returns: requests.Session A shared session for api calls made without nipyapi, using the configured settings
+    """
+    global _session
+    with _lock:
+        if not _session:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_settings['pool_size'],
+                pool_maxsize=_settings['pool_size'],
+                pool_block=True,
+                max_retries=_retry()
+            )
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers['Accept-Encoding'] = 'gzip'
+        return _session
+
+
+def timeout():
+    """
+    :returns: tuple The (connect, read) timeouts for an api call made with session()
+    """
+    return (_settings['connect_timeout'], _settings['read_timeout'])
+
+
+def settings():
+    """
+    :returns: dict A copy of the configured transport settings, for http clients which are not built on urllib3
+    """
+    with _lock:
+        return dict(_settings)
+
+
+def _retry():
+    return JitteredRetry(
+        total=_settings['retries'],
+        backoff_factor=_settings['backoff_factor'],
+        status_forcelist=RETRY_STATUSES,
+        # return the last response once retries are exhausted so that api errors are raised the same way as before
+        raise_on_status=False
+    )
+
+
+def _pool_manager(current, proxy=None):
+    """
+    :param current: The pool manager created by nipyapi, its ssl settings are kept
+    :type current: urllib3.PoolManager
+    :param proxy: The proxy url, if any
+    :type proxy: str
+    """
+    kw = {k: v for k, v in current.connection_pool_kw.items() if k in ['cert_reqs', 'ca_certs', 'cert_file', 'key_file', 'ssl_context']}
+    kw.update({
+        'num_pools': 4,
+        'maxsize': _settings['pool_size'],
+        'block': True,
+        'retries': _retry(),
+        'timeout': urllib3.Timeout(connect=_settings['connect_timeout'], read=_settings['read_timeout'])
+    })
+    if proxy:
+        return ProxyManager(proxy_url=proxy, **kw)
+    return PoolManager(**kw)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
-import copy
+import functools
+import hashlib
 import os
+import pickle
 import re
 import yaml
 
@@ -12,14 +14,31 @@ from flowlib.logger import log
 from flowlib.exceptions import FlowLibException, FlowValidationException
 from flowlib.model.component import FlowComponent
 from flowlib.model.flow import Flow, FlowElement, ControllerService, Processor, ProcessGroup, ReportingTask
-from flowlib.validator import check_name, is_component_circular
+from flowlib.model.frozen import freeze
+from flowlib.validator import check_layout, check_name, is_component_circular
 
 env = Environment()
 
-def _set_global_helpers(controllers=None):
+# The max number of compiled templates to keep, the same property values are usually repeated across every
+# instance of a component so this only needs to hold the distinct template strings of a flow
+TEMPLATE_CACHE_SIZE = 4096
 
+# libyaml's loader is several times faster than the pure python loader, use it when PyYAML was built with it
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# Included in the key of cached components, bump it when the format of parsed components changes
+COMPONENT_CACHE_VERSION = 1
+
+def _set_global_helpers(controllers=None, controller_id=None):
+    """
+    :param controllers: The controllers which can be looked up with the controller() helper
+    :type controllers: dict(str:ControllerService)
+    :param controller_id: A function returning the id to inject for a controller, defaults to the controller's NiFi uuid
+    :type controller_id: function
+    """
     if not controllers:
         controllers = dict()
+    if not controller_id:
+        controller_id = lambda c: c.id
 
     def env_lookup(key, default=None):
         value = os.getenv(key, default)
@@ -27,7 +46,7 @@ def _set_global_helpers(controllers=None):
 
     def controller_lookup(name):
         if name in controllers:
-            return controllers[name].id
+            return controller_id(controllers[name])
         else:
             return None
 
@@ -77,7 +96,7 @@ def init_reporting_tasks(controllers, reporting_tasks):
     return reporting_tasks
 
 
-def init_flow(flow, component_dir=None, with_components=None):
+def init_flow(flow, component_dir=None, with_components=None, component_cache_dir=None):
     """
     Initialize a Flow from from a yaml definition
     :param flow: An unitialized Flow instance
@@ -86,8 +105,12 @@ def init_flow(flow, component_dir=None, with_components=None):
     :type component_dir: str
     :param with_components: A list of components to use for initializing process groups
     :type with_components: list(DeployedComponent)
+    :param component_cache_dir: A directory for caching the parsed components of component_dir
+    :type component_cache_dir: str
     """
     check_name(flow.name)
+    if flow.layout:
+        check_layout(flow.layout)
 
     # Set controllers as empty dict for now so that the env helper is available for templating controller properties
     _set_global_helpers()
@@ -97,8 +120,7 @@ def init_flow(flow, component_dir=None, with_components=None):
     # Jinja template the global vars
     for k,v in flow.global_vars.items():
         if isinstance(v, str):
-            t = env.from_string(v)
-            flow.global_vars[k] = t.render()
+            flow.global_vars[k] = _render(v)
 
     # Set jinja globals for templating process_group.vars and processor.properties later
     env.globals.update(**flow.global_vars)
@@ -108,15 +130,14 @@ def init_flow(flow, component_dir=None, with_components=None):
 
     log.info("Initializing root Flow {}".format(flow.name))
     for elem_dict in flow.canvas:
-        elem_dict['_parent_path'] = flow.name
-        el = FlowElement.from_dict(copy.deepcopy(elem_dict))
+        el = FlowElement.from_dict(elem_dict, _parent_path=flow.name)
         check_name(el.name)
         el.src_component_name = 'root'
 
         if flow._elements.get(el.name):
             raise FlowValidationException("Root FlowElement named '{}' is already defined.".format(el.name))
         else:
-            flow._elements[el.name] = el
+            flow.add_element(flow, el)
 
         if component_dir and with_components:
             raise FlowLibException("Only one of component_dir or with_components should be provided")
@@ -128,14 +149,14 @@ def init_flow(flow, component_dir=None, with_components=None):
                     _load_component(el, flow, component=component)
                 _init_component_recursive(el, flow)
             elif component_dir:
-                _load_component(el, flow, component_dir=component_dir)
+                _load_component(el, flow, component_dir=component_dir, component_cache_dir=component_cache_dir)
                 # otherwise, provide component_dir so we can load them only when they are needed
-                _init_component_recursive(el, flow, component_dir)
+                _init_component_recursive(el, flow, component_dir, component_cache_dir)
             else:
                 raise FlowValidationException("Attempted to load component {} but no component_dir or components were specified".format(el.component_path))
 
 
-def _load_component(el, flow, component_dir=None, component=None):
+def _load_component(el, flow, component_dir=None, component=None, component_cache_dir=None):
     """
     Parse and load a component from a dict or from a component_dir.
     If the component already exists then this method does nothing
@@ -144,9 +165,12 @@ def _load_component(el, flow, component_dir=None, component=None):
         raise FlowLibException("Only one of component_dir or component should be provided")
 
     if component_dir:
-        with open(os.path.join(component_dir, el.component_path), 'r') as f:
-            raw_component = yaml.safe_load(f)
-        source_file = f.name.split(component_dir)[1].lstrip(os.sep)
+        if flow.find_component_by_path(el.component_path):
+            # another instance of the component has already loaded the file
+            return
+        path = os.path.join(component_dir, el.component_path)
+        raw_component = _read_component_file(path, component_cache_dir)
+        source_file = path.split(component_dir)[1].lstrip(os.sep)
         log.info("Loading component from file: {}".format(source_file))
         raw_component['source_file'] = source_file
     elif component:
@@ -164,10 +188,50 @@ def _load_component(el, flow, component_dir=None, component=None):
     if flow._loaded_components.get(component_name):
         log.info("A component named {} is already defined, skipping...".format(component_name))
     else:
-        flow._loaded_components[component_name] = FlowComponent(copy.deepcopy(raw_component), **raw_component)
+        # elements are built from the raw component without modifying it, so every instance can share it
+        raw_component = freeze(raw_component)
+        flow._loaded_components[component_name] = FlowComponent(raw_component, **raw_component)
 
 
-def _init_component_recursive(pg_element, flow, component_dir=None):
+def _read_component_file(path, cache_dir=None):
+    """
+    Parse a component yaml file. If a cache_dir is provided, the parsed component is cached there
+      keyed by the hash of the file's contents, so unchanged components are only parsed once
+    :param path: The path of the component file
+    :type path: str
+    :param cache_dir: A directory for caching parsed components
+    :type cache_dir: str
+    :returns: dict The raw component
+    """
+    with open(path, 'rb') as f:
+        contents = f.read()
+    if not cache_dir:
+        return yaml.load(contents, Loader=YamlLoader)
+
+    key = hashlib.sha256(contents)
+    key.update("{}:{}".format(COMPONENT_CACHE_VERSION, yaml.__version__).encode('utf-8'))
+    cached = os.path.join(cache_dir, "{}.pickle".format(key.hexdigest()))
+    if os.path.isfile(cached):
+        try:
+            with open(cached, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            log.warning("Failed to read cached component {}, it will be parsed again: {}".format(cached, e))
+
+    raw_component = yaml.load(contents, Loader=YamlLoader)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so that concurrent runs never read a partial component
+        tmp = "{}.{}.tmp".format(cached, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(raw_component, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cached)
+    except OSError as e:
+        log.warning("Failed to cache component {}: {}".format(path, e))
+    return raw_component
+
+
+def _init_component_recursive(pg_element, flow, component_dir=None, component_cache_dir=None):
     log.info("Loading ProcessGroup: {}".format(pg_element.name))
     component = flow.find_component_by_path(pg_element.component_path)
     if not component:
@@ -196,16 +260,16 @@ def _init_component_recursive(pg_element, flow, component_dir=None):
                 raise FlowValidationException("Missing required_vars. {} is not provided but is required by {}".format(v, component.source_file))
 
     # Call FlowElement.from_dict() on each element in the process_group
+    parent_path = "{}{}{}".format(pg_element._parent_path, Flow.PG_NAME_DELIMETER, pg_element.name)
     for elem_dict in component.process_group:
-        elem_dict['_parent_path'] = "{}{}{}".format(pg_element._parent_path, Flow.PG_NAME_DELIMETER, pg_element.name)
-        el = FlowElement.from_dict(copy.deepcopy(elem_dict))
+        el = FlowElement.from_dict(elem_dict, _parent_path=parent_path)
         check_name(el.name)
         el.src_component_name = component.name
 
         if pg_element._elements.get(el.name):
             raise FlowValidationException("Found duplicate elements. A FlowElement named '{}' is already defined in {}".format(el.name, pg_element.component_ref))
         else:
-            pg_element._elements[el.name] = el
+            flow.add_element(pg_element, el)
 
         if isinstance(el, ProcessGroup):
             if el.component_path == pg_element.component_path:
@@ -214,13 +278,13 @@ def _init_component_recursive(pg_element, flow, component_dir=None):
                 raise FlowValidationException("Circular component reference found in {}. One of this components's ancestors is another instance of this component".format(pg_element.component_path))
             else:
                 if component_dir:
-                    _load_component(el, flow, component_dir=component_dir)
-                _init_component_recursive(el, flow, component_dir=component_dir)
+                    _load_component(el, flow, component_dir=component_dir, component_cache_dir=component_cache_dir)
+                _init_component_recursive(el, flow, component_dir=component_dir, component_cache_dir=component_cache_dir)
 
     component._is_used = True
 
 
-def replace_flow_element_vars_recursive(flow, elements, loaded_components):
+def replace_flow_element_vars_recursive(flow, elements, loaded_components, controller_id=None):
     """
     Recusively apply the variable evaluation to each element in the flow
     :param flow: An unitialized Flow instance
@@ -229,22 +293,24 @@ def replace_flow_element_vars_recursive(flow, elements, loaded_components):
     :type elements: list(flowlib.model.flow.FlowElement)
     :param loaded_components: The components that were imported during flow.init()
     :type loaded_components: map(str:flowlib.model.flow.FlowComponent)
+    :param controller_id: A function returning the id to inject for a controller() lookup, defaults to the controller's NiFi uuid
+    :type controller_id: function
     """
     for el in elements.values():
         if isinstance(el, ProcessGroup):
             source_component = flow.find_component_by_path(el.component_path)
-            _replace_vars(el, source_component)
-            replace_flow_element_vars_recursive(flow, el._elements, loaded_components)
+            _replace_vars(el, source_component, controller_id)
+            replace_flow_element_vars_recursive(flow, el._elements, loaded_components, controller_id)
 
         # This should be called for top-level processors of the flow only
         # which would have access to the global context and nothing else
         elif isinstance(el, Processor):
             # Top level processors may need to reference controller services, so set them explictly before templating
-            _set_global_helpers({ c.name: c for c in flow._controllers })
+            _set_global_helpers({ c.name: c for c in flow._controllers }, controller_id)
             _template_properties(el)
 
 
-def _replace_vars(process_group, source_component):
+def _replace_vars(process_group, source_component, controller_id=None):
     """
     Replace vars for all Processor elements inside a given ProcessGroup
 
@@ -255,16 +321,17 @@ def _replace_vars(process_group, source_component):
     :type process_group: flowlib.model.ProcessGroup
     :param component: The source component that the processGroup was created from
     :type component: flowlib.model.flow.FlowComponent
+    :param controller_id: A function returning the id to inject for a controller() lookup
+    :type controller_id: function
     """
     # Create a dict of vars to replace
-    context = copy.deepcopy(source_component.defaults)
+    context = dict(source_component.defaults)
     if process_group.vars:
         for key,val in process_group.vars.items():
-            t = env.from_string(val)
-            context[key] = t.render(**context)
+            context[key] = _render(val, context)
 
     # Setup controller lookup helper for this process group
-    _set_global_helpers(process_group.controllers)
+    _set_global_helpers(process_group.controllers, controller_id)
 
     # Apply var replacements for each value of processor.config.properties
     for el in process_group._elements.values():
@@ -274,5 +341,34 @@ def _replace_vars(process_group, source_component):
 
 def _template_properties(el, context=dict()):
     for k,v in el.config.properties.items():
-        t = env.from_string(v)
-        el.config.properties[k] = t.render(**context)
+        el.config.properties[k] = _render(v, context)
+
+
+def _render(source, context=None):
+    """
+    Render a template string with the jinja globals and the given context. Compiled templates are cached by their
+      source, and strings which contain no jinja syntax are returned the way jinja would render them without compiling them
+    :param source: The template string
+    :type source: str
+    :param context: The variables available to the template
+    :type context: dict(str:Any)
+    :returns: str
+    """
+    if isinstance(source, str) and '{' not in source and '\r' not in source:
+        # jinja removes a single trailing newline when rendering
+        return source[:-1] if source.endswith('\n') else source
+    return _compile(source).render(**(context or dict()))
+
+
+def _compile(source):
+    if not isinstance(source, str):
+        # not cacheable, let jinja raise the error for it
+        return env.from_string(source)
+    return _compile_cached(source)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _compile_cached(source):
+    # templates look up env.globals when they are rendered, so the helpers and globals
+    # set after a template was compiled and cached are still used
+    return env.from_string(source)
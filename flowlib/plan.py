@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+import collections
+
+from tabulate import tabulate
+
+import flowlib.fingerprint
+from flowlib.logger import log
+from flowlib.exceptions import FlowLibException
+from flowlib.model.flow import Flow, InputPort, OutputPort, ProcessGroup, Processor, RemoteProcessGroup
+
+# A rest api write (or zookeeper transaction) made by a deployment, the endpoint is templated like the endpoints of flowlib.profile
+Operation = collections.namedtuple('Operation', ['phase', 'method', 'endpoint', 'target'])
+
+# the phases whose operations are made concurrently with deploy_concurrency
+CONCURRENT_PHASES = ('elements', 'connections')
+
+_CREATE_ENDPOINTS = {
+    'process_group': '/process-groups/{id}/process-groups',
+    'processor': '/process-groups/{id}/processors',
+    'input_port': '/process-groups/{id}/input-ports',
+    'output_port': '/process-groups/{id}/output-ports',
+    'remote_process_group': '/process-groups/{id}/remote-process-groups'
+}
+
+_DELETE_ENDPOINTS = {
+    'process_group': '/process-groups/{id}',
+    'processor': '/processors/{id}',
+    'input_port': '/input-ports/{id}',
+    'output_port': '/output-ports/{id}',
+    'remote_process_group': '/remote-process-groups/{id}'
+}
+
+
+class DeployPlan:
+    def __init__(self, added=None, removed=None, updated=None, connections_added=None, connections_removed=None, connections_updated=None):
+        """
+        The changes required to turn a previously deployed flow into a new flow
+        :param added: Elements of the new flow which are not in the previous flow. Only the top-most element of
+          each new subtree is listed, its descendants are created along with it
+        :type added: list(FlowElement)
+        :param removed: Elements of the previous flow which are not in the new flow (top-most elements only)
+        :type removed: list(FlowElement)
+        :param updated: (previous, new) pairs of processors whose configuration has changed
+        :type updated: list((Processor, Processor))
+        :param connections_added: Connections of the new flow which must be created
+        :type connections_added: list((FlowElement, FlowElement, Connection, Flow or ProcessGroup))
+        :param connections_removed: Connections of the previous flow which must be deleted
+        :type connections_removed: list((FlowElement, FlowElement, Connection, Flow or ProcessGroup))
+        :param connections_updated: (previous, new) pairs of connections between the same elements for the same
+          relationships whose settings have changed, they are updated in place so that their queues are kept
+        :type connections_updated: list(((FlowElement, FlowElement, Connection, Flow or ProcessGroup), (FlowElement, FlowElement, Connection, Flow or ProcessGroup)))
+        """
+        self.added = added or list()
+        self.removed = removed or list()
+        self.updated = updated or list()
+        self.connections_added = connections_added or list()
+        self.connections_removed = connections_removed or list()
+        self.connections_updated = connections_updated or list()
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.updated or self.connections_added or self.connections_removed
+            or self.connections_updated)
+
+    def added_paths(self):
+        """
+        :returns: set(str) The paths of every added element, including the descendants of added process groups
+        """
+        return set(element_paths(self.added).keys())
+
+    def __repr__(self):
+        return str({
+            'added': [element_path(el) for el in self.added],
+            'removed': [element_path(el) for el in self.removed],
+            'updated': [element_path(el) for _, el in self.updated],
+            'connections_added': [(element_path(s), element_path(d)) for s, d, _, _ in self.connections_added],
+            'connections_removed': [(element_path(s), element_path(d)) for s, d, _, _ in self.connections_removed],
+            'connections_updated': [(element_path(s), element_path(d)) for _, (s, d, _, _) in self.connections_updated]
+        })
+
+
+def element_path(element):
+    """
+    :type element: FlowElement or Flow
+    :returns: str The path of the element on the canvas (e.g flow-name/group-name/element-name)
+    """
+    if isinstance(element, Flow):
+        return element.name
+    return "{}{}{}".format(element.parent_path, Flow.PG_NAME_DELIMETER, element.name)
+
+
+def element_paths(elements):
+    """
+    Recursively map every element (and the descendants of every process group) to its path
+    :param elements: The elements to map
+    :type elements: dict(str:FlowElement) or list(FlowElement)
+    :returns: dict(str:FlowElement)
+    """
+    if isinstance(elements, dict):
+        elements = elements.values()
+
+    paths = dict()
+    for el in elements:
+        paths[element_path(el)] = el
+        if isinstance(el, ProcessGroup):
+            paths.update(element_paths(el._elements))
+    return paths
+
+
+def plan_connections(flow):
+    """
+    Collect every connection defined in the Flow
+    :param flow: The Flow to create connections for
+    :type flow: Flow
+    :returns: list((source FlowElement, destination FlowElement, Connection, the Flow or ProcessGroup containing the connection))
+    """
+    return _plan_connections_recursive(flow, flow._elements)
+
+
+def _plan_connections_recursive(flow, elements):
+    """
+    Recursively collects the connections between elements defined in the Flow
+    :param flow: The Flow to create connections for
+    :type flow: Flow
+    :param elements: a list of FlowElements to connect together
+    :type elements: list(FlowElement)
+    """
+    connections = list()
+    for el in elements.values():
+        if isinstance(el, ProcessGroup):
+            connections.extend(_plan_connections_recursive(flow, el._elements))
+        elif el.type in ['input_port', 'output_port', 'remote_process_group', 'processor']:
+            connections.extend(_plan_element_connections(flow, el))
+        else:
+            raise FlowLibException("Unsupported Element Type: {}".format(el.type))
+    return connections
+
+
+def _plan_element_connections(flow, source_element):
+    """
+    Collect the downstream connections for the element
+    :param flow: The Flow to create connections in
+    :type flow: Flow
+    :param source_element: The source FlowElement to connect to its downstreams
+    :type source_element: FlowElement
+    """
+    parent = flow.get_parent_element(source_element)
+
+    # If source is an output_port then the downstream connections are the parent's connections
+    if isinstance(source_element, OutputPort):
+        # We're only interested in connections from the current output port
+        if parent.connections:
+            connections = [c for c in parent.connections if c.from_port == source_element.name]
+        else:
+            connections = None
+    else:
+        connections = source_element.connections
+
+    if not connections:
+        log.debug("Terminal node, no downstream connections found for element {}".format(source_element.name))
+        return list()
+
+    planned = list()
+    for c in connections:
+        if isinstance(source_element, (InputPort, Processor, RemoteProcessGroup)):
+            group = parent
+        elif isinstance(source_element, OutputPort):
+            # if source is an output port then the connection belongs to the parent's parent
+            # and we need to to search the parent's elements for the destination element
+            group = flow.get_parent_element(parent)
+        else:
+            raise FlowLibException("""
+                Something went wrong, failed while recursively connecting flow elements on the canvas.
+                Cannot create downstream connections for elements of type {}""".format(type(source_element)))
+
+        dest_element = group._elements.get(c.name)
+        if not dest_element:
+            raise FlowLibException("The destination element {} is not defined, must be one of: {}".format(c.name, group._elements.keys()))
+
+        if isinstance(dest_element, ProcessGroup):
+            dest_element = [v for k,v in dest_element._elements.items() if isinstance(v, InputPort) and k == c.to_port][0]
+        elif not isinstance(dest_element, (OutputPort, Processor, RemoteProcessGroup)):
+            raise FlowLibException("""Connections cannot be defined for downstream elements of type 'input_port'.
+              InputPorts can only be referenced from outside of the current component""")
+
+        planned.append((source_element, dest_element, c, group))
+
+    return planned
+
+
+def diff_flows(previous, flow, deployed_configs=None):
+    """
+    Compare a previously deployed flow with a new flow
+    Processor properties are compared as they are, so the new flow should already have had its vars replaced, and so
+      should the previous flow unless the fingerprints of its deployed configs are provided
+    :param previous: The initialized flow that is currently deployed
+    :type previous: Flow
+    :param flow: The initialized flow to deploy
+    :type flow: Flow
+    :param deployed_configs: The fingerprints of the rendered config of each processor as it was deployed, keyed by element path,
+      see flowlib.fingerprint.fingerprint_configs(). The configs of processors which are not in it are compared with the previous flow
+    :type deployed_configs: dict(str:str)
+    :returns: DeployPlan
+    """
+    previous_elements = element_paths(previous._elements)
+    elements = element_paths(flow._elements)
+
+    # elements which changed kind can't be updated in place, so they are removed and added again
+    replaced = set([p for p in previous_elements.keys() & elements.keys() if not _is_same_kind(previous_elements[p], elements[p])])
+    removed = (previous_elements.keys() - elements.keys()) | replaced
+    added = (elements.keys() - previous_elements.keys()) | replaced
+
+    plan = DeployPlan()
+    plan.removed = [previous_elements[p] for p in sorted(removed) if previous_elements[p].parent_path not in removed]
+    plan.added = [elements[p] for p in sorted(added) if elements[p].parent_path not in added]
+    for p in sorted(previous_elements.keys() & elements.keys() - replaced):
+        if not isinstance(elements[p], Processor):
+            continue
+        # the fingerprints can't be compared instead, they don't cover the controller ids injected by controller()
+        if deployed_configs and p in deployed_configs:
+            changed = deployed_configs[p] != flowlib.fingerprint.fingerprint_config(elements[p].config)
+        else:
+            changed = previous_elements[p].config.to_dict() != elements[p].config.to_dict()
+        if changed:
+            plan.updated.append((previous_elements[p], elements[p]))
+
+    def touches(connection, paths):
+        source, dest, _, _ = connection
+        return element_path(source) in paths or element_path(dest) in paths
+
+    previous_connections = {connection_key(c): c for c in plan_connections(previous)}
+    connections = {connection_key(c): c for c in plan_connections(flow)}
+    for k, c in previous_connections.items():
+        # connections inside of a removed process group are deleted along with it
+        if element_path(c[3]) in removed:
+            continue
+        if k not in connections or touches(c, removed):
+            plan.connections_removed.append(c)
+    for k, c in connections.items():
+        if k not in previous_connections or touches(c, added):
+            plan.connections_added.append(c)
+        elif c[2].as_dict() != previous_connections[k][2].as_dict():
+            plan.connections_updated.append((previous_connections[k], c))
+
+    return plan
+
+
+def _is_same_kind(previous, element):
+    if previous.type != element.type:
+        return False
+    if isinstance(element, Processor):
+        return previous.config.package_id == element.config.package_id
+    if isinstance(element, RemoteProcessGroup):
+        return previous.config.to_dict() == element.config.to_dict()
+    return True
+
+
+def connection_key(connection):
+    """
+    :param connection: A planned connection, see plan_connections
+    :type connection: (FlowElement, FlowElement, Connection, Flow or ProcessGroup)
+    :returns: tuple A key identifying the connection by its source and destination and its relationships. The ports
+      are included for the remote ports of remote process groups, the other settings of a connection can be updated in place
+    """
+    source, dest, c, _ = connection
+    return (element_path(source), c.from_port, element_path(dest), c.to_port, tuple(sorted(c.relationships or [])))
+
+
+def deploy_operations(flow, replaced=None, top_level_groups=1, migrated_states=0, snapshot=False, state_node=None,
+                      keep_previous=0, retained=None):
+    """
+    The operations of a full deployment of a flow, in the order they are made
+    :param flow: The initialized flow to deploy
+    :type flow: Flow
+    :param replaced: The ids of the connections and the names of the controller services of the deployed flow,
+      which is removed once the new flow is created. None if the flow is not deployed
+    :type replaced: (list(str), list(str))
+    :param top_level_groups: The number of top level process groups on the canvas once the flow is deployed
+    :type top_level_groups: int
+    :param migrated_states: The number of processors whose state is migrated from the deployed flow
+    :type migrated_states: int
+    :param snapshot: Whether the flow is created with a single upload of a flow snapshot
+    :type snapshot: bool
+    :param state_node: The zookeeper node that processor state is written to
+    :type state_node: str
+    :param keep_previous: How many replaced flows are kept instead of being removed
+    :type keep_previous: int
+    :param retained: The flows kept by previous deployments keyed by how many deployments ago they were replaced,
+      with the ids of the connections and the names of the controller services of the ones which are removed
+    :type retained: dict(int:(list(str), list(str)) or None)
+    :returns: list(Operation)
+    """
+    deploying = "(deploying) {}".format(flow.name)
+    ops = list()
+    if snapshot:
+        ops.append(Operation('elements', 'POST', '/process-groups/{id}/process-groups/upload', deploying))
+    else:
+        ops.append(Operation('controllers', 'POST', _CREATE_ENDPOINTS['process_group'], deploying))
+        for c in flow._controllers:
+            ops.append(Operation('controllers', 'POST', '/process-groups/{id}/controller-services', c.name))
+            ops.extend([Operation('controllers', 'PUT', '/controller-services/{id}', c.name)] * 2)
+        # elements are created one level of process groups at a time
+        groups = [flow._elements]
+        while groups:
+            children = list()
+            for elements in groups:
+                for el in elements.values():
+                    ops.append(Operation('elements', 'POST', _CREATE_ENDPOINTS[el.type], element_path(el)))
+                    if isinstance(el, ProcessGroup):
+                        children.append(el._elements)
+            groups = children
+
+    if migrated_states:
+        ops.append(Operation('state', 'MULTI', state_node, "{} processors".format(migrated_states)))
+    if not snapshot:
+        ops.extend(_create_connection_operations(plan_connections(flow)))
+    for c in flow._controllers:
+        ops.append(Operation('enable', 'PUT', '/controller-services/{id}/run-status', c.name))
+
+    if replaced is not None and keep_previous:
+        retained = retained or dict()
+        for k in sorted(retained.keys(), reverse=True):
+            name = "(previous-{}) {}".format(k, flow.name)
+            if k >= keep_previous:
+                ops.extend(_remove_operations(name, *retained[k]))
+            else:
+                ops.append(Operation('remove', 'PUT', '/process-groups/{id}', name))
+        ops.append(Operation('remove', 'PUT', '/flow/process-groups/{id}', flow.name))
+        for c in replaced[1]:
+            ops.append(Operation('remove', 'PUT', '/controller-services/{id}/run-status', c))
+        ops.append(Operation('remove', 'PUT', '/process-groups/{id}', flow.name))
+    elif replaced is not None:
+        ops.extend(_remove_operations(flow.name, *replaced))
+
+    ops.append(Operation('save', 'PUT', '/process-groups/{id}', flow.name))
+    ops.extend([Operation('save', 'PUT', '/process-groups/{id}', 'top level layout')] * top_level_groups)
+    ops.append(Operation('save', 'PUT', '/process-groups/{id}', flow.name))
+    return ops
+
+
+def incremental_operations(flow, plan, stopped=None, migrated_states=0, state_node=None):
+    """
+    The operations of an incremental deployment of a flow, in the order they are made
+    :param flow: The initialized flow to deploy
+    :type flow: Flow
+    :param plan: The changes between the deployed flow and the new flow
+    :type plan: DeployPlan
+    :param stopped: The elements which are stopped while the changes are made, and started again afterwards
+    :type stopped: list(FlowElement)
+    :param migrated_states: The number of re-created processors whose state is migrated
+    :type migrated_states: int
+    :param state_node: The zookeeper node that processor state is written to
+    :type state_node: str
+    :returns: list(Operation)
+    """
+    # processors and ports are scheduled with a single call per process group
+    groups = sorted(set(el.parent_path for el in stopped or list() if isinstance(el, (Processor, InputPort, OutputPort))))
+    removed_paths = set(element_paths(plan.removed).keys())
+    ops = [Operation('stop', 'PUT', '/flow/process-groups/{id}', path) for path in groups]
+
+    for source, dest, _, _ in plan.connections_removed:
+        target = "{} -> {}".format(element_path(source), element_path(dest))
+        ops.append(Operation('remove', 'POST', '/flowfile-queues/{id}/drop-requests', target))
+        ops.append(Operation('remove', 'DELETE', '/connections/{id}', target))
+    for el in plan.removed:
+        ops.append(Operation('remove', 'DELETE', _DELETE_ENDPOINTS[el.type], element_path(el)))
+    for _, el in plan.updated:
+        ops.append(Operation('update', 'PUT', '/processors/{id}', element_path(el)))
+    for _, (source, dest, _, _) in plan.connections_updated:
+        ops.append(Operation('update', 'PUT', '/connections/{id}', "{} -> {}".format(element_path(source), element_path(dest))))
+    for path, el in element_paths(plan.added).items():
+        ops.append(Operation('elements', 'POST', _CREATE_ENDPOINTS[el.type], path))
+    if migrated_states:
+        ops.append(Operation('state', 'MULTI', state_node, "{} processors".format(migrated_states)))
+    ops.extend(_create_connection_operations(plan.connections_added))
+
+    # processors whose parent was removed are removed along with it
+    started = set(el.parent_path for el in stopped or list() if element_path(el) not in removed_paths
+        and isinstance(el, (Processor, InputPort, OutputPort)))
+    ops.extend([Operation('start', 'PUT', '/flow/process-groups/{id}', path) for path in groups if path in started])
+    ops.append(Operation('save', 'PUT', '/process-groups/{id}', flow.name))
+    return ops
+
+
+def _remove_operations(name, connections, controllers):
+    """
+    :param name: The name of the flow which is removed
+    :type name: str
+    :param connections: The ids of the flow's connections
+    :type connections: list(str)
+    :param controllers: The names of the flow's controller services
+    :type controllers: list(str)
+    :returns: list(Operation) The operations which remove a deployed flow
+    """
+    ops = [Operation('remove', 'PUT', '/flow/process-groups/{id}', name)]
+    for c in connections:
+        ops.append(Operation('remove', 'POST', '/flowfile-queues/{id}/drop-requests', c))
+        ops.append(Operation('remove', 'DELETE', '/connections/{id}', c))
+    for c in controllers:
+        ops.append(Operation('remove', 'PUT', '/controller-services/{id}/run-status', c))
+        ops.append(Operation('remove', 'DELETE', '/controller-services/{id}', c))
+    ops.append(Operation('remove', 'DELETE', _DELETE_ENDPOINTS['process_group'], name))
+    return ops
+
+
+def _create_connection_operations(connections):
+    return [Operation('connections', 'POST', '/process-groups/{id}/connections',
+        "{} -> {}".format(element_path(source), element_path(dest))) for source, dest, _, _ in connections]
+
+
+def estimate_seconds(operations, latencies, default_latency, concurrency=1):
+    """
+    Estimate how long making the operations takes
+    :param latencies: The measured seconds per call of each (method, endpoint)
+    :type latencies: dict((str, str):float)
+    :param default_latency: The seconds per call of the operations whose endpoint was not measured
+    :type default_latency: float
+    :param concurrency: The max number of calls made concurrently for the operations of CONCURRENT_PHASES
+    :type concurrency: int
+    :returns: float
+    """
+    seconds = 0
+    for op in operations:
+        latency = latencies.get((op.method, op.endpoint), default_latency)
+        seconds += latency / concurrency if op.phase in CONCURRENT_PHASES else latency
+    return seconds
+
+
+def format_operations(operations, seconds=None):
+    """
+    :param operations: The operations of a deployment
+    :type operations: list(Operation)
+    :param seconds: The estimated duration of the deployment
+    :type seconds: float
+    :returns: str Tables of the operations in order and of the number of operations per phase and endpoint
+    """
+    rows = [[i + 1, op.phase, op.method, op.endpoint, op.target] for i, op in enumerate(operations)]
+    tables = [tabulate(rows, headers=['#', 'Phase', 'Method', 'Endpoint', 'Target'], tablefmt='psql')]
+
+    counts = collections.Counter((op.phase, op.method, op.endpoint) for op in operations)
+    rows = [[phase, method, endpoint, count] for (phase, method, endpoint), count in counts.items()]
+    rows.append(['total', '', '', len(operations)])
+    tables.append(tabulate(rows, headers=['Phase', 'Method', 'Endpoint', 'Operations'], tablefmt='psql'))
+    if seconds is not None:
+        tables.append("Estimated duration: {:.1f} seconds".format(seconds))
+    return '\n'.join(tables)
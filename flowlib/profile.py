@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Record the time spent in every NiFi, NiFi Registry and ZooKeeper call and in each phase of a deployment.
+  Profiling is off unless enable() is called, recording a call is then a few appends under a lock
+"""
+import collections
+import contextlib
+import json
+import re
+import threading
+import time
+
+from tabulate import tabulate
+
+TRACE_VERSION = 1
+SLOWEST_CALLS = 10
+
+# NiFi and NiFi Registry identifiers, replaced in the path of each call so that calls are grouped by endpoint
+_ID = re.compile(r'/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)')
+_API_ROOT = re.compile(r'^.*?/(nifi-api|nifi-registry-api)(?=/|$)')
+
+_profiler = None
+
+
+class Profiler:
+    def __init__(self):
+        """
+        :attr calls: A dict for every call with its service, method, endpoint, path, status, start, seconds,
+          bytes_sent, bytes_received, phase and thread
+        :type calls: list(dict)
+        :attr phases: A dict for every phase with its name, start and seconds
+        :type phases: list(dict)
+        """
+        self.started = time.time()
+        self.calls = list()
+        self.phases = list()
+        self._start = time.perf_counter()
+        self._phase = list()
+        self._threads = dict()
+        self._lock = threading.Lock()
+
+    def now(self):
+        """
+        :returns: float The seconds since profiling started
+        """
+        return time.perf_counter() - self._start
+
+    def record(self, service, method, path, status, start, seconds, bytes_sent=0, bytes_received=0):
+        """
+        :param service: nifi, registry or zookeeper
+        :type service: str
+        :param path: The url path or zookeeper node of the call
+        :type path: str
+        :param status: The http status of the response, or the name of the exception raised by the call
+        :type status: int or str
+        :param start: When the call started, from now()
+        :type start: float
+        """
+        path = _API_ROOT.sub('', path.split('?')[0])
+        with self._lock:
+            self.calls.append({
+                'service': service,
+                'method': method,
+                'endpoint': _ID.sub('/{id}', path),
+                'path': path,
+                'status': status,
+                'start': start,
+                'seconds': seconds,
+                'bytes_sent': bytes_sent,
+                'bytes_received': bytes_received,
+                'phase': self._phase[-1] if self._phase else None,
+                'thread': self._threads.setdefault(threading.get_ident(), len(self._threads))
+            })
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        with self._lock:
+            self._phase.append(name)
+        start = self.now()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phase.pop()
+                self.phases.append({'name': name, 'start': start, 'seconds': self.now() - start})
+
+    def summary(self):
+        """
+        :returns: str Tables of the calls and time spent per endpoint, the slowest calls and the time spent in each phase
+        """
+        with self._lock:
+            calls, phases = list(self.calls), list(self.phases)
+        if not calls and not phases:
+            return "No calls were recorded"
+
+        endpoints = collections.OrderedDict()
+        for c in calls:
+            endpoints.setdefault((c['service'], c['method'], c['endpoint']), list()).append(c)
+        rows = list()
+        for (service, method, endpoint), group in endpoints.items():
+            rows.append(['{} {}'.format(method, endpoint), service] + _stats(group))
+        rows.sort(key=lambda r: -r[3])
+        if calls:
+            rows.append(['total', ''] + _stats(calls))
+        headers = ['Endpoint', 'Service', 'Calls', 'Total s', 'p50 ms', 'p95 ms', 'p99 ms', 'Max ms', 'KB sent', 'KB received']
+        tables = [tabulate(rows, headers=headers, floatfmt=('', '', '', '.3f', '.1f', '.1f', '.1f', '.1f', '.1f', '.1f'), tablefmt='psql')]
+
+        slowest = sorted(calls, key=lambda c: -c['seconds'])[:SLOWEST_CALLS]
+        rows = [['{} {}'.format(c['method'], c['path']), c['status'], c['seconds'] * 1000, c['phase'] or ''] for c in slowest]
+        tables.append(tabulate(rows, headers=['Slowest calls', 'Status', 'ms', 'Phase'], floatfmt='.1f', tablefmt='psql'))
+
+        if phases:
+            # a phase may be entered more than once, e.g. when several flows are deployed
+            seconds = collections.OrderedDict()
+            for p in sorted(phases, key=lambda p: p['start']):
+                seconds[p['name']] = seconds.get(p['name'], 0) + p['seconds']
+            counts = collections.Counter(c['phase'] for c in calls)
+            rows = [[name, total, counts[name]] for name, total in seconds.items()]
+            tables.append(tabulate(rows, headers=['Phase', 'Seconds', 'Calls'], floatfmt='.3f', tablefmt='psql'))
+        return '\n'.join(tables)
+
+    def trace(self):
+        """
+        :returns: dict The calls and phases in the Trace Event Format, which can be opened with chrome://tracing or https://ui.perfetto.dev
+        """
+        with self._lock:
+            calls, phases = list(self.calls), list(self.phases)
+        events = [{
+            'name': p['name'], 'cat': 'phase', 'ph': 'X', 'pid': 1, 'tid': 0,
+            'ts': int(p['start'] * 1e6), 'dur': int(p['seconds'] * 1e6)
+        } for p in phases]
+        events.extend([{
+            'name': '{} {}'.format(c['method'], c['endpoint']), 'cat': c['service'], 'ph': 'X', 'pid': 1, 'tid': c['thread'] + 1,
+            'ts': int(c['start'] * 1e6), 'dur': int(c['seconds'] * 1e6),
+            'args': {k: c[k] for k in ['path', 'status', 'bytes_sent', 'bytes_received', 'phase']}
+        } for c in calls])
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'version': TRACE_VERSION, 'started': self.started}}
+
+    def write_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f)
+
+
+def enable():
+    """
+    Start recording calls and phases, any previous recording is discarded
+    :returns: Profiler
+    """
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    """
+    Stop recording calls and phases
+    :returns: Profiler The recording, or None if profiling was not enabled
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def profiler():
+    """
+    :returns: Profiler The current recording, or None if profiling is not enabled
+    """
+    return _profiler
+
+
+@contextlib.contextmanager
+def call(service, method, path, bytes_sent=0):
+    """
+    Time a call which is not made over http. The yielded dict may be updated with the status and bytes_received of the call
+    """
+    p = _profiler
+    result = {'status': 'ok', 'bytes_received': 0}
+    if not p:
+        yield result
+        return
+    start = p.now()
+    try:
+        yield result
+    except Exception as e:
+        result['status'] = type(e).__name__
+        raise
+    finally:
+        p.record(service, method, path, result['status'], start, p.now() - start, bytes_sent, result['bytes_received'])
+
+
+def phase(name):
+    """
+    :returns: A context manager which records the time spent in a phase of a deployment, calls made within it are attributed to it
+    """
+    p = _profiler
+    return p.phase(name) if p else contextlib.nullcontext()
+
+
+def _percentile(values, percent):
+    # nearest-rank, values must be sorted
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+def _stats(calls):
+    seconds = sorted(c['seconds'] for c in calls)
+    return [
+        len(calls),
+        sum(seconds),
+        _percentile(seconds, 50) * 1000,
+        _percentile(seconds, 95) * 1000,
+        _percentile(seconds, 99) * 1000,
+        seconds[-1] * 1000,
+        sum(c['bytes_sent'] for c in calls) / 1024,
+        sum(c['bytes_received'] for c in calls) / 1024
+    ]
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import re
 
+import flowlib.layout
 from flowlib.exceptions import FlowValidationException
 from flowlib.model.flow import InputPort, OutputPort, ProcessGroup, RemoteProcessGroup, Processor
 
@@ -42,6 +43,11 @@ def check_name(name):
         raise FlowValidationException("Invalid name '{}'. Names must match the regular expression: '{}'".format(name, name_regex))
 
 
+def check_layout(layout_type):
+    if layout_type not in flowlib.layout.LAYOUT_TYPES:
+        raise FlowValidationException("Invalid layout '{}'. The layout must be one of: {}".format(layout_type, ', '.join(flowlib.layout.LAYOUT_TYPES)))
+
+
 def is_component_circular(flow, pg_element):
     """
     Check whether any of the ProcessGroup's ancestors are an instance of this
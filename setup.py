@@ -11,6 +11,9 @@ setup(
     },
     include_package_data=True,
     install_requires=['nipyapi>=0.13.3', 'pyyaml', 'jinja2>=2.7', 'kazoo>=2.6.1', 'numpy>=1.17.0', 'networkx>=2.3', 'tabulate'],
+    extras_require={
+        'async': ['aiohttp>=3.6'],
+    },
     author="David Kegley",
     author_email="kegs@b23.io",
     description="A library for composing and deploying NiFi flows from YAML",
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Time deploying flows with many elements to a fake NiFi, and count the rest api calls the deployment makes.
+  The fake runs in a separate process so that the peak memory is only the memory used by flowlib.
+  Run with: python -m tests.benchmarks.bench_deploy [--latency seconds] [--snapshot] [--concurrency n] [elements ...]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+import flowlib.nifi.rest
+from flowlib.logger import log
+from flowlib.model.config import FlowLibConfig
+from flowlib.model.flow import Flow
+from tests.benchmarks.bench_parser import synthetic_component, synthetic_flow
+from tests.fake_nifi import FakeNiFi
+
+ELEMENTS = [100, 500, 1000, 5000]
+PROCESSORS = 9
+PROPERTIES = 4
+TOP_ENDPOINTS = 8
+
+
+def _serve(conn, latency):
+    with FakeNiFi(latency=latency) as nifi:
+        conn.send(nifi.endpoint)
+        conn.recv()
+        conn.send(dict(nifi.calls))
+
+
+def deploy(raw, component_dir, config, trace=False):
+    """
+    Deploy the flow to a new fake NiFi
+    :returns: (float, int, dict(str:int)) The seconds the deployment took, the peak memory and the calls made to each endpoint
+    """
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(child_conn, config.latency), daemon=True)
+    server.start()
+    try:
+        deploy_config = FlowLibConfig(nifi_endpoint=conn.recv(), snapshot_deploy=config.snapshot,
+            deploy_concurrency=config.concurrency)
+        flow = Flow(raw, **raw)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        flow.initialize(component_dir)
+        flow.validate()
+        flowlib.nifi.rest.deploy_flow(flow, deploy_config)
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        conn.send('stop')
+        return elapsed, peak, conn.recv()
+    finally:
+        server.join(5)
+
+
+def main(args):
+    log.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as component_dir:
+        with open(os.path.join(component_dir, 'bench-component.yaml'), 'w') as f:
+            yaml.safe_dump(synthetic_component(PROCESSORS, PROPERTIES), f)
+
+        print("{:>10} {:>10} {:>10} {:>15} {:>10}".format('elements', 'seconds', 'calls', 'calls/element', 'peak MB'))
+        results = list()
+        for elements in args.elements:
+            # every instance of the component is a process group with its processors
+            raw = synthetic_flow(max(1, elements // (PROCESSORS + 1)))
+            total = len(raw['canvas']) * (PROCESSORS + 1)
+            elapsed, _, calls = deploy(raw, component_dir, args)
+            # measured separately since tracing allocations slows everything down
+            _, peak, _ = deploy(raw, component_dir, args, trace=True)
+            count = sum(calls.values())
+            print("{:>10} {:>10.3f} {:>10} {:>15.1f} {:>10.1f}".format(total, elapsed, count, count / total, peak / 2 ** 20))
+            results.append((total, calls))
+
+        for total, calls in results:
+            print("\n{} elements".format(total))
+            for endpoint, count in sorted(calls.items(), key=lambda c: -c[1])[:TOP_ENDPOINTS]:
+                print("{:>10} {}".format(count, endpoint))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('elements', type=int, nargs='*', default=ELEMENTS)
+    parser.add_argument('--latency', type=float, default=0, help='The latency of every rest api call in seconds')
+    parser.add_argument('--snapshot', action='store_true', help='Deploy each flow with snapshot_deploy')
+    parser.add_argument('--concurrency', type=int, default=None, help='The deploy_concurrency to deploy with')
+    main(parser.parse_args())
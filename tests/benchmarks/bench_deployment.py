@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the size and the time to save and load a deployment as plain json and with FlowDeployment.encode().
+  Run with: python -m tests.benchmarks.bench_deployment [deployment.json] [components]
+"""
+import io
+import os
+import sys
+import time
+
+from flowlib.model.deployment import DeployedComponent, FlowDeployment
+
+DEPLOYMENT = os.path.join(os.path.dirname(__file__), '..', '..', 'docs', 'deployment.json')
+REPEAT = 200
+
+
+def _json(deployment):
+    s = io.StringIO()
+    deployment.save(s)
+    return s.getvalue()
+
+
+def _time(fn, arg):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(arg)
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main(path, components):
+    with open(path, 'r') as f:
+        deployment = FlowDeployment.decode(f.read())
+    # scale the deployment up to the given number of components by repeating the ones it has
+    original = list(deployment.components)
+    while len(deployment.components) < components:
+        c = original[len(deployment.components) % len(original)]
+        deployment.add_component(DeployedComponent(dict(c.component, name="{}-{}".format(c.component['name'], len(deployment.components))), c.stateful_processors))
+
+    print("{:>10} {:>10} {:>10} {:>10} {:>10}".format('components', 'encoding', 'bytes', 'save ms', 'load ms'))
+    for name, encode in [('json', _json), ('flowlib', FlowDeployment.encode)]:
+        s = encode(deployment)
+        print("{:>10} {:>10} {:>10} {:>10.3f} {:>10.3f}".format(
+            len(deployment.components), name, len(s), _time(encode, deployment), _time(FlowDeployment.decode, s)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else DEPLOYMENT, int(sys.argv[2]) if len(sys.argv) > 2 else 0)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the layout engines on synthetic process groups, run with: python -m tests.benchmarks.bench_layout [size ...]
+"""
+import os
+import random
+import sys
+import time
+
+import flowlib.layout
+from flowlib.model.flow import FlowElement
+
+SIZES = [50, 500]
+LAYOUTS = ['layered', 'spring']
+# the number of process groups to lay out when comparing serial and process pool layouts
+GROUPS = 16
+
+
+def synthetic_group(size, seed=0):
+    """
+    A process group shaped like a typical flow, each element connects to 1-3 of the next few elements
+      and a few connections loop back (e.g. retries)
+    :returns: dict(str:FlowElement)
+    """
+    rng = random.Random(seed)
+    elements = dict()
+    for i in range(size):
+        dests = {min(size - 1, i + rng.randint(1, 5)) for _ in range(rng.randint(1, 3))} if i < size - 1 else set()
+        if i > 10 and rng.random() < 0.05:
+            dests.add(i - rng.randint(1, 10))
+        name = 'element-{}'.format(i)
+        elements[name] = FlowElement.from_dict({
+            'name': name,
+            'type': 'processor',
+            '_parent_path': 'bench',
+            'config': {'package_id': 'org.apache.nifi.processors.standard.DebugFlow'},
+            'connections': [{'name': 'element-{}'.format(d)} for d in sorted(dests)]
+        })
+    return elements
+
+
+def upward_connections(elements, positions):
+    """
+    :returns: int The number of connections whose destination is placed above their source
+    """
+    return sum(1 for el in elements.values() for c in el.connections if positions[c.name][1] < positions[el.name][1])
+
+
+def main(sizes):
+    print("{:>6} {:>8} {:>10} {:>10}".format('size', 'layout', 'seconds', 'upward'))
+    for size in sizes:
+        elements = synthetic_group(size)
+        connections = sum(len(el.connections) for el in elements.values())
+        for layout_type in LAYOUTS:
+            start = time.perf_counter()
+            positions = flowlib.layout.generate_layout(elements, layout_type)
+            elapsed = time.perf_counter() - start
+            print("{:>6} {:>8} {:>10.3f} {:>4}/{:<5}".format(size, layout_type, elapsed,
+                upward_connections(elements, positions), connections))
+
+    print("\n{:>6} {:>8} {:>10} {:>10}".format('groups', 'layout', 'processes', 'seconds'))
+    groups = [synthetic_group(max(sizes), seed) for seed in range(GROUPS)]
+    for layout_type in LAYOUTS:
+        for processes in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            flowlib.layout.LayoutCache().get_layouts(groups, layout_type, processes)
+            print("{:>6} {:>8} {:>10} {:>10.3f}".format(len(groups), layout_type, processes, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or SIZES)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the memory retained by an initialized flow with many elements.
+  Run with: python -m tests.benchmarks.bench_model [elements]
+"""
+import gc
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import yaml
+
+from flowlib.logger import log
+from flowlib.model.deployment import DeployedComponent, FlowDeployment
+from tests.benchmarks.bench_parser import init, synthetic_component, synthetic_flow
+
+ELEMENTS = 10000
+PROCESSORS = 50
+PROPERTIES = 4
+
+
+def count_elements(elements):
+    return sum(1 + (count_elements(e._elements) if hasattr(e, '_elements') else 0) for e in elements.values())
+
+
+def main(elements):
+    log.setLevel(logging.WARNING)
+    raw = synthetic_flow(max(1, elements // PROCESSORS))
+    with tempfile.TemporaryDirectory() as component_dir:
+        with open(os.path.join(component_dir, 'bench-component.yaml'), 'w') as f:
+            yaml.safe_dump(synthetic_component(PROCESSORS, PROPERTIES), f)
+        # warm up the template and component caches so that only the flow is measured
+        init(raw, component_dir)
+
+        gc.collect()
+        tracemalloc.start()
+        flow = init(raw, component_dir)
+        deployment = FlowDeployment(raw)
+        for c in flow.components.values():
+            deployment.add_component(DeployedComponent(c.raw))
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    total = count_elements(flow._elements)
+    print("{:>10} {:>10} {:>15}".format('elements', 'MB', 'bytes/element'))
+    print("{:>10} {:>10.1f} {:>15.0f}".format(total, retained / 2 ** 20, retained / total))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ELEMENTS)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Time initializing and templating a flow with many processor properties, with and without the compiled template cache.
+  Run with: python -m tests.benchmarks.bench_parser [instances]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+import flowlib.parser
+from flowlib.logger import log
+from flowlib.model.flow import Flow
+from flowlib.model.frozen import freeze
+
+INSTANCES = 20
+PROCESSORS = 50
+PROPERTIES = 20
+
+
+def synthetic_component(processors=PROCESSORS, properties=PROPERTIES):
+    """
+    A component with a chain of processors, half of their property values are literals and the rest
+      are the same few templates, like most flows
+    """
+    process_group = list()
+    for i in range(processors):
+        props = dict()
+        for j in range(properties):
+            if j % 2 == 0:
+                props['literal-{}'.format(j)] = 'value-{}'.format(j)
+            elif j % 3 == 0:
+                props['global-{}'.format(j)] = "{{ bucket }}/output"
+            else:
+                props['var-{}'.format(j)] = "{{ prefix }}-{{ suffix | upper }}"
+        process_group.append({
+            'name': 'processor-{}'.format(i),
+            'type': 'processor',
+            'config': {'package_id': 'org.apache.nifi.processors.standard.DebugFlow', 'properties': props},
+            'connections': [{'name': 'processor-{}'.format(i + 1)}] if i < processors - 1 else list()
+        })
+    return {'name': 'bench-component', 'defaults': {'suffix': 'default'}, 'required_vars': ['prefix'], 'process_group': process_group}
+
+
+def synthetic_flow(instances=INSTANCES):
+    return {
+        'name': 'bench-flow',
+        'version': '1.0',
+        'global_vars': {'bucket': 's3://bucket'},
+        'canvas': [{
+            'name': 'instance-{}'.format(i),
+            'type': 'process_group',
+            'component_path': 'bench-component.yaml',
+            'vars': {'prefix': "{{ bucket }}-instance-{}".format(i)}
+        } for i in range(instances)]
+    }
+
+
+def init(raw, component_dir):
+    raw = freeze(raw)
+    flow = Flow(raw, **raw)
+    flow.initialize(component_dir)
+    flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components)
+    return flow
+
+
+def _render_uncached(source, context=None):
+    # how every value was templated before the cache
+    return flowlib.parser.env.from_string(source).render(**(context or dict()))
+
+
+def main(instances):
+    log.setLevel(logging.WARNING)
+    raw = synthetic_flow(instances)
+    properties = instances * PROCESSORS * PROPERTIES
+    with tempfile.TemporaryDirectory() as component_dir:
+        with open(os.path.join(component_dir, 'bench-component.yaml'), 'w') as f:
+            yaml.safe_dump(synthetic_component(), f)
+
+        cached = flowlib.parser._render
+        print("{:>10} {:>10} {:>10} {:>10}".format('properties', 'cache', 'seconds', 'peak MB'))
+        for name, render in [('off', _render_uncached), ('on', cached)]:
+            flowlib.parser._render = render
+            flowlib.parser._compile_cached.cache_clear()
+            try:
+                start = time.perf_counter()
+                init(raw, component_dir)
+                elapsed = time.perf_counter() - start
+                # measured separately since tracing allocations slows everything down
+                tracemalloc.start()
+                init(raw, component_dir)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print("{:>10} {:>10} {:>10.3f} {:>10.1f}".format(properties, name, elapsed, peak / 2 ** 20))
+            finally:
+                flowlib.parser._render = cached
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else INSTANCES)
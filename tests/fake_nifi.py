@@ -0,0 +1,676 @@
+# -*- coding: utf-8 -*-
+"""
+An in-process fake of the NiFi and NiFi Registry rest apis, for testing and benchmarking deployments without a NiFi instance.
+  It keeps the canvas in memory and implements the endpoints that flowlib.nifi.rest and flowlib.nifi.docs call (through nipyapi)
+  well enough for flows to be deployed, exported, re-deployed and removed. Every call is counted by endpoint and can be
+  delayed to simulate the latency of a real NiFi instance
+"""
+import collections
+import email.parser
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+NIFI_VERSION = '1.11.4'
+BUNDLE = {'group': 'org.apache.nifi', 'artifact': 'nifi-standard-nar', 'version': NIFI_VERSION}
+PROCESSOR_TYPES = [
+    'org.apache.nifi.processors.standard.DebugFlow',
+    'org.apache.nifi.processors.standard.GenerateFlowFile',
+    'org.apache.nifi.processors.standard.ListFile',
+    'org.apache.nifi.processors.standard.LogAttribute',
+    'org.apache.nifi.processors.standard.UpdateAttribute'
+]
+CONTROLLER_SERVICE_TYPES = ['io.b23.test_controller_service', 'org.apache.nifi.ssl.StandardSSLContextService']
+REPORTING_TASK_TYPES = ['org.apache.nifi.controller.ControllerStatusReportingTask']
+# processors of these types are created with persistsState set, like the NiFi processors which keep state
+STATEFUL_TYPES = ['org.apache.nifi.processors.standard.ListFile']
+
+# the kinds of entities which are contained in a process group, with the key of their list in a FlowDTO
+GROUP_KINDS = collections.OrderedDict([
+    ('process_group', 'processGroups'),
+    ('processor', 'processors'),
+    ('input_port', 'inputPorts'),
+    ('output_port', 'outputPorts'),
+    ('remote_process_group', 'remoteProcessGroups'),
+    ('connection', 'connections'),
+    ('controller_service', 'controllerServices')
+])
+PORT_TYPES = {'input_port': 'INPUT_PORT', 'output_port': 'OUTPUT_PORT'}
+
+
+class FakeNiFiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeNiFi:
+    """
+    Usage:
+        with FakeNiFi(latency=0.005) as nifi:
+            config = FlowLibConfig(nifi_endpoint=nifi.endpoint)
+            flowlib.nifi.rest.deploy_flow(flow, config)
+            print(nifi.calls)
+    """
+    def __init__(self, latency=0, version=NIFI_VERSION, stateful_types=None):
+        """
+        :param latency: The delay of every call in seconds, or a function of (method, endpoint) returning the delay
+        :type latency: float or function
+        :param version: The NiFi version to report
+        :type version: str
+        :param stateful_types: The processor types which are created with persistsState set
+        :type stateful_types: list(str)
+        :attr calls: The number of calls made to each endpoint, keyed by 'METHOD /endpoint/{id}'
+        :type calls: collections.Counter
+        :attr states: The cluster state of processors keyed by processor id, returned when the state of a processor is read
+        :type states: dict(str:dict)
+        :attr fail: A function of (method, endpoint) returning the http status to fail a call with, or None to handle it
+        :type fail: function
+        """
+        self.latency = latency
+        self.fail = None
+        self.version = version
+        self.stateful_types = STATEFUL_TYPES if stateful_types is None else stateful_types
+        self.calls = collections.Counter()
+        self.states = dict()
+        self._entities = dict()
+        self._kinds = dict()
+        self._children = collections.defaultdict(lambda: {kind: collections.OrderedDict() for kind in GROUP_KINDS})
+        self._controller_services = collections.OrderedDict()
+        self._reporting_tasks = collections.OrderedDict()
+        self._controller_config = {'maxTimerDrivenThreadCount': 10, 'maxEventDrivenThreadCount': 1}
+        self._buckets = collections.OrderedDict()
+        self._flows = collections.OrderedDict()
+        self._versions = collections.defaultdict(list)
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self.root_id = self._add('process_group', None, {'name': 'NiFi Flow'})['id']
+        self._routes = [(method, _route(template), template, getattr(self, handler)) for method, template, handler in ROUTES]
+
+    @property
+    def endpoint(self):
+        """
+        :returns: str The url of the fake, for FlowLibConfig.nifi_endpoint
+        """
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def start(self):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _handler(self))
+        self._server.daemon_threads = True
+        # poll often so that stopping the server doesn't wait for the default half second
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.01,), name='fake-nifi', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def find(self, kind, name=None):
+        """
+        :param kind: The kind of entity, e.g. processor or process_group
+        :type kind: str
+        :param name: Only return entities with this name
+        :type name: str
+        :returns: list(dict) The entities of that kind on the canvas
+        """
+        with self._lock:
+            return [e for i, e in self._entities.items() if self._kinds[i] == kind and (name is None or e['component']['name'] == name)]
+
+    def add_bucket(self, name):
+        """
+        :returns: str The identifier of a new NiFi Registry bucket
+        """
+        bucket_id = str(uuid.uuid4())
+        self._buckets[bucket_id] = {'identifier': bucket_id, 'name': name, 'createdTimestamp': int(time.time() * 1000),
+            'link': {'href': 'buckets/{}'.format(bucket_id), 'params': {'rel': 'self'}}}
+        return bucket_id
+
+    def add_flow_version(self, bucket_id, name, contents):
+        """
+        :param contents: The flowContents of the new version
+        :type contents: dict
+        :returns: str The identifier of the NiFi Registry flow, it is created if there is no flow with that name in the bucket
+        """
+        with self._lock:
+            flows = [f for f in self.get_bucket_flows(None, None, bucket_id) if f['name'] == name]
+            flow = flows[0] if flows else self.create_bucket_flow(None, {'name': name}, bucket_id)
+            self.create_flow_version(None, {'flowContents': contents}, bucket_id, flow['identifier'])
+            return flow['identifier']
+
+    def request(self, method, path, query, body):
+        """
+        Handle a single api call
+        :returns: (int, Any) The status and the json body of the response
+        """
+        for route_method, pattern, template, handler in self._routes:
+            if route_method != method:
+                continue
+            match = pattern.fullmatch(path)
+            if match:
+                self.calls["{} {}".format(method, template)] += 1
+                latency = self.latency(method, template) if callable(self.latency) else self.latency
+                if latency:
+                    time.sleep(latency)
+                status = self.fail(method, template) if self.fail else None
+                if status:
+                    return status, "Failed {} {}".format(method, path)
+                try:
+                    with self._lock:
+                        return 200, handler(query, body, *match.groups())
+                except FakeNiFiError as e:
+                    return e.status, str(e)
+        self.calls["{} {}".format(method, path)] += 1
+        return 404, "No fake for {} {}".format(method, path)
+
+    # canvas
+
+    def _add(self, kind, group_id, component, **fields):
+        entity_id = str(uuid.uuid4())
+        component = dict(component, id=entity_id)
+        if group_id:
+            component['parentGroupId'] = group_id
+        entity = dict(fields, id=entity_id, revision={'version': 1}, component=component)
+        if kind in ['process_group', 'processor', 'input_port', 'output_port']:
+            entity['status'] = {'name': component.get('name'), 'groupId': group_id,
+                'aggregateSnapshot': {'name': component.get('name'), 'activeThreadCount': 0, 'flowFilesQueued': 0}}
+        self._entities[entity_id] = entity
+        self._kinds[entity_id] = kind
+        if group_id:
+            self._children[group_id][kind][entity_id] = entity
+        return entity
+
+    def _get(self, kind, entity_id):
+        if entity_id == 'root' and kind == 'process_group':
+            entity_id = self.root_id
+        if self._kinds.get(entity_id) != kind:
+            raise FakeNiFiError(404, "Unable to find {} with id '{}'.".format(kind, entity_id))
+        return self._entities[entity_id]
+
+    def _remove(self, entity_id):
+        kind = self._kinds.pop(entity_id)
+        entity = self._entities.pop(entity_id)
+        group_id = entity['component'].get('parentGroupId')
+        if group_id in self._children:
+            self._children[group_id][kind].pop(entity_id, None)
+        if kind == 'process_group':
+            for children in list(self._children.pop(entity_id, dict()).values()):
+                for child_id in list(children.keys()):
+                    self._remove(child_id)
+        self.states.pop(entity_id, None)
+        return entity
+
+    def _check_revision(self, entity, body):
+        # NiFi rejects an update made with a stale revision, it would overwrite a change the client has not seen
+        revision = body.get('revision') or dict()
+        if revision.get('version') != entity['revision']['version']:
+            raise FakeNiFiError(409, "[{}, {}, {}] is not the most up-to-date revision. This component appears to have been modified".format(
+                revision.get('clientId'), revision.get('version'), entity['id']))
+
+    def _update(self, entity, body):
+        self._check_revision(entity, body)
+        entity['component'].update({k: v for k, v in (body.get('component') or dict()).items() if k != 'id'})
+        entity['revision'] = {'version': entity['revision']['version'] + 1}
+        if 'status' in entity:
+            entity['status']['name'] = entity['status']['aggregateSnapshot']['name'] = entity['component'].get('name')
+        return entity
+
+    def _group_flow(self, group_id):
+        group = self._get('process_group', group_id)
+        children = self._children[group['id']]
+        flow = {key: list(children[kind].values()) for kind, key in GROUP_KINDS.items() if kind != 'controller_service'}
+        flow.update({'funnels': list(), 'labels': list()})
+        return {'processGroupFlow': {'id': group['id'], 'parentGroupId': group['component'].get('parentGroupId'), 'flow': flow}}
+
+    def _descendants(self, group_id):
+        groups = [group_id]
+        for child_id in self._children[group_id]['process_group']:
+            groups.extend(self._descendants(child_id))
+        return groups
+
+    def _create_process_group(self, group_id, component):
+        self._get('process_group', group_id)
+        return self._add('process_group', group_id, {
+            'name': component['name'],
+            'position': component.get('position'),
+            'comments': component.get('comments', '')
+        })
+
+    def _create_processor(self, group_id, component):
+        self._get('process_group', group_id)
+        if component['type'] not in PROCESSOR_TYPES:
+            raise FakeNiFiError(400, "{} is not a known processor type".format(component['type']))
+        config = dict(component.get('config') or dict())
+        config.setdefault('properties', dict())
+        config['descriptors'] = {k: {'name': k, 'displayName': k} for k in config['properties']}
+        return self._add('processor', group_id, {
+            'name': component['name'],
+            'type': component['type'],
+            'bundle': BUNDLE,
+            'position': component.get('position'),
+            'config': config,
+            'state': 'STOPPED',
+            'persistsState': component['type'] in self.stateful_types,
+            'relationships': [{'name': 'success'}, {'name': 'failure'}]
+        })
+
+    def _create_port(self, kind, group_id, component):
+        self._get('process_group', group_id)
+        return self._add(kind, group_id, {
+            'name': component['name'],
+            'position': component.get('position'),
+            'state': component.get('state') or 'STOPPED',
+            'type': PORT_TYPES[kind]
+        }, portType=PORT_TYPES[kind])
+
+    def _create_controller_service(self, group_id, component):
+        if component['type'] not in CONTROLLER_SERVICE_TYPES:
+            raise FakeNiFiError(400, "{} is not a known controller service type".format(component['type']))
+        properties = component.get('properties') or dict()
+        entity = self._add('controller_service', group_id, {
+            'name': component.get('name') or component['type'].split('.')[-1],
+            'type': component['type'],
+            'bundle': BUNDLE,
+            'properties': properties,
+            'descriptors': {k: {'name': k, 'displayName': k} for k in properties},
+            'state': 'DISABLED'
+        })
+        if not group_id:
+            self._controller_services[entity['id']] = entity
+        return entity
+
+    def _create_connection(self, group_id, component):
+        self._get('process_group', group_id)
+        for end in ['source', 'destination']:
+            if component[end]['id'] not in self._entities and not component[end]['type'].startswith('REMOTE'):
+                raise FakeNiFiError(400, "Unable to find the {} of the connection with id '{}'.".format(end, component[end]['id']))
+        source, destination = component['source'], component['destination']
+        return self._add('connection', group_id, dict(component), sourceId=source['id'], sourceGroupId=source['groupId'],
+            sourceType=source['type'], destinationId=destination['id'], destinationGroupId=destination['groupId'],
+            destinationType=destination['type'])
+
+    def _upload_group(self, group_id, contents, ids, connections, name=None, position=None):
+        """
+        Create a process group from the flowContents of a VersionedFlowSnapshot. The ids of the versioned components
+          are mapped to the ids of the created entities, connections are created once every group has been created
+        """
+        group = self._create_process_group(group_id, {'name': name or contents['name'], 'position': position or contents.get('position'),
+            'comments': contents.get('comments', '')})
+        ids[contents['identifier']] = group['id']
+        for c in contents.get('controllerServices', list()):
+            ids[c['identifier']] = self._create_controller_service(group['id'], c)['id']
+        for p in contents.get('processors', list()):
+            config = {k: p.get(k) for k in ['schedulingPeriod', 'schedulingStrategy', 'executionNode', 'penaltyDuration',
+                'yieldDuration', 'bulletinLevel', 'runDurationMillis', 'concurrentlySchedulableTaskCount', 'comments']}
+            config['properties'] = dict(p.get('properties') or dict())
+            config['autoTerminatedRelationships'] = p.get('autoTerminatedRelationships')
+            ids[p['identifier']] = self._create_processor(group['id'], {'name': p['name'], 'type': p['type'],
+                'position': p.get('position'), 'config': config})['id']
+        for kind, key in [('input_port', 'inputPorts'), ('output_port', 'outputPorts')]:
+            for port in contents.get(key, list()):
+                ids[port['identifier']] = self._create_port(kind, group['id'], port)['id']
+        for child in contents.get('processGroups', list()):
+            self._upload_group(group['id'], child, ids, connections)
+        connections.extend([(group['id'], c) for c in contents.get('connections', list())])
+        return group
+
+    # nifi endpoints
+
+    def get_ui(self, query, body):
+        return "<html><title>NiFi</title></html>"
+
+    def get_about(self, query, body):
+        return {'about': {'title': 'NiFi', 'version': self.version, 'uri': self.endpoint + '/nifi-api/'}}
+
+    def get_system_diagnostics(self, query, body):
+        return {'systemDiagnostics': {'aggregateSnapshot': {'versionInfo': {'niFiVersion': self.version}}}}
+
+    def get_controller_config(self, query, body):
+        return {'revision': {'version': 1}, 'component': self._controller_config}
+
+    def update_controller_config(self, query, body):
+        self._controller_config.update(body.get('component') or dict())
+        return self.get_controller_config(query, body)
+
+    def get_types(self, query, body, kind):
+        types = {'processor-types': ('processorTypes', PROCESSOR_TYPES),
+            'controller-service-types': ('controllerServiceTypes', CONTROLLER_SERVICE_TYPES),
+            'reporting-task-types': ('reportingTaskTypes', REPORTING_TASK_TYPES)}
+        if kind not in types:
+            raise FakeNiFiError(404, "Unknown type {}".format(kind))
+        key, names = types[kind]
+        return {key: [{'type': t, 'bundle': BUNDLE} for t in names]}
+
+    def get_group_status(self, query, body, group_id):
+        group = self._get('process_group', group_id)
+        return {'processGroupStatus': {'id': group['id'], 'name': group['component']['name'],
+            'aggregateSnapshot': {'id': group['id'], 'name': group['component']['name'], 'flowFilesQueued': 0, 'activeThreadCount': 0}}}
+
+    def get_group_flow(self, query, body, group_id):
+        return self._group_flow(group_id)
+
+    def schedule_components(self, query, body, group_id):
+        group = self._get('process_group', group_id)
+        if body.get('components'):
+            targets = [self._entities[i] for i in body['components'] if i in self._entities]
+        else:
+            targets = [e for g in self._descendants(group['id']) for kind in ['processor', 'input_port', 'output_port']
+                for e in self._children[g][kind].values()]
+        for e in targets:
+            if e['component'].get('state') != 'DISABLED':
+                e['component']['state'] = body['state']
+                e['revision'] = {'version': e['revision']['version'] + 1}
+        return {'id': group['id'], 'state': body['state']}
+
+    def get_group_controller_services(self, query, body, group_id):
+        group = self._get('process_group', group_id)
+        groups = self._descendants(group['id']) if query.get('includeDescendantGroups') == 'true' else [group['id']]
+        return {'controllerServices': [c for g in groups for c in self._children[g]['controller_service'].values()]}
+
+    def get_process_group(self, query, body, group_id):
+        group = self._get('process_group', group_id)
+        running = [e for g in self._descendants(group['id']) for kind in ['processor', 'input_port', 'output_port']
+            for e in self._children[g][kind].values() if e['component'].get('state') == 'RUNNING']
+        return dict(group, runningCount=len(running))
+
+    def update_process_group(self, query, body, group_id):
+        return self._update(self._get('process_group', group_id), body)
+
+    def remove_process_group(self, query, body, group_id):
+        group = self._get('process_group', group_id)
+        if group['id'] == self.root_id:
+            raise FakeNiFiError(409, "The root process group cannot be removed")
+        return self._remove(group['id'])
+
+    def get_process_groups(self, query, body, group_id):
+        group = self._get('process_group', group_id)
+        return {'processGroups': list(self._children[group['id']]['process_group'].values())}
+
+    def create_process_group(self, query, body, group_id):
+        return self._create_process_group(self._get('process_group', group_id)['id'], body['component'])
+
+    def upload_process_group(self, query, body, group_id):
+        group_id = self._get('process_group', group_id)['id']
+        snapshot = json.loads(body['file'])
+        ids, connections = dict(), list()
+        group = self._upload_group(group_id, snapshot['flowContents'], ids, connections, name=body['groupName'],
+            position={'x': float(body['positionX']), 'y': float(body['positionY'])})
+        # controller lookups reference the versioned ids of the controller services, NiFi replaces them when the snapshot is imported
+        controller_ids = {k: v for k, v in ids.items() if self._kinds.get(v) == 'controller_service'}
+        for processor_id in [i for i in ids.values() if self._kinds[i] == 'processor']:
+            properties = self._entities[processor_id]['component']['config']['properties']
+            for k, v in properties.items():
+                properties[k] = controller_ids.get(v, v)
+        for connection_group_id, c in connections:
+            component = dict(c, source=dict(c['source']), destination=dict(c['destination']))
+            for end in ['source', 'destination']:
+                component[end]['id'] = ids[c[end]['id']]
+                component[end]['groupId'] = ids[c[end]['groupId']]
+            self._create_connection(connection_group_id, component)
+        return group
+
+    def create_processor(self, query, body, group_id):
+        return self._create_processor(self._get('process_group', group_id)['id'], body['component'])
+
+    def create_input_port(self, query, body, group_id):
+        return self._create_port('input_port', self._get('process_group', group_id)['id'], body['component'])
+
+    def create_output_port(self, query, body, group_id):
+        return self._create_port('output_port', self._get('process_group', group_id)['id'], body['component'])
+
+    def create_connection(self, query, body, group_id):
+        return self._create_connection(self._get('process_group', group_id)['id'], body['component'])
+
+    def create_remote_process_group(self, query, body, group_id):
+        group_id = self._get('process_group', group_id)['id']
+        component = dict(body['component'])
+        component['contents'] = {'inputPorts': list(), 'outputPorts': list()}
+        return self._add('remote_process_group', group_id, component)
+
+    def create_controller_service(self, query, body, group_id):
+        return self._create_controller_service(self._get('process_group', group_id)['id'], body['component'])
+
+    def get_children(self, query, body, group_id, kind):
+        group = self._get('process_group', group_id)
+        kinds = {'input-ports': ('input_port', 'inputPorts'), 'output-ports': ('output_port', 'outputPorts'),
+            'connections': ('connection', 'connections'), 'remote-process-groups': ('remote_process_group', 'remoteProcessGroups'),
+            'funnels': (None, 'funnels')}
+        if kind not in kinds:
+            raise FakeNiFiError(404, "Unknown kind {}".format(kind))
+        kind, key = kinds[kind]
+        return {key: list(self._children[group['id']][kind].values()) if kind else list()}
+
+    def get_entity(self, query, body, kind, entity_id):
+        return self._get(_kind(kind), entity_id)
+
+    def update_entity(self, query, body, kind, entity_id):
+        entity = self._get(_kind(kind), entity_id)
+        update = dict(body.get('component') or dict())
+        if 'config' in update and entity['component'].get('config'):
+            config = dict(entity['component']['config'])
+            config.update({k: v for k, v in update.pop('config').items() if v is not None})
+            update['config'] = config
+        return self._update(entity, dict(body, component=update))
+
+    def update_run_status(self, query, body, kind, entity_id):
+        entity = self._get(_kind(kind), entity_id)
+        self._check_revision(entity, body)
+        entity['component']['state'] = body['state']
+        entity['revision'] = {'version': entity['revision']['version'] + 1}
+        return entity
+
+    def remove_entity(self, query, body, kind, entity_id):
+        self._get(_kind(kind), entity_id)
+        entity = self._remove(entity_id)
+        self._controller_services.pop(entity_id, None)
+        self._reporting_tasks.pop(entity_id, None)
+        return entity
+
+    def get_processor_state(self, query, body, processor_id):
+        self._get('processor', processor_id)
+        state = self.states.get(processor_id, dict())
+        return {'componentState': {'componentId': processor_id, 'stateDescription': '', 'clusterState': {
+            'scope': 'CLUSTER', 'totalEntryCount': len(state), 'state': [{'key': k, 'value': v} for k, v in state.items()]}}}
+
+    def create_drop_request(self, query, body, connection_id):
+        self._get('connection', connection_id)
+        return {'dropRequest': {'id': str(uuid.uuid4()), 'finished': True, 'percentCompleted': 100}}
+
+    def get_drop_request(self, query, body, connection_id, request_id):
+        return {'dropRequest': {'id': request_id, 'finished': True, 'percentCompleted': 100}}
+
+    def get_controller_level_services(self, query, body):
+        return {'controllerServices': list(self._controller_services.values())}
+
+    def create_controller_level_service(self, query, body):
+        return self._create_controller_service(None, body['component'])
+
+    def get_reporting_tasks(self, query, body):
+        return {'reportingTasks': list(self._reporting_tasks.values())}
+
+    def create_reporting_task(self, query, body):
+        component = body['component']
+        if component['type'] not in REPORTING_TASK_TYPES:
+            raise FakeNiFiError(400, "{} is not a known reporting task type".format(component['type']))
+        properties = component.get('properties') or dict()
+        entity = self._add('reporting_task', None, {
+            'name': component.get('name'),
+            'type': component['type'],
+            'properties': properties,
+            'descriptors': {k: {'name': k, 'displayName': k} for k in properties},
+            'state': 'STOPPED'
+        })
+        self._reporting_tasks[entity['id']] = entity
+        return entity
+
+    # registry endpoints
+
+    def get_buckets(self, query, body):
+        return list(self._buckets.values())
+
+    def get_bucket_flows(self, query, body, bucket_id):
+        return [f for f in self._flows.values() if f['bucketIdentifier'] == bucket_id]
+
+    def create_bucket_flow(self, query, body, bucket_id):
+        if bucket_id not in self._buckets:
+            raise FakeNiFiError(404, "Bucket {} does not exist".format(bucket_id))
+        flow_id = body.get('identifier') or str(uuid.uuid4())
+        self._flows[flow_id] = {'identifier': flow_id, 'name': body['name'], 'bucketIdentifier': bucket_id,
+            'bucketName': self._buckets[bucket_id]['name'], 'type': 'Flow', 'versionCount': 0}
+        return self._flows[flow_id]
+
+    def get_bucket_flow(self, query, body, bucket_id, flow_id):
+        if flow_id not in self._flows:
+            raise FakeNiFiError(404, "Flow {} does not exist".format(flow_id))
+        return self._flows[flow_id]
+
+    def get_flow_versions(self, query, body, bucket_id, flow_id):
+        return [v['snapshotMetadata'] for v in self._versions[flow_id]]
+
+    def create_flow_version(self, query, body, bucket_id, flow_id):
+        flow = self.get_bucket_flow(query, body, bucket_id, flow_id)
+        flow['versionCount'] += 1
+        snapshot = dict(body, flow=flow, bucket=self._buckets[bucket_id])
+        snapshot['snapshotMetadata'] = dict(body.get('snapshotMetadata') or dict(), version=flow['versionCount'],
+            bucketIdentifier=bucket_id, flowIdentifier=flow_id, timestamp=int(time.time() * 1000))
+        self._versions[flow_id].append(snapshot)
+        return snapshot
+
+    def get_flow_version(self, query, body, bucket_id, flow_id, version):
+        versions = self._versions[flow_id]
+        if not versions:
+            raise FakeNiFiError(404, "Flow {} has no versions".format(flow_id))
+        if version == 'latest':
+            return versions[-1]
+        if not version.isdigit() or not 0 < int(version) <= len(versions):
+            raise FakeNiFiError(404, "Version {} of flow {} does not exist".format(version, flow_id))
+        return versions[int(version) - 1]
+
+
+ENTITY_KINDS = {
+    'processors': 'processor',
+    'input-ports': 'input_port',
+    'output-ports': 'output_port',
+    'remote-process-groups': 'remote_process_group',
+    'connections': 'connection',
+    'controller-services': 'controller_service',
+    'reporting-tasks': 'reporting_task'
+}
+_ENTITY_KINDS = '(' + '|'.join(ENTITY_KINDS.keys()) + ')'
+
+ROUTES = [
+    ('GET', '/nifi', 'get_ui'),
+    ('GET', '/nifi/', 'get_ui'),
+    ('GET', '/nifi-api/flow/about', 'get_about'),
+    ('GET', '/nifi-api/system-diagnostics', 'get_system_diagnostics'),
+    ('GET', '/nifi-api/controller/config', 'get_controller_config'),
+    ('PUT', '/nifi-api/controller/config', 'update_controller_config'),
+    ('GET', '/nifi-api/flow/{type}', 'get_types'),
+    ('GET', '/nifi-api/flow/process-groups/{id}/status', 'get_group_status'),
+    ('GET', '/nifi-api/flow/process-groups/{id}/controller-services', 'get_group_controller_services'),
+    ('GET', '/nifi-api/flow/process-groups/{id}', 'get_group_flow'),
+    ('PUT', '/nifi-api/flow/process-groups/{id}', 'schedule_components'),
+    ('GET', '/nifi-api/flow/controller/controller-services', 'get_controller_level_services'),
+    ('GET', '/nifi-api/flow/reporting-tasks', 'get_reporting_tasks'),
+    ('GET', '/nifi-api/process-groups/{id}', 'get_process_group'),
+    ('PUT', '/nifi-api/process-groups/{id}', 'update_process_group'),
+    ('DELETE', '/nifi-api/process-groups/{id}', 'remove_process_group'),
+    ('GET', '/nifi-api/process-groups/{id}/process-groups', 'get_process_groups'),
+    ('POST', '/nifi-api/process-groups/{id}/process-groups', 'create_process_group'),
+    ('POST', '/nifi-api/process-groups/{id}/process-groups/upload', 'upload_process_group'),
+    ('POST', '/nifi-api/process-groups/{id}/processors', 'create_processor'),
+    ('POST', '/nifi-api/process-groups/{id}/input-ports', 'create_input_port'),
+    ('POST', '/nifi-api/process-groups/{id}/output-ports', 'create_output_port'),
+    ('POST', '/nifi-api/process-groups/{id}/connections', 'create_connection'),
+    ('POST', '/nifi-api/process-groups/{id}/remote-process-groups', 'create_remote_process_group'),
+    ('POST', '/nifi-api/process-groups/{id}/controller-services', 'create_controller_service'),
+    ('GET', '/nifi-api/process-groups/{id}/{kind}', 'get_children'),
+    ('GET', '/nifi-api/processors/{id}/state', 'get_processor_state'),
+    ('POST', '/nifi-api/flowfile-queues/{id}/drop-requests', 'create_drop_request'),
+    ('GET', '/nifi-api/flowfile-queues/{id}/drop-requests/{id}', 'get_drop_request'),
+    ('DELETE', '/nifi-api/flowfile-queues/{id}/drop-requests/{id}', 'get_drop_request'),
+    ('POST', '/nifi-api/controller/controller-services', 'create_controller_level_service'),
+    ('POST', '/nifi-api/controller/reporting-tasks', 'create_reporting_task'),
+    ('GET', '/nifi-api/{entities}/{id}', 'get_entity'),
+    ('PUT', '/nifi-api/{entities}/{id}', 'update_entity'),
+    ('PUT', '/nifi-api/{entities}/{id}/run-status', 'update_run_status'),
+    ('DELETE', '/nifi-api/{entities}/{id}', 'remove_entity'),
+    ('GET', '/nifi-registry-api/buckets', 'get_buckets'),
+    ('GET', '/nifi-registry-api/buckets/{id}/flows', 'get_bucket_flows'),
+    ('POST', '/nifi-registry-api/buckets/{id}/flows', 'create_bucket_flow'),
+    ('GET', '/nifi-registry-api/buckets/{id}/flows/{id}', 'get_bucket_flow'),
+    ('GET', '/nifi-registry-api/buckets/{id}/flows/{id}/versions', 'get_flow_versions'),
+    ('POST', '/nifi-registry-api/buckets/{id}/flows/{id}/versions', 'create_flow_version'),
+    ('GET', '/nifi-registry-api/buckets/{id}/flows/{id}/versions/{version}', 'get_flow_version')
+]
+
+
+def _route(template):
+    pattern = re.escape(template).replace(r'\{entities\}', _ENTITY_KINDS)
+    return re.compile(re.sub(r'\\\{\w+\\\}', '([^/]+)', pattern))
+
+
+def _kind(entities):
+    return ENTITY_KINDS[entities]
+
+
+def _form(content_type, body):
+    """
+    :returns: dict(str:str) The fields of a multipart/form-data body, files are returned as their contents
+    """
+    message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True).decode('utf-8')
+        for part in message.get_payload()}
+
+
+def _handler(nifi):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        # keep connections alive like NiFi does, so the http pool of the client is used
+        protocol_version = 'HTTP/1.1'
+        # the headers and the body are written separately, without this every response waits for a delayed ack
+        disable_nagle_algorithm = True
+
+        def _respond(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            content = self.rfile.read(length) if length else b''
+            content_type = self.headers.get('Content-Type') or ''
+            if content_type.startswith('multipart/form-data'):
+                body = _form(content_type, content)
+            else:
+                body = json.loads(content) if content else dict()
+
+            status, result = nifi.request(self.command, url.path, query, body)
+            if isinstance(result, str) and status == 200:
+                data, content_type = result.encode('utf-8'), 'text/html'
+            elif isinstance(result, str):
+                data, content_type = result.encode('utf-8'), 'text/plain'
+            else:
+                data, content_type = json.dumps(result).encode('utf-8'), 'application/json'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
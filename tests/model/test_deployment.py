@@ -18,6 +18,25 @@ class TestDeployment(unittest.TestCase):
         self.assertTrue(deployment.flow['name'] == 'pdf-processor-demo-flow')
         self.assertTrue(len(deployment.components) == 3)
         self.assertIsInstance(deployment.get_component('process-pdfs'), DeployedComponent)
+        self.assertEqual(deployment.layouts, dict())
+
+    def test_encode(self):
+        with open(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', 'resources', 'deployment.json'), 'r') as f:
+            legacy = f.read()
+        deployment = FlowDeployment.decode(legacy)
+        encoded = deployment.encode()
+        self.assertTrue(encoded.startswith('flowlib:1:'))
+        self.assertLess(len(encoded), len(legacy))
+        self.assertEqual(encoded, FlowDeployment.decode(encoded).encode())
+        self.assertEqual(FlowDeployment.decode(encoded).as_dict(), deployment.as_dict())
+
+        self.assertRaisesRegex(FlowLibException, "^Unsupported deployment encoding version 99.*", FlowDeployment.decode, 'flowlib:99:abc')
+
+    def test_layouts(self):
+        flow = utils.load_test_flow()
+        deployment = FlowDeployment(flow.raw, layouts={'fingerprint': {'debug': (100.0, 200.0)}})
+        d = json.loads(json.dumps(deployment.as_dict()))
+        self.assertEqual(FlowDeployment.from_dict(d).layouts, {'fingerprint': {'debug': [100.0, 200.0]}})
 
     def test_add_get_component(self):
         flow = utils.load_test_flow()
@@ -30,3 +49,9 @@ class TestDeployment(unittest.TestCase):
         self.assertIsInstance(deployed_component, DeployedComponent)
         self.assertEqual(component.raw, deployed_component.component)
         self.assertRaisesRegex(FlowLibException, "^A component named\s.*\salready exists$", deployment.add_component, DeployedComponent(component.raw))
+        self.assertIsNone(deployment.get_component('not-real'))
+
+        # the index is not part of the saved deployment
+        d = json.loads(json.dumps(deployment.as_dict()))
+        self.assertEqual(sorted(d.keys()), ['components', 'config_fingerprints', 'fingerprints', 'flow', 'layouts', 'root_group_id', 'stateful_processors'])
+        self.assertEqual(FlowDeployment.from_dict(d).get_component('test-component').component, component.raw)
@@ -59,6 +59,32 @@ class TestFlow(unittest.TestCase):
                 # assert that the parent of each element is the correct group
                 self.assertEqual(g, flow.get_parent_element(e))
 
+        # elements which were not added with add_element() are found from their parent path
+        orphan = FlowElement.from_dict({'name': 'orphan', 'type': 'input_port'}, _parent_path=groups[0].parent_path)
+        self.assertIs(flow.get_parent_element(orphan), flow)
+
+    def test_find_element_by_path(self):
+        flow = utils.load_test_flow()
+        self.assertIsNone(flow.find_element_by_path('not-real'))
+
+        for g in [g for g in flow._elements.values() if g.type == 'process_group']:
+            path = "{}/{}".format(g.parent_path, g.name)
+            self.assertIs(flow.find_element_by_path(path), g)
+            for e in g._elements.values():
+                self.assertIs(flow.find_element_by_path("{}/{}".format(path, e.name)), e)
+                self.assertIs(flow.get_parent_element(e), g)
+
+    def test_slots(self):
+        flow = utils.load_test_flow()
+        groups = [g for g in flow._elements.values() if g.type == 'process_group']
+        for el in [e for g in groups for e in g._elements.values()] + groups + flow._controllers:
+            self.assertFalse(hasattr(el, '__dict__'), "{} should not have an instance dict".format(type(el).__name__))
+            self.assertIn("'name': '{}'".format(el.name), repr(el))
+            self.assertNotIn("'_parent':", repr(el))
+            for c in getattr(el, 'connections', list()):
+                self.assertFalse(hasattr(c, '__dict__'))
+        self.assertEqual(groups[0].src_component_name, flow.find_component_by_path(groups[0].component_path).name)
+
     def test_flow_element_from_dict(self):
         no_name = {
             'name': '',
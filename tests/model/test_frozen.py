@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import copy
+import json
+import os
+import pickle
+import unittest
+
+import yaml
+
+import flowlib.parser
+from flowlib.model.flow import Flow
+from flowlib.model.frozen import FrozenDict, FrozenList, freeze
+
+from tests import utils
+
+class TestFrozen(unittest.TestCase):
+
+    def test_freeze(self):
+        raw = {'name': 'flow', 'canvas': [{'name': 'debug', 'config': {'properties': {'a': 1}}}]}
+        frozen = freeze(raw)
+        self.assertIsInstance(frozen, FrozenDict)
+        self.assertIsInstance(frozen['canvas'], FrozenList)
+        self.assertIs(freeze(frozen), frozen)
+
+        # frozen values behave like the values they were frozen from
+        self.assertEqual(frozen, raw)
+        self.assertEqual(json.loads(json.dumps(frozen)), raw)
+        self.assertEqual(pickle.loads(pickle.dumps(frozen)), frozen)
+        self.assertIs(copy.deepcopy(frozen), frozen)
+
+        with self.assertRaisesRegex(TypeError, "'FrozenDict' object is read-only"):
+            frozen['name'] = 'other'
+        with self.assertRaisesRegex(TypeError, "'FrozenList' object is read-only"):
+            frozen['canvas'].append({})
+        with self.assertRaises(TypeError):
+            frozen['canvas'][0]['config'].pop('properties')
+
+    def test_init_frozen_flow(self):
+        with open(os.path.join(utils.RESOURCES_DIR, 'flow.yaml')) as f:
+            raw = freeze(yaml.safe_load(f))
+        flow = Flow(raw, **raw)
+        flow.initialize(utils.COMPONENT_DIR)
+        flow.validate()
+        flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components)
+
+        # templating only changes the elements, not the raw flow and components they were built from
+        self.assertEqual(flow._elements['debug'].config.properties['prop2'], 'global-value')
+        self.assertEqual(raw['canvas'][1]['config']['properties']['prop2'], '{{ global_var }}')
+        self.assertIsInstance(flow.components['test-component'].raw, FrozenDict)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import nipyapi
+
+import flowlib.nifi.aio
+import flowlib.nifi.transport
+import flowlib.profile
+from flowlib.exceptions import FlowLibException, NiFiApiException
+from flowlib.model.config import FlowLibConfig
+from flowlib.nifi.aio import AsyncNiFiClient
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+
+@unittest.skipUnless(web, "aiohttp is not installed")
+class TestAsyncNiFiClient(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        flowlib.nifi.transport.configure(FlowLibConfig(http_retries=2, http_backoff_factor=0))
+        self.requests = list()
+        self.version = 1
+
+        async def about(request):
+            self.requests.append(request.path)
+            return web.json_response({'about': {'title': 'NiFi', 'version': '1.11.4'}})
+
+        async def get_flow(request):
+            pg_id = request.match_info['id']
+            pgs = [{'id': 'child', 'component': {'id': 'child', 'name': 'child'}}] if pg_id == 'root' else []
+            return web.json_response({'processGroupFlow': {'id': pg_id, 'flow': {'processGroups': pgs}}})
+
+        async def get_pg(request):
+            self.requests.append(request.path)
+            return web.json_response({'id': 'child', 'revision': {'version': self.version}, 'component': {'id': 'child', 'name': 'child'}})
+
+        async def rejected(request):
+            # fail the first request like a NiFi node which is not ready yet, and reject stale revisions
+            self.requests.append(request.path)
+            body = await request.json()
+            if len(self.requests) == 1 or body['revision']['version'] != self.version:
+                return web.Response(status=503 if len(self.requests) == 1 else 409, text='rejected')
+            self.version += 1
+            return web.json_response({'id': 'child', 'revision': {'version': self.version}, 'component': body['component']})
+
+        async def failed(request):
+            self.requests.append(request.path)
+            return web.Response(status=500, text='error')
+
+        app = web.Application()
+        app.router.add_get('/nifi-api/flow/about', about)
+        app.router.add_get('/nifi-api/flow/process-groups/{id}', get_flow)
+        app.router.add_get('/nifi-api/process-groups/{id}', get_pg)
+        app.router.add_put('/nifi-api/process-groups/{id}', rejected)
+        app.router.add_post('/nifi-api/process-groups/{id}/processors', failed)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.client = AsyncNiFiClient('http://127.0.0.1:{}/'.format(port), concurrency=4)
+        await self.client.open()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.runner.cleanup()
+        flowlib.nifi.transport.configure(FlowLibConfig())
+
+    async def test_request(self):
+        about = await self.client.get_about()
+        self.assertEqual(about.about.version, '1.11.4')
+
+    async def test_profile(self):
+        profiler = flowlib.profile.enable()
+        try:
+            await self.client.get_about()
+            await self.client.recurse_flow()
+        finally:
+            flowlib.profile.disable()
+        self.assertEqual([c['path'] for c in profiler.calls], ['/flow/about', '/flow/process-groups/root', '/flow/process-groups/child'])
+        self.assertEqual([c['status'] for c in profiler.calls], [200, 200, 200])
+
+    async def test_recurse_flow(self):
+        pg_flow = await self.client.recurse_flow()
+        pg = pg_flow.process_group_flow.flow.process_groups[0]
+        self.assertEqual(pg.component.name, 'child')
+        self.assertEqual(pg.nipyapi_extended.process_group_flow.id, 'child')
+
+    async def test_retry(self):
+        pg = await self.client.update_process_group(nipyapi.nifi.ProcessGroupEntity(
+            id='child', revision={'version': 1}, component={'id': 'child', 'name': 'renamed'}))
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(pg.revision.version, 2)
+        self.assertEqual(pg.component.name, 'renamed')
+
+        # server errors are not retried for requests which are not idempotent
+        self.requests.clear()
+        with self.assertRaisesRegex(FlowLibException, ".*failed with status 500.*"):
+            await self.client.create_processor('child', 'org.apache.nifi.processors.standard.DebugFlow', 'debug', (0, 0))
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_retry_conflicts(self):
+        # a stale revision is rejected again if the same request is resent, so conflicts are not retried
+        with self.assertRaises(NiFiApiException) as e:
+            await self.client.update_process_group(nipyapi.nifi.ProcessGroupEntity(
+                id='child', revision={'version': 0}, component={'id': 'child', 'name': 'renamed'}))
+        self.assertEqual(e.exception.status, 409)
+
+        # updates which re-read the revision are retried
+        self.requests.clear()
+        stale = await self.client.get_process_group('child')
+        self.version += 1
+
+        async def rename():
+            pg = stale if len(self.requests) == 1 else await self.client.get_process_group('child')
+            pg.component.name = 'renamed'
+            return await self.client.update_process_group(pg)
+        pg = await flowlib.nifi.aio._retry_conflicts(rename)
+        self.assertEqual(pg.component.name, 'renamed')
+        self.assertEqual(len(self.requests), 4)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import nipyapi
+
+from flowlib.exceptions import FlowLibException
+from flowlib.nifi.canvas import CanvasIndex
+
+
+def _entity(cls, _id, name):
+    return cls(id=_id, component=nipyapi.nifi.ProcessorDTO(id=_id, name=name))
+
+
+class TestCanvasIndex(unittest.TestCase):
+
+    def test_add_flow(self):
+        child_pg = _entity(nipyapi.nifi.ProcessGroupEntity, 'pg-1', 'child/root-id')
+        child_pg.nipyapi_extended = nipyapi.nifi.ProcessGroupFlowEntity(
+            process_group_flow=nipyapi.nifi.ProcessGroupFlowDTO(
+                flow=nipyapi.nifi.FlowDTO(
+                    processors=[_entity(nipyapi.nifi.ProcessorEntity, 'proc-1', 'debug/pg-1')],
+                    input_ports=[_entity(nipyapi.nifi.PortEntity, 'ip-1', 'input/pg-1')],
+                    output_ports=[_entity(nipyapi.nifi.PortEntity, 'op-1', 'output/pg-1')]
+                )
+            )
+        )
+        canvas = CanvasIndex()
+        canvas.add_flow(nipyapi.nifi.FlowDTO(process_groups=[child_pg]))
+
+        self.assertEqual(canvas.get('process_group', 'child/root-id').id, 'pg-1')
+        self.assertEqual(canvas.get('processor', 'debug/pg-1').id, 'proc-1')
+        self.assertEqual(canvas.get('input_port', 'input/pg-1').id, 'ip-1')
+        self.assertEqual(canvas.get('output_port', 'output/pg-1').id, 'op-1')
+        self.assertIsNone(canvas.get('processor', 'debug'))
+        self.assertIsNone(canvas.get('input_port', 'output/pg-1'))
+
+    def test_add_get(self):
+        canvas = CanvasIndex()
+        processor = _entity(nipyapi.nifi.ProcessorEntity, 'proc-1', 'debug/pg-1')
+        self.assertIsNone(canvas.get('processor', 'debug/pg-1'))
+        canvas.add('processor', processor)
+        self.assertEqual(canvas.get('processor', 'debug/pg-1'), processor)
+        self.assertEqual(canvas.get_by_id('proc-1'), processor)
+        self.assertIsNone(canvas.get_by_id('proc-2'))
+        canvas.remove('processor', processor)
+        self.assertIsNone(canvas.get('processor', 'debug/pg-1'))
+        self.assertIsNone(canvas.get_by_id('proc-1'))
+        self.assertRaisesRegex(FlowLibException, ".*is not a valid NiFi api type", canvas.add, 'funnel', processor)
+        self.assertRaisesRegex(FlowLibException, ".*is not a valid NiFi api type", canvas.get, 'funnel', 'debug/pg-1')
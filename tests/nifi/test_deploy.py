@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from flowlib.exceptions import FlowLibException
+from flowlib.model.deployment import FlowDeployment, DeployedComponent
+from flowlib.nifi.deploy import check_flow, get_state_migrations, new_deployment, set_exported_state, stateful_processors
+
+from tests import utils
+
+
+class TestStateMigrations(unittest.TestCase):
+
+    def test_get_state_migrations(self):
+        previous = FlowDeployment({'name': 'test-flow'}, stateful_processors={
+            'root-proc': {'processor_id': 'p1', 'state': {'k': 'v1'}},
+            'kept-proc': {'processor_id': 'p2', 'state': {'k': 'v2'}}
+        })
+        previous.add_component(DeployedComponent({'name': 'component'}, stateful_processors={
+            'test-flow/pg/proc': {'group_id': 'g1', 'processor_id': 'p3', 'state': {'k': 'v3'}},
+            'test-flow/pg/empty': {'group_id': 'g1', 'processor_id': 'p4'}
+        }))
+
+        current = FlowDeployment({'name': 'test-flow'}, stateful_processors={
+            'root-proc': {'processor_id': 'new1'},
+            'kept-proc': {'processor_id': 'p2'},
+            'new-proc': {'processor_id': 'new5'}
+        })
+        current.add_component(DeployedComponent({'name': 'component'}, stateful_processors={
+            'test-flow/pg/proc': {'group_id': 'new-g1', 'processor_id': 'new3'},
+            'test-flow/pg/empty': {'group_id': 'new-g1', 'processor_id': 'new4'}
+        }))
+
+        # processors which were not re-created keep their state, processors without any previous state are skipped
+        self.assertEqual(get_state_migrations(current, previous), {'new1': {'k': 'v1'}, 'new3': {'k': 'v3'}})
+        self.assertEqual(get_state_migrations(current, None), dict())
+
+
+class TestExportState(unittest.TestCase):
+
+    def test_set_exported_state(self):
+        deployment = FlowDeployment({'name': 'test-flow'}, stateful_processors={
+            'root-proc': {'processor_id': 'p1'},
+            'empty-proc': {'processor_id': 'p2'}
+        })
+        deployment.add_component(DeployedComponent({'name': 'component'}, stateful_processors={
+            'test-flow/pg/proc': {'group_id': 'g1', 'processor_id': 'p3'}
+        }))
+        self.assertEqual([p['processor_id'] for p in stateful_processors(deployment)], ['p1', 'p2', 'p3'])
+
+        set_exported_state(deployment, {'p1': {'k': 'v1'}, 'p3': {'k': 'v3'}})
+        self.assertEqual(deployment.stateful_processors['root-proc']['state'], {'k': 'v1'})
+        self.assertNotIn('state', deployment.stateful_processors['empty-proc'])
+        self.assertEqual(deployment.get_component('component').stateful_processors['test-flow/pg/proc']['state'], {'k': 'v3'})
+
+
+class TestNewDeployment(unittest.TestCase):
+
+    def test_check_flow(self):
+        flow = utils.load_test_flow(init=False)
+        self.assertRaisesRegex(FlowLibException, "^Flow has not yet been initialized.*", check_flow, flow)
+        flow.initialize(utils.COMPONENT_DIR)
+        self.assertRaisesRegex(FlowLibException, "^Flow has not yet been validated.*", check_flow, flow)
+        flow.validate()
+        check_flow(flow)
+
+    def test_new_deployment(self):
+        flow = utils.load_test_flow()
+        deployment = new_deployment(flow)
+        self.assertEqual(deployment.flow, flow.raw)
+        self.assertEqual(deployment.fingerprints, flow.fingerprints)
+        self.assertEqual([c.component for c in deployment.components], [c.raw for c in flow._loaded_components.values()])
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import flowlib.layout
+import flowlib.nifi.docs
+import flowlib.nifi.rest
+from flowlib.exceptions import FlowLibException
+from flowlib.model.config import FlowLibConfig
+
+from tests import utils
+from tests.fake_nifi import FakeNiFi
+
+class TestFakeNiFiDeploy(unittest.TestCase):
+
+    def setUp(self):
+        self.nifi = FakeNiFi().start()
+        self.addCleanup(self.nifi.stop)
+
+    def _deploy(self, **kwargs):
+        flow = utils.load_test_flow()
+        flow.validate()
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint, **{k: v for k, v in kwargs.items() if k != 'force'})
+        flowlib.nifi.rest.deploy_flow(flow, config, force=kwargs.get('force', False), incremental=kwargs.get('incremental', False),
+            resume=kwargs.get('resume', False))
+        return flow, config
+
+    def _assert_deployed(self, flow):
+        groups = self.nifi.find('process_group', flow.name)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]['component']['parentGroupId'], self.nifi.root_id)
+        # processors are named with the id of their process group
+        self.assertEqual(sorted(p['component']['name'].split('/')[0] for p in self.nifi.find('processor')), ['debug', 'debug'])
+        self.assertEqual(len(self.nifi.find('connection')), 3)
+        self.assertEqual(len(self.nifi.find('controller_service', 'test-controller-service')), 1)
+        # processors are not started by a deployment
+        self.assertEqual(set(p['component']['state'] for p in self.nifi.find('processor')), {'STOPPED'})
+
+        deployment = flowlib.nifi.rest.get_previous_deployment(self.nifi.endpoint, flow.name)
+        self.assertEqual(deployment.flow, flow.raw)
+        self.assertEqual(deployment.fingerprints, flow.fingerprints)
+
+    def test_deploy_flow(self):
+        flow, _ = self._deploy()
+        self._assert_deployed(flow)
+        self.assertEqual(self.nifi.calls['POST /nifi-api/process-groups/{id}/processors'], 2)
+
+        # the controller lookup is rendered with the id of the controller service
+        controller = self.nifi.find('controller_service')[0]
+        group = [g for g in self.nifi.find('process_group') if g['component']['name'].startswith('test-process-group/')][0]
+        processor = [p for p in self.nifi.find('processor') if p['component']['parentGroupId'] == group['id']][0]
+        self.assertEqual(processor['component']['config']['properties']['controller-lookup'], controller['id'])
+
+    def test_force_deploy_flow(self):
+        self._deploy()
+        self.assertRaisesRegex(FlowLibException, "^A flow with that name already exists.*", self._deploy)
+
+        flow, _ = self._deploy(force=True)
+        self._assert_deployed(flow)
+        # the previous flow is removed, leaving the root, the flow and its process group
+        self.assertEqual(len(self.nifi.find('process_group')), 3)
+
+    def test_snapshot_deploy_flow(self):
+        flow, _ = self._deploy(snapshot_deploy=True)
+        self._assert_deployed(flow)
+        self.assertEqual(self.nifi.calls['POST /nifi-api/process-groups/{id}/process-groups/upload'], 1)
+        self.assertEqual(self.nifi.calls['POST /nifi-api/process-groups/{id}/processors'], 0)
+
+        # the controller lookups of the deployed processors are compared with the ids of the uploaded controllers
+        operations, _ = self._plan(incremental=True)
+        self.assertEqual([(op.phase, op.method) for op in operations], [('save', 'PUT')])
+
+    def test_incremental_deploy_flow(self):
+        self._deploy()
+        processors = set(p['id'] for p in self.nifi.find('processor'))
+
+        # nothing changed, so nothing is re-created
+        flow, _ = self._deploy(incremental=True)
+        self._assert_deployed(flow)
+        self.assertEqual(set(p['id'] for p in self.nifi.find('processor')), processors)
+
+    def _load_flow(self, update):
+        flow = utils.load_test_flow(init=False)
+        update(flow.canvas)
+        flow.initialize(utils.COMPONENT_DIR)
+        flow.validate()
+        return flow
+
+    def test_incremental_deploy_changed_connection(self):
+        self._deploy()
+        connections = set(c['id'] for c in self.nifi.find('connection'))
+
+        def update(canvas):
+            canvas[0]['connections'][0]['back_pressure_object_threshold'] = 500
+
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint)
+        writes = self._writes()
+        operations, _ = flowlib.nifi.rest.plan_deploy(self._load_flow(update), config, incremental=True)
+        flowlib.nifi.rest.deploy_flow(self._load_flow(update), config, incremental=True)
+        self.assertEqual(len(operations), self._writes() - writes)
+
+        # the connection is updated in place, so its queue is kept
+        self.assertEqual(set(c['id'] for c in self.nifi.find('connection')), connections)
+        self.assertEqual(self.nifi.calls['DELETE /nifi-api/{entities}/{id}'], 0)
+        self.assertEqual([c['component'].get('backPressureObjectThreshold') for c in self.nifi.find('connection')].count(500), 1)
+
+    def test_incremental_deploy_changed_env(self):
+        self.addCleanup(os.environ.pop, 'INCREMENTAL_TEST_VAR', None)
+
+        def update(canvas):
+            canvas[1]['config']['properties']['prop1'] = "{{ env('INCREMENTAL_TEST_VAR', 'default') }}"
+
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint)
+        flowlib.nifi.rest.deploy_flow(self._load_flow(update), config)
+
+        # the new flow is compared with the properties that were deployed, not with the deployed flow rendered with the current env
+        os.environ['INCREMENTAL_TEST_VAR'] = 'value'
+        flowlib.nifi.rest.deploy_flow(self._load_flow(update), config, incremental=True)
+        processor = [p for p in self.nifi.find('processor') if p['component']['parentGroupId'] == self.nifi.find('process_group', 'test-flow')[0]['id']][0]
+        self.assertEqual(processor['component']['config']['properties']['prop1'], 'value')
+
+    def test_incremental_deploy_added_process_group(self):
+        self._deploy()
+
+        def load_flow():
+            flow = utils.load_test_flow(init=False)
+            flow.layout = 'spectral'
+            group = dict(flow.canvas[0], name='test-process-group-2')
+            group.pop('connections')
+            flow.canvas.append(group)
+            flow.initialize(utils.COMPONENT_DIR)
+            flow.validate()
+            return flow
+
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint)
+        flowlib.nifi.rest.deploy_flow(load_flow(), config, incremental=True)
+
+        # the elements of the added process group are laid out like a full deployment lays them out
+        expected = {path.split('/')[-1]: position for path, position in flowlib.layout.generate_flow_layout(load_flow()).items()
+            if path.startswith('test-flow/test-process-group-2/')}
+        self.assertNotEqual(expected, flowlib.layout.generate_layout(load_flow()._elements['test-process-group-2']._elements))
+        group = [g for g in self.nifi.find('process_group') if g['component']['name'].startswith('test-process-group-2/')][0]
+        positions = dict()
+        for kind in ('processor', 'input_port', 'output_port'):
+            for e in self.nifi.find(kind):
+                if e['component']['parentGroupId'] == group['id']:
+                    positions[e['component']['name'].split('/')[0]] = (e['component']['position']['x'], e['component']['position']['y'])
+        self.assertEqual(positions, {name: (float(x), float(y)) for name, (x, y) in expected.items()})
+
+    def test_failed_incremental_deploy_flow(self):
+        self._deploy()
+
+        def update(canvas):
+            canvas[1]['config']['properties']['prop1'] = 'new-value'
+
+        self.nifi.fail = lambda method, endpoint: 400 if method == 'PUT' and endpoint == '/nifi-api/{entities}/{id}' else None
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint)
+        self.assertRaises(Exception, flowlib.nifi.rest.deploy_flow, self._load_flow(update), config, incremental=True)
+        self.assertEqual(len(self.nifi.find('process_group', '(failed) test-flow')), 1)
+        self.assertEqual(self.nifi.find('process_group', 'test-flow'), list())
+
+    def test_concurrent_deploy_flow(self):
+        flow, _ = self._deploy(deploy_concurrency=4)
+        self._assert_deployed(flow)
+
+    def _plan(self, **kwargs):
+        flow = utils.load_test_flow()
+        flow.validate()
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint, **{k: v for k, v in kwargs.items() if k != 'force'})
+        return flowlib.nifi.rest.plan_deploy(flow, config, force=kwargs.get('force', False), incremental=kwargs.get('incremental', False))
+
+    def _writes(self):
+        return sum(v for k, v in self.nifi.calls.items() if not k.startswith('GET'))
+
+    def test_plan_deploy_flow(self):
+        operations, seconds = self._plan()
+        # nothing is changed on the canvas
+        self.assertEqual(self._writes(), 0)
+        self.assertEqual(self.nifi.find('processor'), list())
+        self.assertGreater(seconds, 0)
+
+        # every planned operation is made by the deployment
+        self._deploy()
+        self.assertEqual(len(operations), self._writes())
+
+        self.assertRaisesRegex(FlowLibException, "^A flow with that name already exists.*", self._plan)
+        writes = self._writes()
+        operations, _ = self._plan(force=True)
+        self.assertEqual(self._writes(), writes)
+        self._deploy(force=True)
+        self.assertEqual(len(operations), self._writes() - writes)
+
+    def test_plan_incremental_deploy_flow(self):
+        self._deploy()
+        writes = self._writes()
+        operations, _ = self._plan(incremental=True)
+        self.assertEqual(self._writes(), writes)
+        # nothing changed, so the deployment is only saved
+        self.assertEqual([(op.phase, op.method) for op in operations], [('save', 'PUT')])
+
+    def test_resume_deploy_flow(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        connections = list()
+
+        def fail(method, endpoint):
+            if method == 'POST' and endpoint.endswith('/connections'):
+                connections.append(endpoint)
+                return 400 if len(connections) == 2 else None
+
+        self.nifi.fail = fail
+        self.assertRaises(Exception, self._deploy, journal_dir=journal_dir)
+        self.assertEqual(len(self.nifi.find('process_group', '(failed) test-flow')), 1)
+        self.assertEqual(len(os.listdir(journal_dir)), 1)
+
+        # only the connections which were not created are created when the deployment is resumed
+        self.nifi.fail = None
+        flow, _ = self._deploy(journal_dir=journal_dir, resume=True)
+        self._assert_deployed(flow)
+        self.assertEqual(self.nifi.calls['POST /nifi-api/process-groups/{id}/processors'], 2)
+        self.assertEqual(self.nifi.calls['POST /nifi-api/process-groups/{id}/controller-services'], 1)
+        self.assertEqual(self.nifi.calls['POST /nifi-api/process-groups/{id}/connections'], 4)
+        self.assertEqual(self.nifi.find('process_group', '(failed) test-flow'), list())
+        # the journal is removed once the deployment completes
+        self.assertEqual(os.listdir(journal_dir), list())
+        self.assertRaisesRegex(FlowLibException, "^No journal was found.*", self._deploy, journal_dir=journal_dir, resume=True)
+
+    def test_resume_changed_flow(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.nifi.fail = lambda method, endpoint: 400 if endpoint.endswith('/connections') else None
+        self.assertRaises(Exception, self._deploy, journal_dir=journal_dir)
+
+        self.nifi.fail = None
+        flow = utils.load_test_flow(init=False)
+        flow.canvas[1]['config']['properties']['prop1'] = 'new-value'
+        flow.initialize(utils.COMPONENT_DIR)
+        flow.validate()
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint, journal_dir=journal_dir)
+        self.assertRaisesRegex(FlowLibException, ".*has changed since the deployment failed.*",
+            flowlib.nifi.rest.deploy_flow, flow, config, resume=True)
+
+    def test_resume_changed_env(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.addCleanup(os.environ.pop, 'RESUME_TEST_VAR', None)
+
+        def load_flow():
+            flow = utils.load_test_flow(init=False)
+            flow.canvas[1]['config']['properties']['prop1'] = "{{ env('RESUME_TEST_VAR', 'default') }}"
+            flow.initialize(utils.COMPONENT_DIR)
+            flow.validate()
+            return flow
+
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint, journal_dir=journal_dir)
+        self.nifi.fail = lambda method, endpoint: 400 if endpoint.endswith('/connections') else None
+        self.assertRaises(Exception, flowlib.nifi.rest.deploy_flow, load_flow(), config)
+
+        # the processors which were already created were rendered with the previous value
+        self.nifi.fail = None
+        os.environ['RESUME_TEST_VAR'] = 'value'
+        self.assertRaisesRegex(FlowLibException, ".*has changed since the deployment failed.*",
+            flowlib.nifi.rest.deploy_flow, load_flow(), config, resume=True)
+
+    def _flow_groups(self, name):
+        return sorted(g['component']['name'] for g in self.nifi.find('process_group') if g['component']['name'].endswith(name))
+
+    def _controller_states(self, group_name):
+        group = self.nifi.find('process_group', group_name)[0]
+        return [c['component']['state'] for c in self.nifi.find('controller_service') if c['component']['parentGroupId'] == group['id']]
+
+    def test_keep_previous_deploy_flow(self):
+        self._deploy()
+        flow_id = self.nifi.find('process_group', 'test-flow')[0]['id']
+        writes = self._writes()
+        operations, _ = self._plan(force=True, keep_previous=1)
+        flow, _ = self._deploy(force=True, keep_previous=1)
+        # every planned operation is made by the deployment
+        self.assertEqual(len(operations), self._writes() - writes)
+        self.assertEqual(self._flow_groups('test-flow'), ['(previous-1) test-flow', 'test-flow'])
+        self.assertEqual(self.nifi.find('process_group', '(previous-1) test-flow')[0]['id'], flow_id)
+        self.assertEqual(self._controller_states('(previous-1) test-flow'), ['DISABLED'])
+        self.assertEqual(self._controller_states('test-flow'), ['ENABLED'])
+        # the queues of the kept flow are not dropped
+        self.assertEqual(self.nifi.calls['POST /nifi-api/flowfile-queues/{id}/drop-requests'], 0)
+
+        # only keep_previous flows are kept
+        writes = self._writes()
+        operations, _ = self._plan(force=True, keep_previous=1)
+        self._deploy(force=True, keep_previous=1)
+        self.assertEqual(len(operations), self._writes() - writes)
+        self.assertEqual(self._flow_groups('test-flow'), ['(previous-1) test-flow', 'test-flow'])
+        self.assertEqual(len(self.nifi.find('processor')), 4)
+
+    def test_rollback_flow(self):
+        self._deploy()
+        flow_id = self.nifi.find('process_group', 'test-flow')[0]['id']
+        self.assertRaisesRegex(FlowLibException, "^No previous deployment of test-flow was kept.*",
+            flowlib.nifi.rest.rollback_flow, FlowLibConfig(nifi_endpoint=self.nifi.endpoint), 'test-flow')
+
+        self._deploy(force=True, keep_previous=2)
+        new_id = self.nifi.find('process_group', 'test-flow')[0]['id']
+        flowlib.nifi.rest.nipyapi.canvas.schedule_process_group(new_id, True)
+        posts = sum(v for k, v in self.nifi.calls.items() if k.startswith('POST'))
+
+        flowlib.nifi.rest.rollback_flow(FlowLibConfig(nifi_endpoint=self.nifi.endpoint), 'test-flow')
+        # nothing is created, the flows are swapped
+        self.assertEqual(sum(v for k, v in self.nifi.calls.items() if k.startswith('POST')), posts)
+        self.assertEqual(self.nifi.find('process_group', 'test-flow')[0]['id'], flow_id)
+        self.assertEqual(self.nifi.find('process_group', '(previous-1) test-flow')[0]['id'], new_id)
+        self.assertEqual(self._controller_states('test-flow'), ['ENABLED'])
+        self.assertEqual(self._controller_states('(previous-1) test-flow'), ['DISABLED'])
+        # the restored flow is started since the rolled back flow was running
+        group = [g for g in self.nifi.find('process_group') if g['component']['name'].startswith('test-process-group/' + flow_id)][0]
+        processors = [p for p in self.nifi.find('processor') if p['component']['parentGroupId'] in (flow_id, group['id'])]
+        self.assertEqual(set(p['component']['state'] for p in processors), {'RUNNING'})
+
+        # rolling back again restores the rolled back flow
+        flowlib.nifi.rest.rollback_flow(FlowLibConfig(nifi_endpoint=self.nifi.endpoint), 'test-flow')
+        self.assertEqual(self.nifi.find('process_group', 'test-flow')[0]['id'], new_id)
+        deployment = flowlib.nifi.rest.get_previous_deployment(self.nifi.endpoint, 'test-flow')
+        self.assertEqual(deployment.root_group_id, new_id)
+
+    def test_failed_rollback_flow(self):
+        self.nifi.stateful_types = ['org.apache.nifi.processors.standard.DebugFlow']
+        self._deploy()
+        flow_id = self.nifi.find('process_group', 'test-flow')[0]['id']
+        self._deploy(force=True, keep_previous=1)
+        new_id = self.nifi.find('process_group', 'test-flow')[0]['id']
+        flowlib.nifi.rest.nipyapi.canvas.schedule_process_group(new_id, True)
+        for p in self.nifi.find('processor'):
+            self.nifi.states[p['id']] = {'key': 'value'}
+
+        # the stateful processors of the restored flow can't be migrated to, the zookeeper connection is invalid
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint, zookeeper_connection='localhost:invalid-port')
+        self.assertRaises(ValueError, flowlib.nifi.rest.rollback_flow, config, 'test-flow')
+        # the deployed flow is left running under its name, the previous flow is still kept
+        self.assertEqual(self.nifi.find('process_group', 'test-flow')[0]['id'], new_id)
+        self.assertEqual(self.nifi.find('process_group', '(previous-1) test-flow')[0]['id'], flow_id)
+        self.assertEqual(self._controller_states('test-flow'), ['ENABLED'])
+        self.assertEqual(self._controller_states('(previous-1) test-flow'), ['DISABLED'])
+        states = {p['component']['parentGroupId']: p['component']['state'] for p in self.nifi.find('processor')}
+        self.assertEqual(states[new_id], 'RUNNING')
+        self.assertEqual(states[flow_id], 'STOPPED')
+
+    def test_generate_docs(self):
+        config = FlowLibConfig(nifi_endpoint=self.nifi.endpoint)
+        with tempfile.TemporaryDirectory() as dest:
+            flowlib.nifi.docs.generate_docs(config, os.path.join(dest, 'docs'))
+            self.assertTrue(os.path.exists(os.path.join(dest, 'docs', 'processors', 'org.apache.nifi.processors.standard.DebugFlow.yaml')))
+        # the temporary components are removed
+        self.assertEqual(self.nifi.find('processor'), list())
+        self.assertEqual(self.nifi.find('controller_service'), list())
+
+
+class TestFakeNiFi(unittest.TestCase):
+
+    def test_latency(self):
+        with FakeNiFi(latency=lambda method, endpoint: 0.02 if method == 'POST' else 0) as nifi:
+            self.assertEqual(flowlib.nifi.rest.wait_for_nifi_api(nifi.endpoint), None)
+            start = time.perf_counter()
+            self._deploy(nifi)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.02 * sum(v for k, v in nifi.calls.items() if k.startswith('POST')))
+
+    def test_not_found(self):
+        with FakeNiFi() as nifi:
+            self._deploy(nifi)
+            calls = nifi.calls['GET /nifi-api/{entities}/{id}']
+            self.assertRaisesRegex(Exception, "404", flowlib.nifi.rest.nipyapi.nifi.ProcessorsApi().get_processor, 'not-real')
+            self.assertEqual(nifi.calls['GET /nifi-api/{entities}/{id}'], calls + 1)
+
+    def test_stale_revision(self):
+        with FakeNiFi() as nifi:
+            self._deploy(nifi)
+            api = flowlib.nifi.rest.nipyapi.nifi.ProcessorsApi()
+            stale = api.get_processor(nifi.find('processor')[0]['id'])
+            stale.component.name = 'renamed'
+            processor = api.update_processor(stale.id, stale)
+            self.assertEqual(processor.revision.version, stale.revision.version + 1)
+
+            # updates and run status changes made with the old revision are rejected
+            self.assertRaisesRegex(Exception, "409", api.update_processor, stale.id, stale)
+            run_status = flowlib.nifi.rest.nipyapi.nifi.ProcessorRunStatusEntity(revision=stale.revision, state='RUNNING')
+            self.assertRaisesRegex(Exception, "409", api.update_run_status, stale.id, run_status)
+            self.assertEqual(nifi.find('processor', 'renamed')[0]['component']['state'], 'STOPPED')
+
+            run_status.revision = processor.revision
+            self.assertEqual(api.update_run_status(stale.id, run_status).component.state, 'RUNNING')
+
+    def test_registry(self):
+        with FakeNiFi() as nifi:
+            bucket_id = nifi.add_bucket('test-bucket')
+            flow_id = nifi.add_flow_version(bucket_id, 'registry-flow', {'identifier': 'contents', 'name': 'v1'})
+            nifi.add_flow_version(bucket_id, 'registry-flow', {'identifier': 'contents', 'name': 'v2'})
+            flowlib.nifi.rest.nipyapi.utils.set_endpoint(nifi.endpoint + '/nifi-registry-api')
+            snapshot = flowlib.nifi.rest.nipyapi.versioning.get_flow_version(bucket_id, flow_id)
+            self.assertEqual(snapshot.flow_contents.name, 'v2')
+            self.assertEqual(snapshot.snapshot_metadata.version, 2)
+            snapshot = flowlib.nifi.rest.nipyapi.versioning.get_flow_version(bucket_id, flow_id, version=1)
+            self.assertEqual(snapshot.flow_contents.name, 'v1')
+
+    def _deploy(self, nifi):
+        flow = utils.load_test_flow()
+        flow.validate()
+        flowlib.nifi.rest.deploy_flow(flow, FlowLibConfig(nifi_endpoint=nifi.endpoint))
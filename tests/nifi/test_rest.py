@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from flowlib.exceptions import FlowLibException
+from flowlib.nifi.rest import _deploy_executor, _run_concurrently
+
+
+class TestRunConcurrently(unittest.TestCase):
+
+    def test_serial(self):
+        self.assertIsNone(_deploy_executor(1))
+        self.assertIsNone(_deploy_executor(None))
+        self.assertEqual(_run_concurrently(None, lambda i: i * 2, [1, 2, 3]), [2, 4, 6])
+
+    def test_concurrent(self):
+        executor = _deploy_executor(4)
+        try:
+            self.assertEqual(_run_concurrently(executor, lambda i: i * 2, list(range(50))), [i * 2 for i in range(50)])
+        finally:
+            executor.shutdown()
+
+    def test_concurrent_exception(self):
+        def fn(i):
+            if i == 3:
+                raise FlowLibException("failed {}".format(i))
+            return i
+
+        executor = _deploy_executor(2)
+        try:
+            self.assertRaisesRegex(FlowLibException, "^failed 3$", _run_concurrently, executor, fn, list(range(10)))
+        finally:
+            executor.shutdown()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+import flowlib.parser
+from flowlib.exceptions import FlowLibException
+from flowlib.nifi.snapshot import compile_flow, controller_versioned_id
+
+from tests import utils
+
+BUNDLE = {'group': 'org.apache.nifi', 'artifact': 'nifi-standard-nar', 'version': '1.11.4'}
+BUNDLES = {
+    'org.apache.nifi.processors.standard.DebugFlow': BUNDLE,
+    'io.b23.test_controller_service': BUNDLE
+}
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def _compile(self, flow):
+        flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components,
+            controller_id=controller_versioned_id)
+        return compile_flow(flow, '(deploying) {}'.format(flow.name), BUNDLES)
+
+    def test_compile_flow(self):
+        flow = utils.load_test_flow()
+        flow.validate()
+        snapshot = self._compile(flow)
+        # the snapshot must be serializable for uploading
+        json.dumps(snapshot)
+
+        contents = snapshot['flowContents']
+        self.assertEqual(contents['name'], '(deploying) test-flow')
+        self.assertEqual([c['name'] for c in contents['controllerServices']], ['test-controller-service'])
+        self.assertEqual(len(contents['processors']), 1)
+        self.assertEqual(contents['processors'][0]['name'], 'debug/{}'.format(contents['identifier']))
+        self.assertEqual(contents['processors'][0]['schedulingStrategy'], 'TIMER_DRIVEN')
+        self.assertEqual(contents['processors'][0]['bundle'], BUNDLE)
+
+        pg = contents['processGroups'][0]
+        self.assertEqual(pg['name'], 'test-process-group/{}'.format(contents['identifier']))
+        self.assertEqual(pg['groupIdentifier'], contents['identifier'])
+        self.assertEqual(len(pg['inputPorts']), 1)
+        self.assertEqual(len(pg['outputPorts']), 1)
+        # controller lookups reference the controller service within the snapshot
+        controller_id = contents['controllerServices'][0]['identifier']
+        self.assertEqual(pg['processors'][0]['properties']['controller-lookup'], controller_id)
+
+        # connections are created in the group which contains them
+        self.assertEqual(len(pg['connections']), 2)
+        self.assertEqual(len(contents['connections']), 1)
+        c = contents['connections'][0]
+        self.assertEqual(c['source']['type'], 'OUTPUT_PORT')
+        self.assertEqual(c['source']['groupId'], pg['identifier'])
+        self.assertEqual(c['destination']['id'], contents['processors'][0]['identifier'])
+
+    def test_compile_flow_identifiers(self):
+        def identifiers(group):
+            ids = [group['identifier']]
+            for kind in ['processors', 'inputPorts', 'outputPorts', 'connections', 'controllerServices']:
+                ids.extend([c['identifier'] for c in group[kind]])
+            for pg in group['processGroups']:
+                ids.extend(identifiers(pg))
+            return ids
+
+        # the versioned ids of a flow are the same every time it is compiled
+        ids = identifiers(self._compile(utils.load_test_flow())['flowContents'])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, identifiers(self._compile(utils.load_test_flow())['flowContents']))
+
+    def test_compile_flow_invalid_type(self):
+        flow = utils.load_test_flow()
+        flowlib.parser.replace_flow_element_vars_recursive(flow, flow._elements, flow.components,
+            controller_id=controller_versioned_id)
+        self.assertRaisesRegex(FlowLibException, ".*is not a valid NiFi Processor or Controller Service type", compile_flow, flow, 'test-flow', dict())
+
+    def test_compile_flow_rpg(self):
+        flow = utils.load_test_flow(init=False)
+        flow.canvas.append({
+            'name': 'rpg',
+            'type': 'remote_process_group',
+            'config': {
+                'target_uris': 'http://localhost:8080/nifi'
+            }
+        })
+        flow.initialize(utils.COMPONENT_DIR)
+        self.assertRaisesRegex(FlowLibException, ".*cannot be deployed as part of a snapshot.*", self._compile, flow)
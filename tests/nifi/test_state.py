@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import unittest
 
-from flowlib.nifi.state import MAX_STATE_SIZE, ENCODING_VERSION, _serialize, _deserialize
+from kazoo.protocol.serialization import Create, SetData, Transaction
+from kazoo.security import CREATOR_ALL_ACL
+
+from flowlib.nifi.state import MAX_STATE_SIZE, ENCODING_VERSION, MULTI_REQUEST_SIZE, _serialize, _deserialize, _operation_size
 
 class TestZookeeperSerDe(unittest.TestCase):
 
@@ -29,3 +32,17 @@ class TestZookeeperSerDe(unittest.TestCase):
             1: 'invalid',
         }
         self.assertRaises(AssertionError, _serialize, state)
+
+
+class TestZookeeperTransaction(unittest.TestCase):
+
+    def test_operation_size(self):
+        value = _serialize({'key': 'value'}).getvalue()
+        create = '/nifi/components/0a1b2c3d-0000-1111-2222-333344445555'
+        update = '/nifi/components/0a1b2c3d-0000-1111-2222-666677778888'
+        # the request is the length, xid and type followed by the serialized transaction
+        request = 12 + len(Transaction([Create(create, value, CREATOR_ALL_ACL, 0), SetData(update, value, -1)]).serialize())
+        self.assertEqual(MULTI_REQUEST_SIZE + _operation_size(create, value, CREATOR_ALL_ACL) + _operation_size(update, value), request)
+        # the path and ACL of every operation count towards the max request size
+        self.assertGreater(_operation_size(create, value, CREATOR_ALL_ACL), _operation_size(update, value))
+        self.assertGreater(_operation_size(update, value), len(value) + len(update))
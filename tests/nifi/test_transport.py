@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import nipyapi
+
+import flowlib.nifi.transport
+from flowlib.model.config import FlowLibConfig
+from flowlib.nifi.transport import JitteredRetry, RETRY_STATUSES
+
+
+class TestTransport(unittest.TestCase):
+
+    def tearDown(self):
+        flowlib.nifi.transport.configure(FlowLibConfig())
+
+    def test_retry(self):
+        retry = JitteredRetry(total=3, backoff_factor=1, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+        # server errors are only retried for idempotent methods
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertFalse(retry.is_retry('POST', 500))
+        self.assertTrue(retry.is_retry('GET', 500))
+        self.assertTrue(retry.is_retry('PUT', 503))
+        self.assertFalse(retry.is_retry('GET', 404))
+        # resending a request with a stale revision would be rejected again
+        self.assertFalse(retry.is_retry('PUT', 409))
+
+        for method, status in [('POST', 503), ('POST', 500), ('GET', 500), ('PUT', 503), ('GET', 404), ('PUT', 409)]:
+            self.assertEqual(flowlib.nifi.transport.is_retry(method, status), retry.is_retry(method, status))
+
+    def test_retry_conflicts(self):
+        flowlib.nifi.transport.configure(FlowLibConfig(http_retries=2, http_backoff_factor=0))
+        calls = list()
+
+        def update(status):
+            calls.append(status)
+            if len(calls) < 3:
+                raise nipyapi.nifi.rest.ApiException(status=status)
+            return 'updated'
+        self.assertEqual(flowlib.nifi.transport.retry_conflicts(lambda: update(409)), 'updated')
+        self.assertEqual(len(calls), 3)
+
+        calls.clear()
+        with self.assertRaises(nipyapi.nifi.rest.ApiException):
+            flowlib.nifi.transport.retry_conflicts(lambda: update(400))
+        self.assertEqual(len(calls), 1)
+
+    def test_backoff(self):
+        for attempt in range(4):
+            self.assertTrue(0 <= flowlib.nifi.transport.backoff(0.5, attempt) <= 0.5 * 2 ** attempt)
+
+    def test_backoff_jitter(self):
+        retry = JitteredRetry(total=5, backoff_factor=1, status_forcelist=RETRY_STATUSES)
+        self.assertEqual(retry.get_backoff_time(), 0)
+        for _ in range(3):
+            retry = retry.increment('GET', '/flow/about')
+        self.assertIsInstance(retry, JitteredRetry)
+        for _ in range(20):
+            self.assertTrue(0 <= retry.get_backoff_time() <= 4)
+
+    def test_configure(self):
+        config = FlowLibConfig(http_pool_size=2, http_retries=5, http_read_timeout=30, deploy_concurrency=8)
+        flowlib.nifi.transport.configure(config)
+
+        api_config = nipyapi.config.nifi_config
+        api_client = flowlib.nifi.transport.install(api_config)
+        self.assertIs(api_config.api_client, api_client)
+        self.assertEqual(api_client.default_headers['Accept-Encoding'], 'gzip')
+
+        pool_kw = api_client.rest_client.pool_manager.connection_pool_kw
+        # the pool is never smaller than the deploy concurrency
+        self.assertEqual(pool_kw['maxsize'], 8)
+        self.assertTrue(pool_kw['block'])
+        self.assertEqual(pool_kw['retries'].total, 5)
+        self.assertEqual(pool_kw['timeout'].read_timeout, 30)
+
+        session = flowlib.nifi.transport.session()
+        self.assertIs(session, flowlib.nifi.transport.session())
+        self.assertEqual(session.get_adapter('http://localhost:8080').max_retries.total, 5)
+        self.assertEqual(flowlib.nifi.transport.timeout(), (10, 30))
+
+        # the transport is only replaced when the endpoint or the settings change
+        pool_manager = api_client.rest_client.pool_manager
+        self.assertIs(flowlib.nifi.transport.install(api_config).rest_client.pool_manager, pool_manager)
+        flowlib.nifi.transport.configure(FlowLibConfig(http_pool_size=2, http_retries=4))
+        self.assertIsNot(api_client.rest_client.pool_manager, pool_manager)
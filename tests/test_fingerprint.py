@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from flowlib.plan import diff_flows, element_path
+
+from tests import utils
+
+class TestFingerprint(unittest.TestCase):
+
+    def _load_flow(self, raw_fn=None):
+        flow = utils.load_test_flow(init=False)
+        if raw_fn:
+            raw_fn(flow)
+        flow.initialize(utils.COMPONENT_DIR)
+        return flow
+
+    def test_fingerprint_flow(self):
+        flow = self._load_flow()
+        self.assertEqual(len(flow.fingerprint), 32)
+        self.assertEqual(flow.fingerprints, self._load_flow().fingerprints)
+        # the flow and every element are fingerprinted
+        group = flow._elements['test-process-group']
+        paths = ['test-flow', 'test-flow/debug', 'test-flow/test-process-group'] + \
+            ['test-flow/test-process-group/{}'.format(name) for name in group._elements.keys()]
+        self.assertEqual(sorted(flow.fingerprints.keys()), sorted(paths))
+
+    def test_changed_processor(self):
+        def update(flow):
+            flow.canvas[1]['config']['properties']['prop1'] = 'new-value'
+
+        flow = self._load_flow()
+        updated = self._load_flow(update)
+        changed = [p for p in flow.fingerprints if flow.fingerprints[p] != updated.fingerprints[p]]
+        self.assertEqual(sorted(changed), ['test-flow', 'test-flow/debug'])
+
+    def test_changed_vars(self):
+        def update_vars(flow):
+            flow.canvas[0]['vars']['default_var2'] = 'new-value'
+
+        def update_globals(flow):
+            flow.global_vars['global_var'] = 'new-value'
+
+        flow = self._load_flow()
+        # the vars of a group change the fingerprints of the group and its processors, ports are not templated
+        updated = self._load_flow(update_vars)
+        changed = [p for p in flow.fingerprints if flow.fingerprints[p] != updated.fingerprints[p]]
+        self.assertEqual(sorted(changed), ['test-flow', 'test-flow/test-process-group', 'test-flow/test-process-group/debug'])
+
+        # global vars are available to every processor
+        updated = self._load_flow(update_globals)
+        changed = [p for p in flow.fingerprints if flow.fingerprints[p] != updated.fingerprints[p]]
+        self.assertEqual(sorted(changed), ['test-flow', 'test-flow/debug', 'test-flow/test-process-group', 'test-flow/test-process-group/debug'])
+
+    def test_changed_env(self):
+        def update(flow):
+            flow.canvas[1]['config']['properties']['prop1'] = "{{ env('FINGERPRINT_TEST_VAR', 'default') }}"
+
+        os.environ.pop('FINGERPRINT_TEST_VAR', None)
+        self.addCleanup(os.environ.pop, 'FINGERPRINT_TEST_VAR', None)
+        flow = self._load_flow(update)
+        os.environ['FINGERPRINT_TEST_VAR'] = 'value'
+        updated = self._load_flow(update)
+        # the env() lookups are resolved, a processor is rendered differently once the environment variable is set
+        changed = [p for p in flow.fingerprints if flow.fingerprints[p] != updated.fingerprints[p]]
+        self.assertEqual(sorted(changed), ['test-flow', 'test-flow/debug'])
+        self.assertEqual(updated.fingerprints, self._load_flow(update).fingerprints)
+
+    def test_diff_flows(self):
+        # the rendered properties of processors are compared even if their fingerprints are the same,
+        # they don't cover the ids of the controller services injected with controller()
+        previous = self._load_flow()
+        flow = self._load_flow()
+        self.assertTrue(diff_flows(previous, flow).is_empty())
+        flow._elements['debug'].config.properties['prop1'] = 'rendered-value'
+        self.assertEqual(flow.fingerprints, previous.fingerprints)
+        self.assertEqual([element_path(el) for _, el in diff_flows(previous, flow).updated], ['test-flow/debug'])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import flowlib.layout
+from flowlib.exceptions import FlowLibException, FlowValidationException
+from flowlib.model.flow import FlowElement
+
+from tests import utils
+
+
+def _elements(connections):
+    """
+    :param connections: The names of the elements each element connects to, keyed by element name
+    :type connections: dict(str:list(str))
+    """
+    elements = dict()
+    for name, dests in connections.items():
+        elements[name] = FlowElement.from_dict({
+            'name': name,
+            'type': 'processor',
+            '_parent_path': 'test-flow',
+            'config': {'package_id': 'org.apache.nifi.processors.standard.DebugFlow'},
+            'connections': [{'name': dest} for dest in dests]
+        })
+    return elements
+
+
+class TestLayeredLayout(unittest.TestCase):
+
+    def test_layered_layout(self):
+        elements = _elements({
+            'input': ['convert', 'failure'],
+            'convert': ['update', 'failure'],
+            'update': ['success', 'failure'],
+            'success': [],
+            'failure': []
+        })
+        positions = flowlib.layout.generate_layout(elements, 'layered')
+        self.assertEqual(set(positions), set(elements))
+        # every element is placed below the elements which connect to it
+        for el in elements.values():
+            for c in el.connections:
+                self.assertLess(positions[el.name][1], positions[c.name][1])
+        # no two elements overlap
+        self.assertEqual(len(set(positions.values())), len(elements))
+        # the layout is deterministic
+        self.assertEqual(positions, flowlib.layout.generate_layout(elements, 'layered'))
+
+    def test_layered_layout_chain(self):
+        elements = _elements({'a': ['b'], 'b': ['c'], 'c': []})
+        positions = flowlib.layout.generate_layout(elements, 'layered')
+        # a chain of elements is laid out in a straight line
+        self.assertEqual(positions, {
+            'a': flowlib.layout.TOP_LEVEL_PG_LOCATION,
+            'b': (300.0, 100.0 + flowlib.layout.LAYER_SPACING),
+            'c': (300.0, 100.0 + 2 * flowlib.layout.LAYER_SPACING)
+        })
+
+    def test_layered_layout_cycles(self):
+        elements = _elements({
+            'fetch': ['retry', 'fetch'],
+            'retry': ['fetch', 'outside-the-group'],
+            'other': []
+        })
+        positions = flowlib.layout.generate_layout(elements, 'layered')
+        self.assertEqual(set(positions), set(elements))
+        self.assertLess(positions['fetch'][1], positions['retry'][1])
+
+    def test_flow_layout(self):
+        flow = utils.load_test_flow()
+        positions = flowlib.layout.generate_flow_layout(flow)
+        for el in flow._elements.values():
+            self.assertIn('{}/{}'.format(flow.name, el.name), positions)
+
+    def test_invalid_layout(self):
+        with self.assertRaisesRegex(FlowLibException, "Unsupported Graph Layout Type: not-real"):
+            flowlib.layout.generate_layout(_elements({'a': []}), 'not-real')
+
+        flow = utils.load_test_flow(init=False)
+        flow.layout = 'not-real'
+        self.assertRaisesRegex(FlowValidationException, "^Invalid layout 'not-real'.*", flow.initialize, utils.COMPONENT_DIR)
+
+
+class TestLayoutCache(unittest.TestCase):
+
+    def test_fingerprint(self):
+        elements = _elements({'a': ['b'], 'b': []})
+        self.assertEqual(flowlib.layout.fingerprint(elements), flowlib.layout.fingerprint(_elements({'a': ['b'], 'b': []})))
+        self.assertNotEqual(flowlib.layout.fingerprint(elements), flowlib.layout.fingerprint(elements, 'spring'))
+        self.assertNotEqual(flowlib.layout.fingerprint(elements), flowlib.layout.fingerprint(_elements({'a': [], 'b': []})))
+
+    def test_previous_layouts(self):
+        elements = _elements({'a': ['b'], 'b': []})
+        key = flowlib.layout.fingerprint(elements)
+        # saved layouts are read back from json
+        cache = flowlib.layout.LayoutCache({key: {'a': [1.0, 2.0], 'b': [3.0, 4.0]}})
+        self.assertEqual(cache.get_layout(elements), {'a': (1.0, 2.0), 'b': (3.0, 4.0)})
+        self.assertEqual(list(cache.layouts), [key])
+
+        layout = cache.get_layout(_elements({'a': [], 'b': []}))
+        self.assertEqual(layout, flowlib.layout.generate_layout(_elements({'a': [], 'b': []})))
+        self.assertEqual(len(cache.layouts), 2)
+
+    def test_cache_dir(self):
+        elements = _elements({'a': ['b'], 'b': []})
+        with tempfile.TemporaryDirectory() as cache_dir:
+            layout = flowlib.layout.LayoutCache(cache_dir=cache_dir).get_layout(elements, 'spring')
+            self.assertEqual(os.listdir(cache_dir), ['{}.json'.format(flowlib.layout.fingerprint(elements, 'spring'))])
+            # spring layouts are random, so the same positions are only generated again if they were cached
+            self.assertEqual(flowlib.layout.LayoutCache(cache_dir=cache_dir).get_layout(elements, 'spring'), layout)
+
+    def test_process_pool(self):
+        groups = [_elements({'a': ['b'], 'b': []}), _elements({'a': ['b', 'c'], 'b': [], 'c': []}), _elements({'a': ['b'], 'b': []})]
+        cache = flowlib.layout.LayoutCache()
+        layouts = cache.get_layouts(groups, processes=2)
+        self.assertEqual(layouts, [flowlib.layout.generate_layout(elements) for elements in groups])
+        # identical groups are only laid out once
+        self.assertEqual(len(cache.layouts), 2)
+
+    def test_cached_flow_layout(self):
+        flow = utils.load_test_flow()
+        cache = flowlib.layout.LayoutCache()
+        positions = flowlib.layout.generate_flow_layout(flow, cache)
+        self.assertEqual(flowlib.layout.generate_flow_layout(flow, flowlib.layout.LayoutCache(cache.layouts)), positions)
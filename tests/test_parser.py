@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import copy
 import os
+import tempfile
 import unittest
 
+import flowlib.parser
 from flowlib.exceptions import FlowValidationException
 from flowlib.parser import init_flow, replace_flow_element_vars_recursive
 
@@ -118,3 +120,37 @@ class TestParser(unittest.TestCase):
         }
         flow.canvas.append(pg)
         self.assertRaisesRegex(FlowValidationException, "^Circular component reference found in.*", flow.initialize, utils.COMPONENT_DIR)
+
+    def test_render(self):
+        # literal values are returned the same way jinja renders them
+        for source in ['', 'plain', 'trailing\n', 'two\n\n', 'windows\r\nnewlines\r\n', 'a } b', '${nifi.expression}']:
+            self.assertEqual(flowlib.parser._render(source), flowlib.parser.env.from_string(source).render())
+        self.assertEqual(flowlib.parser._render('{{ a }}-{{ b }}', {'a': 1, 'b': 2}), '1-2')
+
+        # cached templates use the globals that are set when they are rendered
+        flowlib.parser._set_global_helpers({'c': 'first'}, lambda c: c)
+        self.assertEqual(flowlib.parser._render("{{ controller('c') }}"), 'first')
+        flowlib.parser._set_global_helpers({'c': 'second'}, lambda c: c)
+        self.assertEqual(flowlib.parser._render("{{ controller('c') }}"), 'second')
+        self.assertGreater(flowlib.parser._compile_cached.cache_info().hits, 0)
+
+    def test_component_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            flow = utils.load_test_flow(init=False)
+            flow.initialize(utils.COMPONENT_DIR, component_cache_dir=cache_dir)
+            cached = os.listdir(cache_dir)
+            self.assertEqual(len(cached), len(flow.components))
+
+            path = os.path.join(utils.COMPONENT_DIR, 'test-component.yaml')
+            raw = flowlib.parser._read_component_file(path)
+            self.assertEqual(flowlib.parser._read_component_file(path, cache_dir), raw)
+            self.assertEqual(sorted(os.listdir(cache_dir)), sorted(cached))
+
+            # unreadable cache entries are replaced
+            for name in cached:
+                with open(os.path.join(cache_dir, name), 'wb') as f:
+                    f.write(b'not a pickle')
+            cached_flow = utils.load_test_flow(init=False)
+            cached_flow.initialize(utils.COMPONENT_DIR, component_cache_dir=cache_dir)
+            self.assertEqual({k: c.raw for k, c in cached_flow.components.items()}, {k: c.raw for k, c in flow.components.items()})
+            self.assertEqual(flowlib.parser._read_component_file(path, cache_dir), raw)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from flowlib.fingerprint import fingerprint_configs
+from flowlib.plan import Operation, connection_key, deploy_operations, diff_flows, element_path, estimate_seconds, incremental_operations, plan_connections
+
+from tests import utils
+
+class TestPlan(unittest.TestCase):
+
+    def _load_flow(self, canvas_fn=None):
+        flow = utils.load_test_flow(init=False)
+        if canvas_fn:
+            canvas_fn(flow.canvas)
+        flow.initialize(utils.COMPONENT_DIR)
+        flow.validate()
+        return flow
+
+    def test_plan_connections(self):
+        flow = self._load_flow()
+        edges = sorted([(s.parent_path, s.name, d.parent_path, d.name) for s, d, c, group in plan_connections(flow)])
+        self.assertEqual(edges, [
+            ('test-flow/test-process-group', 'debug', 'test-flow/test-process-group', 'output'),
+            ('test-flow/test-process-group', 'input', 'test-flow/test-process-group', 'debug'),
+            ('test-flow/test-process-group', 'output', 'test-flow', 'debug')
+        ])
+        groups = sorted([element_path(group) for s, d, c, group in plan_connections(flow)])
+        self.assertEqual(groups, ['test-flow', 'test-flow/test-process-group', 'test-flow/test-process-group'])
+
+    def test_diff_unchanged(self):
+        plan = diff_flows(self._load_flow(), self._load_flow())
+        self.assertTrue(plan.is_empty())
+
+    def test_diff_updated_processor(self):
+        def update(canvas):
+            canvas[1]['config']['properties']['prop1'] = 'new-value'
+
+        plan = diff_flows(self._load_flow(), self._load_flow(update))
+        self.assertEqual([element_path(el) for _, el in plan.updated], ['test-flow/debug'])
+        self.assertEqual(plan.added, [])
+        self.assertEqual(plan.removed, [])
+        self.assertEqual(plan.connections_added, [])
+        self.assertEqual(plan.connections_removed, [])
+
+    def test_diff_added_element(self):
+        def add(canvas):
+            canvas[1]['connections'] = [{'name': 'debug-2', 'relationships': ['success']}]
+            canvas.append({
+                'name': 'debug-2',
+                'type': 'processor',
+                'config': {
+                    'package_id': 'org.apache.nifi.processors.standard.DebugFlow'
+                }
+            })
+
+        plan = diff_flows(self._load_flow(), self._load_flow(add))
+        self.assertEqual([element_path(el) for el in plan.added], ['test-flow/debug-2'])
+        self.assertEqual(plan.removed, [])
+        self.assertEqual(plan.updated, [])
+        self.assertEqual([(element_path(s), element_path(d)) for s, d, c, g in plan.connections_added], [('test-flow/debug', 'test-flow/debug-2')])
+        self.assertEqual(plan.connections_removed, [])
+
+    def test_diff_removed_process_group(self):
+        def remove(canvas):
+            canvas.pop(0)
+
+        plan = diff_flows(self._load_flow(), self._load_flow(remove))
+        self.assertEqual([element_path(el) for el in plan.removed], ['test-flow/test-process-group'])
+        self.assertEqual(plan.added, [])
+        # connections inside of the removed process group are deleted along with it
+        self.assertEqual([(element_path(s), element_path(d)) for s, d, c, g in plan.connections_removed],
+            [('test-flow/test-process-group/output', 'test-flow/debug')])
+        self.assertEqual(plan.connections_added, [])
+
+    def test_diff_replaced_processor(self):
+        def replace(canvas):
+            canvas[1]['config']['package_id'] = 'org.apache.nifi.processors.standard.LogAttribute'
+
+        plan = diff_flows(self._load_flow(), self._load_flow(replace))
+        self.assertEqual([element_path(el) for el in plan.removed], ['test-flow/debug'])
+        self.assertEqual([element_path(el) for el in plan.added], ['test-flow/debug'])
+        self.assertEqual(plan.updated, [])
+        self.assertEqual([(element_path(s), element_path(d)) for s, d, c, g in plan.connections_removed],
+            [('test-flow/test-process-group/output', 'test-flow/debug')])
+        self.assertEqual([(element_path(s), element_path(d)) for s, d, c, g in plan.connections_added],
+            [('test-flow/test-process-group/output', 'test-flow/debug')])
+
+    def test_diff_updated_connection(self):
+        def update(canvas):
+            canvas[0]['connections'][0]['back_pressure_object_threshold'] = 500
+
+        plan = diff_flows(self._load_flow(), self._load_flow(update))
+        # the connection is updated in place instead of being re-created
+        self.assertEqual([(element_path(s), element_path(d), c.back_pressure_object_threshold)
+            for _, (s, d, c, g) in plan.connections_updated], [('test-flow/test-process-group/output', 'test-flow/debug', 500)])
+        self.assertEqual(plan.connections_added, [])
+        self.assertEqual(plan.connections_removed, [])
+        self.assertFalse(plan.is_empty())
+
+    def test_connection_key(self):
+        def update(canvas):
+            canvas[0]['connections'][0]['flow_file_expiration'] = '1 hour'
+            canvas[0]['connections'][0]['load_balance_strategy'] = 'ROUND_ROBIN'
+
+        previous, flow = [plan_connections(f) for f in (self._load_flow(), self._load_flow(update))]
+        self.assertEqual(sorted(connection_key(c) for c in previous), sorted(connection_key(c) for c in flow))
+
+    def test_diff_deployed_configs(self):
+        def update(canvas):
+            canvas[1]['config']['properties']['prop1'] = 'new-value'
+
+        previous = self._load_flow()
+        deployed_configs = fingerprint_configs(previous)
+        self.assertEqual(sorted(deployed_configs), ['test-flow/debug', 'test-flow/test-process-group/debug'])
+        self.assertTrue(diff_flows(previous, self._load_flow(), deployed_configs).is_empty())
+
+        # the new flow is compared with the deployed configs rather than with the previous flow
+        changed = self._load_flow(update)
+        plan = diff_flows(changed, self._load_flow(update), fingerprint_configs(previous))
+        self.assertEqual([element_path(el) for _, el in plan.updated], ['test-flow/debug'])
+
+    def test_deploy_operations(self):
+        flow = self._load_flow()
+        ops = deploy_operations(flow)
+        self.assertEqual([op.phase for op in ops[:4]], ['controllers'] * 4)
+        # process groups are created before their elements
+        elements = [op.target for op in ops if op.phase == 'elements']
+        self.assertEqual(elements[:2], ['test-flow/test-process-group', 'test-flow/debug'])
+        self.assertEqual(len(elements), 5)
+        self.assertEqual(len([op for op in ops if op.phase == 'connections']), 3)
+        self.assertEqual([op.phase for op in ops if op.phase in ['state', 'remove']], [])
+        self.assertEqual(len(ops), 16)
+
+        ops = deploy_operations(flow, replaced=(['c1', 'c2'], ['test-controller-service']), top_level_groups=2,
+            migrated_states=3, snapshot=True, state_node='/nifi/components')
+        self.assertEqual(ops[0], Operation('elements', 'POST', '/process-groups/{id}/process-groups/upload', '(deploying) test-flow'))
+        self.assertIn(Operation('state', 'MULTI', '/nifi/components', '3 processors'), ops)
+        self.assertEqual([op.method for op in ops if op.phase == 'remove'], ['PUT', 'POST', 'DELETE', 'POST', 'DELETE', 'PUT', 'DELETE', 'DELETE'])
+        self.assertEqual(len([op for op in ops if op.phase == 'save']), 4)
+
+    def test_keep_previous_operations(self):
+        flow = self._load_flow()
+        retained = {1: None, 2: (['c1'], ['test-controller-service'])}
+        ops = deploy_operations(flow, replaced=(['c2'], ['test-controller-service']), keep_previous=2, retained=retained)
+        self.assertEqual([(op.method, op.endpoint, op.target) for op in ops if op.phase == 'remove'], [
+            # the oldest kept flow is removed, the others are renamed
+            ('PUT', '/flow/process-groups/{id}', '(previous-2) test-flow'),
+            ('POST', '/flowfile-queues/{id}/drop-requests', 'c1'),
+            ('DELETE', '/connections/{id}', 'c1'),
+            ('PUT', '/controller-services/{id}/run-status', 'test-controller-service'),
+            ('DELETE', '/controller-services/{id}', 'test-controller-service'),
+            ('DELETE', '/process-groups/{id}', '(previous-2) test-flow'),
+            ('PUT', '/process-groups/{id}', '(previous-1) test-flow'),
+            # the replaced flow is stopped and kept, its queues are not dropped
+            ('PUT', '/flow/process-groups/{id}', 'test-flow'),
+            ('PUT', '/controller-services/{id}/run-status', 'test-controller-service'),
+            ('PUT', '/process-groups/{id}', 'test-flow')
+        ])
+
+    def test_incremental_operations(self):
+        def replace(canvas):
+            canvas[1]['config']['package_id'] = 'org.apache.nifi.processors.standard.LogAttribute'
+
+        flow = self._load_flow(replace)
+        plan = diff_flows(self._load_flow(), flow)
+        source = plan.connections_removed[0][0]
+        ops = incremental_operations(flow, plan, stopped=[source] + plan.removed)
+        self.assertEqual([(op.phase, op.method, op.target) for op in ops], [
+            ('stop', 'PUT', 'test-flow'),
+            ('stop', 'PUT', 'test-flow/test-process-group'),
+            ('remove', 'POST', 'test-flow/test-process-group/output -> test-flow/debug'),
+            ('remove', 'DELETE', 'test-flow/test-process-group/output -> test-flow/debug'),
+            ('remove', 'DELETE', 'test-flow/debug'),
+            ('elements', 'POST', 'test-flow/debug'),
+            ('connections', 'POST', 'test-flow/test-process-group/output -> test-flow/debug'),
+            # the removed processor is not started again
+            ('start', 'PUT', 'test-flow/test-process-group'),
+            ('save', 'PUT', 'test-flow')
+        ])
+
+        def update(canvas):
+            canvas[0]['connections'][0]['prioritizers'] = ['org.apache.nifi.prioritizer.FirstInFirstOutPrioritizer']
+
+        flow = self._load_flow(update)
+        ops = incremental_operations(flow, diff_flows(self._load_flow(), flow))
+        self.assertEqual([(op.phase, op.method, op.target) for op in ops], [
+            ('update', 'PUT', 'test-flow/test-process-group/output -> test-flow/debug'),
+            ('save', 'PUT', 'test-flow')
+        ])
+
+        ops = incremental_operations(flow, diff_flows(flow, flow))
+        self.assertEqual(ops, [Operation('save', 'PUT', '/process-groups/{id}', 'test-flow')])
+
+    def test_estimate_seconds(self):
+        ops = [
+            Operation('controllers', 'POST', '/process-groups/{id}/process-groups', 'a'),
+            Operation('elements', 'POST', '/process-groups/{id}/processors', 'b'),
+            Operation('elements', 'POST', '/process-groups/{id}/processors', 'c'),
+        ]
+        latencies = {('POST', '/process-groups/{id}/processors'): 0.5}
+        self.assertAlmostEqual(estimate_seconds(ops, latencies, 0.1), 1.1)
+        # elements are created concurrently
+        self.assertAlmostEqual(estimate_seconds(ops, latencies, 0.1, concurrency=2), 0.6)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import unittest
+
+import flowlib.nifi.rest
+import flowlib.profile
+from flowlib.model.config import FlowLibConfig
+
+from tests import utils
+from tests.fake_nifi import FakeNiFi
+
+class TestProfiler(unittest.TestCase):
+
+    def test_record(self):
+        profiler = flowlib.profile.Profiler()
+        with profiler.phase('elements'):
+            profiler.record('nifi', 'GET', '/nifi-api/processors/0a1b2c3d-0000-1111-2222-333344445555/state?x=1', 200, 0.0, 0.5, 0, 10)
+        profiler.record('registry', 'GET', 'http://host:18080/nifi-registry-api/buckets', 200, 1.0, 0.25)
+
+        self.assertEqual([c['endpoint'] for c in profiler.calls], ['/processors/{id}/state', '/buckets'])
+        self.assertEqual(profiler.calls[0]['path'], '/processors/0a1b2c3d-0000-1111-2222-333344445555/state')
+        self.assertEqual([c['phase'] for c in profiler.calls], ['elements', None])
+        self.assertEqual([p['name'] for p in profiler.phases], ['elements'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(flowlib.profile._percentile(values, 50), 50)
+        self.assertEqual(flowlib.profile._percentile(values, 95), 95)
+        self.assertEqual(flowlib.profile._percentile(values, 99), 99)
+        self.assertEqual(flowlib.profile._percentile([7], 99), 7)
+
+    def test_call(self):
+        # nothing is recorded unless profiling is enabled
+        with flowlib.profile.call('zookeeper', 'GET', '/nifi/components') as call:
+            call['bytes_received'] = 1
+        self.assertIsNone(flowlib.profile.profiler())
+
+        profiler = flowlib.profile.enable()
+        try:
+            with flowlib.profile.call('zookeeper', 'GET', '/nifi/components') as call:
+                call['bytes_received'] = 10
+            with self.assertRaises(KeyError):
+                with flowlib.profile.call('zookeeper', 'MULTI', '/nifi/components', 5):
+                    raise KeyError()
+        finally:
+            self.assertIs(flowlib.profile.disable(), profiler)
+        self.assertEqual([(c['method'], c['status'], c['bytes_sent'], c['bytes_received']) for c in profiler.calls],
+            [('GET', 'ok', 0, 10), ('MULTI', 'KeyError', 5, 0)])
+
+
+class TestProfileDeploy(unittest.TestCase):
+
+    def test_deploy_flow(self):
+        flow = utils.load_test_flow()
+        flow.validate()
+        profiler = flowlib.profile.enable()
+        try:
+            with FakeNiFi() as nifi:
+                flowlib.nifi.rest.deploy_flow(flow, FlowLibConfig(nifi_endpoint=nifi.endpoint))
+        finally:
+            flowlib.profile.disable()
+
+        # every api call is recorded, the health checks are made without the api client
+        self.assertEqual(len(profiler.calls), sum(nifi.calls.values()) - nifi.calls['GET /nifi'])
+        self.assertEqual(set(c['status'] for c in profiler.calls), {200})
+        self.assertTrue(all(c['bytes_received'] > 0 for c in profiler.calls))
+        processors = [c for c in profiler.calls if c['method'] == 'POST' and c['endpoint'] == '/process-groups/{id}/processors']
+        self.assertEqual(len(processors), 2)
+        self.assertEqual(set(c['phase'] for c in processors), {'elements'})
+        self.assertEqual([p['name'] for p in profiler.phases],
+            ['prepare', 'layout', 'controllers', 'elements', 'state', 'connections', 'enable', 'save'])
+
+        summary = profiler.summary()
+        self.assertIn('POST /process-groups/{id}/processors', summary)
+        for header in ['p50 ms', 'p95 ms', 'p99 ms', 'Slowest calls', 'Phase']:
+            self.assertIn(header, summary)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'trace.json')
+            profiler.write_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        self.assertEqual(len(trace['traceEvents']), len(profiler.calls) + len(profiler.phases))
+        self.assertEqual(set(e['ph'] for e in trace['traceEvents']), {'X'})